@@ -0,0 +1,360 @@
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections import deque
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+import instrumentation, metrics, views
+from dependencies import current_user, require_admin
+
+# Допуск тяжёлых запросов (/view/..., аналитика, вложенные ответы) по ролям: у каждой
+# роли свой предел одновременных запросов и свой предел на пользователя, чтобы
+# десять вкладок одного организатора не занимали весь пул соединений, пока клиенты
+# бронируют. Сверх предела запрос недолго ждёт в очереди, затем получает 429 (предел
+# пользователя или бюджет роли) или 503 (предел роли) с Retry-After.
+# Бюджет времени БД роли - ведро токенов: пополняется на db_seconds_per_second
+# секунд в секунду до db_burst_seconds и списывается на измеренное время запросов.
+# Пределы живут в памяти воркера и меняются через PATCH /admin/admission.
+
+HEAVY_PATHS = re.compile(r"^/(view/|api/analytics/|api/races/|api/clients/)")
+
+LIMITS = {
+    "Клиент": {
+        "concurrency": 8, "per_user": 2, "queue": 16, "wait_ms": 500,
+        "db_seconds_per_second": 4.0, "db_burst_seconds": 20.0,
+    },
+    "Организатор": {
+        "concurrency": 4, "per_user": 2, "queue": 8, "wait_ms": 500,
+        "db_seconds_per_second": 2.0, "db_burst_seconds": 10.0,
+    },
+    "Технический персонал": {
+        "concurrency": 3, "per_user": 2, "queue": 8, "wait_ms": 500,
+        "db_seconds_per_second": 1.0, "db_burst_seconds": 5.0,
+    },
+}
+# Пределы-счётчики мест и очереди задаются целыми числами
+INTEGER_LIMITS = {"concurrency", "per_user", "queue"}
+# Переопределение при старте: ADMISSION_LIMITS='{"Организатор": {"concurrency": 6}}'
+for _role, _overrides in json.loads(os.getenv("ADMISSION_LIMITS", "{}")).items():
+    LIMITS.setdefault(_role, dict(LIMITS["Клиент"])).update(_overrides)
+
+# statement_timeout для чтения представлений (Postgres); 0 - без ограничения
+STATEMENT_TIMEOUT_MS = int(os.getenv("VIEW_STATEMENT_TIMEOUT_MS", "10000"))
+STATEMENT_TIMEOUTS = {}
+
+router = APIRouter(prefix="/admin/admission")
+
+in_flight_gauge = metrics.Gauge("admission_in_flight", "Heavy requests admitted and running")
+queued_gauge = metrics.Gauge("admission_queued", "Heavy requests waiting for admission")
+limit_gauge = metrics.Gauge("admission_limit", "Current admission limits per role")
+budget_gauge = metrics.Gauge("admission_db_budget_seconds", "DB time left in the role token bucket")
+timeout_gauge = metrics.Gauge("view_statement_timeout_ms", "statement_timeout applied to view reads")
+rejected = metrics.Counter("admission_rejected_total", "Heavy requests rejected by admission control")
+timeouts = metrics.Counter("view_statement_timeouts_total", "View reads cancelled by statement_timeout")
+charged = metrics.Counter("admission_db_seconds_total", "DB time charged to role budgets")
+wait_seconds = metrics.Histogram("admission_wait_seconds", "Time heavy requests waited for admission")
+
+
+class Gate:
+    # Счётчик занятых мест с очередью ожидающих; используется только из event loop
+
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+
+    async def acquire(self, limit: int, queue: int, wait: float) -> bool:
+        if self.active < limit and not self.waiters:
+            self.active += 1
+            return True
+        if len(self.waiters) >= queue or wait <= 0:
+            return False
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.append(future)
+        timer = loop.call_later(wait, self._expire, future)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Клиент ушёл, когда место уже было передано ему
+            if not future.cancelled() and future.result():
+                self.release(limit)
+            raise
+        finally:
+            timer.cancel()
+            if future in self.waiters:
+                self.waiters.remove(future)
+
+    def _expire(self, future):
+        if not future.done():
+            future.set_result(False)
+
+    def release(self, limit: int):
+        self.active -= 1
+        self.wake(limit)
+
+    def wake(self, limit: int):
+        # Освободившееся место передаётся первому ожидающему
+        while self.waiters and self.active < limit:
+            future = self.waiters.popleft()
+            if not future.done():
+                self.active += 1
+                future.set_result(True)
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and not self.waiters
+
+
+class TokenBucket:
+
+    def __init__(self, role: str):
+        self.role = role
+        self.tokens = LIMITS[role]["db_burst_seconds"]
+        self.updated = time.monotonic()
+
+    def available(self) -> float:
+        limits = LIMITS[self.role]
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * limits["db_seconds_per_second"], limits["db_burst_seconds"])
+        self.updated = now
+        return self.tokens
+
+    def charge(self, seconds: float):
+        # Списание после запроса: бюджет может уйти в минус, и роль ждёт, пока он восполнится
+        self.available()
+        self.tokens -= seconds
+
+    def retry_after(self) -> int:
+        rate = LIMITS[self.role]["db_seconds_per_second"]
+        return max(1, math.ceil(-self.available() / rate)) if rate > 0 else 60
+
+
+_roles = {}
+_users = {}
+_buckets = {}
+
+
+def _role_gate(role: str) -> Gate:
+    gate = _roles.get(role)
+    if gate is None:
+        gate = _roles[role] = Gate()
+        in_flight_gauge.set_function(lambda: gate.active, role=role)
+        queued_gauge.set_function(lambda: len(gate.waiters), role=role)
+    return gate
+
+
+def _bucket(role: str) -> TokenBucket:
+    bucket = _buckets.get(role)
+    if bucket is None:
+        bucket = _buckets[role] = TokenBucket(role)
+        budget_gauge.set_function(bucket.available, role=role)
+    return bucket
+
+
+def _register_limits(role: str):
+    for name in LIMITS[role]:
+        limit_gauge.set_function(lambda role=role, name=name: LIMITS[role][name], role=role, limit=name)
+
+
+for _role in LIMITS:
+    _role_gate(_role)
+    _bucket(_role)
+    _register_limits(_role)
+
+
+def statement_timeout(view_name: str) -> int:
+    return STATEMENT_TIMEOUTS.get(view_name, STATEMENT_TIMEOUT_MS)
+
+
+for _name in views.REGISTRY:
+    timeout_gauge.set_function(lambda _name=_name: statement_timeout(_name), view=_name)
+
+
+def view_session_info(view_name: str) -> dict:
+    # info сессии, читающей представление: SET LOCAL statement_timeout в начале транзакции
+    return {"statement_timeout": statement_timeout(view_name)}
+
+
+@event.listens_for(Session, "after_begin")
+def _after_begin(session, transaction, connection):
+    timeout = session.info.get("statement_timeout")
+    if timeout and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def timed_out(exc: DBAPIError) -> bool:
+    # query_canceled: statement_timeout сработал
+    return getattr(exc.orig, "pgcode", None) == "57014" or getattr(exc.orig, "sqlstate", None) == "57014"
+
+
+def timeout_error(view_name: str) -> HTTPException:
+    timeouts.inc(view=view_name)
+    return HTTPException(
+        status_code=503,
+        detail=f"Запрос к {view_name} выполнялся дольше {statement_timeout(view_name)} мс",
+        headers={"Retry-After": "5"},
+    )
+
+
+def guard_stream(chunks, view_name: str, marker):
+    # statement_timeout до первого фрагмента - ответ 503; после отправки заголовков
+    # статус уже не изменить, поэтому поток завершается явной пометкой об ошибке
+    sent = False
+    try:
+        for chunk in chunks:
+            sent = True
+            yield chunk
+    except DBAPIError as exc:
+        if not timed_out(exc):
+            raise
+        error = timeout_error(view_name)
+        if not sent:
+            raise error
+        yield marker
+
+
+async def aguard_stream(chunks, view_name: str, marker):
+    sent = False
+    try:
+        async for chunk in chunks:
+            sent = True
+            yield chunk
+    except DBAPIError as exc:
+        if not timed_out(exc):
+            raise
+        error = timeout_error(view_name)
+        if not sent:
+            raise error
+        yield marker
+
+
+def _reject(status: int, detail: str, retry_after: int, role: str, reason: str):
+    rejected.inc(role=role, reason=reason)
+    return JSONResponse({"detail": detail}, status_code=status, headers={"Retry-After": str(retry_after)})
+
+
+class AdmissionMiddleware:
+    # Ставится под SessionMiddleware: роль и пользователь берутся из сессии или токена.
+    # Место держится до конца потокового тела ответа
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not HEAVY_PATHS.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        try:
+            user = await current_user(Request(scope))
+        except HTTPException:
+            user = None
+        role = user and user.get("role")
+        if role not in LIMITS:
+            # Без входа маршрут сам ответит 401 или перенаправлением
+            await self.app(scope, receive, send)
+            return
+        limits = LIMITS[role]
+        bucket = _bucket(role)
+        if bucket.available() <= 0:
+            response = _reject(429, "Исчерпан бюджет времени БД для роли", bucket.retry_after(), role, "db_budget")
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        wait = limits["wait_ms"] / 1000
+        user_key = (role, user.get("id") or user.get("username"))
+        user_gate = _users.get(user_key)
+        if user_gate is None:
+            user_gate = _users[user_key] = Gate()
+        role_gate = _role_gate(role)
+        try:
+            if not await user_gate.acquire(limits["per_user"], limits["queue"], wait):
+                response = _reject(429, "Слишком много одновременных запросов", 1, role, "user_limit")
+                await response(scope, receive, send)
+                return
+            try:
+                if not await role_gate.acquire(limits["concurrency"], limits["queue"], wait - (time.perf_counter() - started)):
+                    response = _reject(503, "Сервис перегружен, попробуйте позже", 1, role, "role_limit")
+                    await response(scope, receive, send)
+                    return
+                wait_seconds.observe(time.perf_counter() - started, role=role)
+                timings = instrumentation.current()
+                spent = _db_seconds(timings)
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    role_gate.release(LIMITS[role]["concurrency"])
+                    seconds = _db_seconds(timings) - spent
+                    bucket.charge(seconds)
+                    charged.inc(seconds, role=role)
+            finally:
+                user_gate.release(LIMITS[role]["per_user"])
+        finally:
+            if user_gate.idle:
+                _users.pop(user_key, None)
+
+
+def _db_seconds(timings) -> float:
+    # Выполнение запросов и выборка строк по учёту instrumentation
+    return timings.phases["db"] + timings.phases["fetch"] if timings is not None else 0.0
+
+
+def _state() -> dict:
+    return {
+        "roles": {
+            role: {
+                **limits,
+                "in_flight": _role_gate(role).active,
+                "queued": len(_role_gate(role).waiters),
+                "db_budget_seconds": round(_bucket(role).available(), 3),
+            }
+            for role, limits in LIMITS.items()
+        },
+        "statement_timeout_ms": STATEMENT_TIMEOUT_MS,
+        "statement_timeouts": {name: statement_timeout(name) for name in views.REGISTRY},
+    }
+
+
+@router.get("")
+def get_limits(user: dict = Depends(require_admin)):
+    return _state()
+
+
+@router.patch("")
+async def update_limits(changes: dict, user: dict = Depends(require_admin)):
+    # {"roles": {роль: {предел: значение}}, "statement_timeout_ms": мс, "statement_timeouts": {представление: мс}}
+    global STATEMENT_TIMEOUT_MS
+    roles = changes.get("roles", {})
+    view_timeouts = changes.get("statement_timeouts", {})
+    for role, values in roles.items():
+        if role not in LIMITS:
+            raise HTTPException(status_code=400, detail=f"Неизвестная роль: {role}")
+        for name, value in values.items():
+            kinds = int if name in INTEGER_LIMITS else (int, float)
+            if name not in LIMITS[role] or isinstance(value, bool) or not isinstance(value, kinds) or value < 0:
+                raise HTTPException(status_code=400, detail=f"Недопустимый предел {name}={value!r}")
+    for name, value in view_timeouts.items():
+        if name not in views.REGISTRY or not isinstance(value, int) or value < 0:
+            raise HTTPException(status_code=400, detail=f"Недопустимый statement_timeout {name}={value!r}")
+    default = changes.get("statement_timeout_ms", STATEMENT_TIMEOUT_MS)
+    if not isinstance(default, int) or default < 0:
+        raise HTTPException(status_code=400, detail="statement_timeout_ms: целое число мс")
+
+    for role, values in roles.items():
+        LIMITS[role].update(values)
+        # Выросший предел сразу пропускает ожидающих
+        _role_gate(role).wake(LIMITS[role]["concurrency"])
+    for (role, _), gate in list(_users.items()):
+        if role in roles:
+            gate.wake(LIMITS[role]["per_user"])
+    STATEMENT_TIMEOUT_MS = default
+    STATEMENT_TIMEOUTS.update(view_timeouts)
+    return _state()
@@ -0,0 +1,401 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+import archive, cache, changes, database, metrics
+from dependencies import require_role
+
+# Аналитика по кругам: lap_time вместе с race_result держится в памяти колонками
+# NumPy (int32 id, миллисекунды, дни), метрики считаются векторно сразу по всем
+# кругам. Новые круги догружаются по водяному знаку lap_time_id; изменение уже
+# загруженных строк приводит к полной перезагрузке.
+
+REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "5"))
+# Каскадные удаления (клиент, заезд, карт) и круги, закоммиченные с id ниже водяного
+# знака, по lap_time не видны, поэтому полная перезагрузка ещё и по расписанию
+RELOAD_INTERVAL = float(os.getenv("ANALYTICS_RELOAD_INTERVAL", "3600"))
+CHUNK = 100000
+MAX_LIMIT = 1000
+
+COLUMNS = {
+    "lap_time_id": np.int32,
+    "result_id": np.int32,
+    "client_id": np.int32,
+    "race_id": np.int32,
+    "kart_id": np.int32,
+    "lap_number": np.int16,
+    "lap_ms": np.int32,
+    # Дата заезда в днях от 1970-01-01 и год (сезон)
+    "race_day": np.int32,
+    "season": np.int16,
+}
+
+router = APIRouter(prefix="/api/analytics")
+analysts = require_role("Организатор", "Технический персонал")
+
+refreshes = metrics.Counter("analytics_refreshes_total", "Lap analytics column refreshes")
+refresh_seconds = metrics.Histogram("analytics_refresh_seconds", "Lap analytics refresh duration")
+
+results = cache.TTLCache(256, RELOAD_INTERVAL)
+
+
+def _query(watermark: int):
+    return (
+        select(
+            database.LapTime.lap_time_id, database.LapTime.result_id, database.RaceResult.client_id,
+            database.RaceResult.race_id, database.RaceResult.kart_id, database.LapTime.lap_number,
+            database.LapTime.lap_time, database.RaceResult.race_datetime,
+        )
+        .join(database.RaceResult, database.RaceResult.result_id == database.LapTime.result_id)
+        .where(database.LapTime.lap_time_id > watermark)
+        .order_by(database.LapTime.lap_time_id)
+    )
+
+
+def _convert(rows) -> dict:
+    # Интервалы и даты переводятся в числа одним вызовом NumPy на колонку
+    lap_time_id, result_id, client_id, race_id, kart_id, lap_number, lap_time, race_datetime = zip(*rows)
+    days = np.array(race_datetime, dtype="datetime64[D]")
+    return {
+        "lap_time_id": np.array(lap_time_id, dtype=np.int32),
+        "result_id": np.array(result_id, dtype=np.int32),
+        "client_id": np.array(client_id, dtype=np.int32),
+        "race_id": np.array(race_id, dtype=np.int32),
+        "kart_id": np.array(kart_id, dtype=np.int32),
+        "lap_number": np.array(lap_number, dtype=np.int16),
+        "lap_ms": np.array(lap_time, dtype="timedelta64[ms]").astype(np.int32),
+        "race_day": days.astype(np.int32),
+        "season": (days.astype("datetime64[Y]").astype(np.int16) + 1970).astype(np.int16),
+    }
+
+
+def _append(columns: dict, length: int, chunk: dict):
+    # Запас ёмкости растёт вдвое; строки пишутся за пределы length, поэтому срезы
+    # уже выданных снимков не меняются
+    size = len(chunk["lap_time_id"])
+    capacity = len(columns["lap_time_id"])
+    if length + size > capacity:
+        capacity = max(length + size, capacity * 2, CHUNK)
+        grown = {}
+        for name, array in columns.items():
+            grown[name] = np.empty(capacity, dtype=array.dtype)
+            grown[name][:length] = array[:length]
+        columns = grown
+    for name, values in chunk.items():
+        columns[name][length:length + size] = values
+    return columns, length + size
+
+
+class Snapshot:
+
+    def __init__(self, columns: dict, length: int, maintenance: tuple, version: int):
+        self.columns = {name: array[:length] for name, array in columns.items()}
+        self.length = length
+        # Обслуживания (kart_id, день), отсортированные по карту и дате
+        self.maintenance = maintenance
+        self.version = version
+        self.refreshed_at = datetime.now()
+
+
+class LapStore:
+
+    def __init__(self):
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._length = 0
+        self._snapshot = None
+        self._version = 0
+        self._refreshed = 0.0
+        self._loaded = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+        self._archived = None
+        self.watermark = 0
+        self.max_result_id = 0
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    def invalidate(self):
+        self._stale = True
+
+    def _due(self) -> bool:
+        return self._stale or time.monotonic() - self._refreshed >= REFRESH_INTERVAL
+
+    def snapshot(self) -> Snapshot:
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._refresh()
+        elif self._due() and self._lock.acquire(blocking=False):
+            # Пока один поток догружает круги, остальные отвечают по предыдущему снимку
+            try:
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def _refresh(self):
+        started = time.perf_counter()
+        with database.engine.connect() as conn:
+            # Архивные круги идут перед горячими, без строк, которые ещё есть в БД; новый
+            # или возвращённый в БД сегмент требует полной перезагрузки
+            archived = archive.store.lap_columns(conn)
+            full = self._stale or time.monotonic() - self._loaded >= RELOAD_INTERVAL or archived is not self._archived
+            # Сбрасывается до чтения: commit во время загрузки снова пометит данные
+            self._stale = False
+            if full:
+                columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+                columns, length = _append(columns, 0, archived)
+                watermark = 0
+                self._archived = archived
+            else:
+                columns, length, watermark = self._columns, self._length, self.watermark
+            result = conn.execution_options(stream_results=True, yield_per=CHUNK).execute(_query(watermark))
+            for rows in result.partitions():
+                columns, length = _append(columns, length, _convert(rows))
+            maintenance = conn.execute(
+                select(database.Maintenance.kart_id, database.Maintenance.maintenance_date)
+                .order_by(database.Maintenance.kart_id, database.Maintenance.maintenance_date)
+            ).all()
+        if maintenance:
+            kart_ids, dates = zip(*maintenance)
+            maintenance = (np.array(kart_ids, dtype=np.int32), np.array(dates, dtype="datetime64[D]").astype(np.int32))
+        else:
+            maintenance = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+
+        loaded = 0 if full else self._length
+        if full:
+            self.watermark = self.max_result_id = 0
+        if length > loaded:
+            # Горячие круги упорядочены по id, но архивные могут иметь id больше них
+            self.watermark = max(self.watermark, int(columns["lap_time_id"][loaded:length].max()))
+            self.max_result_id = max(self.max_result_id, int(columns["result_id"][loaded:length].max()))
+        unchanged = (
+            not full and length == loaded and self._snapshot is not None
+            and all(np.array_equal(a, b) for a, b in zip(maintenance, self._snapshot.maintenance))
+        )
+        self._columns, self._length = columns, length
+        if not unchanged:
+            # Новая версия снимка сбрасывает закэшированные результаты метрик
+            self._version += 1
+            self._snapshot = Snapshot(columns, length, maintenance, self._version)
+        else:
+            self._snapshot.refreshed_at = datetime.now()
+        self._refreshed = time.monotonic()
+        if full:
+            self._loaded = self._refreshed
+        kind = "full" if full else "incremental"
+        refreshes.inc(kind=kind)
+        refresh_seconds.observe(time.perf_counter() - started, kind=kind)
+
+
+store = LapStore()
+
+
+@changes.subscribe
+def _on_commit(changed: dict):
+    # Новые круги (id выше водяного знака или ещё без id) подхватит догрузка;
+    # изменение загруженных кругов или результатов требует полной перезагрузки
+    laps = changed.get("lap_time", [])
+    race_results = changed.get("race_result", [])
+    if laps is None or race_results is None:
+        store.invalidate()
+        return
+    if any(row.get("lap_time_id") is not None and row["lap_time_id"] <= store.watermark for row in laps):
+        store.invalidate()
+        return
+    if any(row.get("result_id") is not None and row["result_id"] <= store.max_result_id for row in race_results):
+        store.invalidate()
+
+
+def _mask(snapshot: Snapshot, season: int):
+    if season is None:
+        return slice(None)
+    return snapshot.columns["season"] == season
+
+
+def _best_per_client(snapshot: Snapshot, season: int):
+    # id клиентов с кругами, их лучший круг и число кругов
+    mask = _mask(snapshot, season)
+    client = snapshot.columns["client_id"][mask]
+    lap_ms = snapshot.columns["lap_ms"][mask]
+    if not len(client):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    best = np.full(int(client.max()) + 1, np.iinfo(np.int32).max, dtype=np.int32)
+    np.minimum.at(best, client, lap_ms)
+    counts = np.bincount(client)
+    ids = np.flatnonzero(counts)
+    return ids, best[ids], counts[ids]
+
+
+def best_laps(snapshot: Snapshot, season: int = None, limit: int = 100) -> list:
+    ids, best, counts = _best_per_client(snapshot, season)
+    order = np.argsort(best, kind="stable")[:limit]
+    return [
+        {"client_id": int(ids[i]), "best_lap_ms": int(best[i]), "laps": int(counts[i])}
+        for i in order
+    ]
+
+
+def consistency(snapshot: Snapshot, season: int = None, min_laps: int = 10, limit: int = 100) -> list:
+    # Разброс времени круга по клиенту; меньше - стабильнее
+    mask = _mask(snapshot, season)
+    client = snapshot.columns["client_id"][mask]
+    if not len(client):
+        return []
+    lap_ms = snapshot.columns["lap_ms"][mask].astype(np.float64)
+    # Сдвиг на общее среднее убирает потерю точности в сумме квадратов
+    shift = lap_ms.mean()
+    centered = lap_ms - shift
+    counts = np.bincount(client)
+    sums = np.bincount(client, centered)
+    squares = np.bincount(client, centered * centered)
+    ids = np.flatnonzero(counts >= max(min_laps, 2))
+    n = counts[ids]
+    mean = sums[ids] / n
+    stddev = np.sqrt(np.maximum(squares[ids] / n - mean * mean, 0) * n / (n - 1))
+    mean += shift
+    order = np.argsort(stddev, kind="stable")[:limit]
+    return [
+        {
+            "client_id": int(ids[i]),
+            "laps": int(n[i]),
+            "mean_lap_ms": round(float(mean[i]), 1),
+            "stddev_ms": round(float(stddev[i]), 1),
+            "cv_percent": round(float(stddev[i] / mean[i] * 100), 2),
+        }
+        for i in order
+    ]
+
+
+def kart_degradation(snapshot: Snapshot, season: int = None, limit: int = 100) -> list:
+    # Темп круга относительно среднего по заезду (убирает трассу, погоду и состав) против
+    # дней с последнего обслуживания карта; наклон регрессии - потеря темпа в % за день.
+    # Круги до первого обслуживания карта не учитываются.
+    maintenance_kart, maintenance_day = snapshot.maintenance
+    mask = _mask(snapshot, season)
+    result_id = snapshot.columns["result_id"][mask]
+    if not len(result_id) or not len(maintenance_kart):
+        return []
+    # Карт, заезд и дата общие для всех кругов результата, поэтому по кругам считаются
+    # только суммы, а поиск обслуживания и регрессия идут по результатам
+    lap_ms = snapshot.columns["lap_ms"][mask]
+    laps = np.bincount(result_id)
+    ids = np.flatnonzero(laps)
+    result_ms = np.bincount(result_id, lap_ms)[ids]
+    attributes = {}
+    for name in ("kart_id", "race_id", "race_day"):
+        values = np.zeros(len(laps), dtype=np.int32)
+        values[result_id] = snapshot.columns[name][mask]
+        attributes[name] = values[ids]
+    kart, race, day = attributes["kart_id"], attributes["race_id"], attributes["race_day"]
+    laps = laps[ids]
+    race_mean = np.bincount(race, result_ms) / np.maximum(np.bincount(race, laps), 1)
+    # Сумма темпа кругов результата в процентах от среднего по заезду
+    pace = result_ms / race_mean[race] * 100
+
+    # Поиск последнего обслуживания по составному ключу (карт, день) одним searchsorted
+    maintenance_keys = (maintenance_kart.astype(np.int64) << 32) + maintenance_day
+    result_keys = (kart.astype(np.int64) << 32) + day
+    index = np.searchsorted(maintenance_keys, result_keys, side="right") - 1
+    valid = index >= 0
+    valid[valid] = maintenance_kart[index[valid]] == kart[valid]
+    if not valid.any():
+        return []
+    kart, pace, laps = kart[valid], pace[valid], laps[valid]
+    since = (day[valid] - maintenance_day[index[valid]]).astype(np.float64)
+
+    # Суммы для регрессии по кругам: x у всех кругов результата одинаковый
+    n = np.bincount(kart, laps)
+    sx = np.bincount(kart, since * laps)
+    sy = np.bincount(kart, pace)
+    sxy = np.bincount(kart, since * pace)
+    sxx = np.bincount(kart, since * since * laps)
+    denominator = n * sxx - sx * sx
+    ids = np.flatnonzero(denominator > 0)
+    slope = (n[ids] * sxy[ids] - sx[ids] * sy[ids]) / denominator[ids]
+    intercept = (sy[ids] - slope * sx[ids]) / n[ids]
+    last = np.searchsorted(maintenance_kart, ids, side="right") - 1
+    order = np.argsort(-slope, kind="stable")[:limit]
+    return [
+        {
+            "kart_id": int(ids[i]),
+            "laps": int(n[ids[i]]),
+            "pace_after_maintenance_percent": round(float(intercept[i]), 2),
+            "degradation_percent_per_day": round(float(slope[i]), 4),
+            "last_maintenance": str(np.datetime64(int(maintenance_day[last[i]]), "D")),
+        }
+        for i in order
+    ]
+
+
+def rankings(snapshot: Snapshot, season: int = None, client_id: int = None, limit: int = 100) -> dict:
+    # Перцентиль по лучшему кругу сезона: доля клиентов с лучшим кругом медленнее
+    if season is None and snapshot.length:
+        season = int(snapshot.columns["season"].max())
+    ids, best, counts = _best_per_client(snapshot, season)
+    ordered = np.sort(best)
+    slower = len(ordered) - np.searchsorted(ordered, best, side="right")
+    rank = np.searchsorted(ordered, best, side="left") + 1
+    percentile = slower / max(len(ordered) - 1, 1) * 100
+    if client_id is not None:
+        selected = np.flatnonzero(ids == client_id)
+        if not len(selected):
+            raise HTTPException(status_code=404, detail="Нет кругов клиента в этом сезоне")
+    else:
+        selected = np.argsort(best, kind="stable")[:limit]
+    return {
+        "season": season,
+        "clients": len(ids),
+        "rankings": [
+            {
+                "client_id": int(ids[i]),
+                "best_lap_ms": int(best[i]),
+                "laps": int(counts[i]),
+                "rank": int(rank[i]),
+                "percentile": round(float(percentile[i]), 2),
+            }
+            for i in selected
+        ],
+    }
+
+
+def _compute(function, **params):
+    snapshot = store.snapshot()
+    key = (snapshot.version, function.__name__, tuple(sorted(params.items())))
+    value = results.get(key)
+    if value is None:
+        value = function(snapshot, **params)
+        results.set(key, value)
+    return {"laps": snapshot.length, "refreshed_at": snapshot.refreshed_at, "data": value}
+
+
+def _limit(limit: int) -> int:
+    return max(1, min(limit, MAX_LIMIT))
+
+
+@router.get("/best_laps")
+async def get_best_laps(season: int = None, limit: int = 100, user: dict = Depends(analysts)):
+    return await run_in_threadpool(_compute, best_laps, season=season, limit=_limit(limit))
+
+
+@router.get("/consistency")
+async def get_consistency(season: int = None, min_laps: int = 10, limit: int = 100, user: dict = Depends(analysts)):
+    return await run_in_threadpool(_compute, consistency, season=season, min_laps=min_laps, limit=_limit(limit))
+
+
+@router.get("/kart_degradation")
+async def get_kart_degradation(season: int = None, limit: int = 100, user: dict = Depends(analysts)):
+    return await run_in_threadpool(_compute, kart_degradation, season=season, limit=_limit(limit))
+
+
+@router.get("/rankings")
+async def get_rankings(season: int = None, client_id: int = None, limit: int = 100, user: dict = Depends(analysts)):
+    return await run_in_threadpool(_compute, rankings, season=season, client_id=client_id, limit=_limit(limit))
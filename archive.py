@@ -0,0 +1,601 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+import database, repository
+
+# Холодный архив истории кругов: результаты заездов и круги старше горизонта переносятся
+# из race_result и lap_time в сегменты по месяцам в ARCHIVE_DIR. Сегмент - каталог
+# YYYY-MM с колонками в файлах .npy узких типов (int32/int16, время в секундах и
+# миллисекундах), которые читаются через mmap: в память попадают только нужные
+# страницы. Результаты в сегменте отсортированы по result_id, круги - по (result_id,
+# номер круга); порядок по клиенту и по заезду лежит рядом, поиск - searchsorted.
+# История клиента, ответ по заезду и аналитика кругов объединяют горячие строки с
+# архивом; строка, которая ещё есть в БД (перенос до commit), берётся из БД. Удаление
+# клиента, заезда или карта архив не затрагивает: его архивные результаты и круги не
+# показываются ни в ответах, ни в аналитике и отчётах, и не возвращаются в БД при restore.
+#
+#     python archive.py archive                 # всё старше ARCHIVE_HORIZON_DAYS
+#     python archive.py archive --before 2024-01-01 --vacuum
+#     python archive.py restore 2023-04 2023-05
+#     python archive.py status
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "365"))
+BATCH = 50000
+FORMAT = 1
+
+RESULT_COLUMNS = {
+    "result_id": np.int32,
+    "race_datetime": "datetime64[s]",
+    "race_position": np.int16,
+    "client_id": np.int32,
+    "race_id": np.int32,
+    "kart_id": np.int32,
+}
+LAP_COLUMNS = {
+    "lap_time_id": np.int32,
+    "result_id": np.int32,
+    "lap_number": np.int16,
+    "lap_ms": np.int32,
+}
+# race_position IS NULL
+NO_POSITION = -1
+# Ссылки архивных результатов на горячие таблицы
+RELATED = {
+    "client_id": database.Client.client_id,
+    "race_id": database.Race.race_id,
+    "kart_id": database.Kart.kart_id,
+}
+
+
+def _load(path: str):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Пустой массив не отображается в память
+        return np.load(path)
+
+
+class Segment:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.month = os.path.basename(path)
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.results = {name: _load(os.path.join(path, f"results.{name}.npy")) for name in RESULT_COLUMNS}
+        self.laps = {name: _load(os.path.join(path, f"laps.{name}.npy")) for name in LAP_COLUMNS}
+        self.order = {
+            name: _load(os.path.join(path, f"results.{name}.order.npy")) for name in ("client_id", "race_id")
+        }
+
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.path))
+
+    def results_for(self, column: str, value: int) -> list:
+        values, order = self.results[column], self.order[column]
+        start = np.searchsorted(values, value, side="left", sorter=order)
+        end = np.searchsorted(values, value, side="right", sorter=order)
+        lap_result = self.laps["result_id"]
+        rows = []
+        for i in np.sort(order[start:end]):
+            result_id = int(self.results["result_id"][i])
+            first, last = np.searchsorted(lap_result, [result_id, result_id + 1])
+            position = int(self.results["race_position"][i])
+            rows.append({
+                "result_id": result_id,
+                "race_datetime": self.results["race_datetime"][i].astype(datetime),
+                "race_position": None if position == NO_POSITION else position,
+                "client_id": int(self.results["client_id"][i]),
+                "race_id": int(self.results["race_id"][i]),
+                "kart_id": int(self.results["kart_id"][i]),
+                "lap_times": [
+                    {
+                        "lap_time_id": int(self.laps["lap_time_id"][j]),
+                        "result_id": result_id,
+                        "lap_time": timedelta(milliseconds=int(self.laps["lap_ms"][j])),
+                        "lap_number": int(self.laps["lap_number"][j]),
+                    }
+                    for j in range(first, last)
+                ],
+            })
+        return rows
+
+    def rows(self, kind: str, names: tuple, start: datetime = None, end: datetime = None, hot=None,
+             orphans: dict = None) -> list:
+        # Кортежи в формате строк из БД (None, datetime, timedelta); у кругов доступны и
+        # колонки их результата. Сегмент целиком вне [start, end) не читается, строки
+        # результатов из hot (они ещё в БД) и ссылающиеся на orphans пропускаются
+        month = np.datetime64(self.month, "M")
+        if (start is not None and month + 1 <= np.datetime64(start, "M")) or (end is not None and month >= np.datetime64(end)):
+            return []
+        columns = dict(self.results)
+        if kind == "laps":
+            index = np.searchsorted(self.results["result_id"], self.laps["result_id"])
+            columns = {name: values[index] for name, values in columns.items()}
+            columns.update(self.laps)
+        when = columns["race_datetime"]
+        mask = np.ones(len(when), dtype=bool)
+        if start is not None:
+            mask &= when >= np.datetime64(start, "s")
+        if end is not None:
+            mask &= when < np.datetime64(end, "s")
+        mask &= _keep(columns, hot, orphans)
+        values = []
+        for name in names:
+            if name == "lap_time":
+                values.append(columns["lap_ms"][mask].astype("timedelta64[ms]").tolist())
+            elif name == "race_position":
+                values.append([None if p == NO_POSITION else p for p in columns[name][mask].tolist()])
+            else:
+                values.append(columns[name][mask].tolist())
+        return list(zip(*values))
+
+    def lap_columns(self, hot=None, orphans: dict = None) -> dict:
+        # Колонки в формате analytics.COLUMNS: круги с атрибутами своего результата, без
+        # кругов результатов из hot и ссылающихся на orphans
+        index = np.searchsorted(self.results["result_id"], self.laps["result_id"])
+        days = self.results["race_datetime"].astype("datetime64[D]")[index]
+        columns = {
+            "lap_time_id": np.asarray(self.laps["lap_time_id"]),
+            "result_id": np.asarray(self.laps["result_id"]),
+            "client_id": self.results["client_id"][index],
+            "race_id": self.results["race_id"][index],
+            "kart_id": self.results["kart_id"][index],
+            "lap_number": np.asarray(self.laps["lap_number"]),
+            "lap_ms": np.asarray(self.laps["lap_ms"]),
+            "race_day": days.astype(np.int32),
+            "season": (days.astype("datetime64[Y]").astype(np.int16) + 1970).astype(np.int16),
+        }
+        keep = _keep(columns, hot, orphans)
+        if not keep.all():
+            columns = {name: values[keep] for name, values in columns.items()}
+        return columns
+
+
+def _keep(columns: dict, hot, orphans: dict) -> np.ndarray:
+    keep = np.ones(len(columns["result_id"]), dtype=bool)
+    if hot is not None and len(hot):
+        keep &= ~np.isin(columns["result_id"], hot)
+    for name, ids in (orphans or {}).items():
+        if len(ids):
+            keep &= ~np.isin(columns[name], ids)
+    return keep
+
+
+class ArchiveStore:
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._segments = {}
+        self._version = None
+        self._columns = None
+        self._lock = threading.Lock()
+
+    def segments(self) -> dict:
+        # Каталог перечитывается, когда меняется его mtime: сегмент появился, заменён или удалён
+        try:
+            version = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._segments = self._scan() if version is not None else {}
+                    self._version = version
+                    self._columns = None
+        return self._segments
+
+    def _scan(self) -> dict:
+        segments = {}
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.startswith(".") and os.path.exists(os.path.join(path, "manifest.json")):
+                segments[name] = Segment(path)
+        return segments
+
+    def results_for(self, column: str, value: int) -> list:
+        rows = []
+        for segment in self.segments().values():
+            rows.extend(segment.results_for(column, value))
+        return rows
+
+    def hot_ids(self, db) -> np.ndarray:
+        # result_id строк БД не новее последнего архивного месяца. Между _swap и commit
+        # переноса строки есть и в БД, и в сегменте; обычно здесь только результаты,
+        # дописанные задним числом
+        segments = self.segments()
+        if not segments:
+            return np.empty(0, dtype=np.int32)
+        end = _next_month(datetime.strptime(max(segments), "%Y-%m"))
+        ids = db.scalars(select(database.RaceResult.result_id).where(database.RaceResult.race_datetime < end)).all()
+        return np.sort(np.array(ids, dtype=np.int32))
+
+    def orphans(self, db) -> dict:
+        # {колонка: id}, на которые ссылаются архивные результаты, но которых уже нет в БД
+        segments = self.segments()
+        orphans = {}
+        for name, column in RELATED.items():
+            if not segments:
+                orphans[name] = np.empty(0, dtype=np.int32)
+                continue
+            referenced = np.unique(np.concatenate([segment.results[name] for segment in segments.values()]))
+            orphans[name] = np.setdiff1d(referenced, _existing(db, column, referenced), assume_unique=True)
+        return orphans
+
+    def lap_columns(self, db) -> dict:
+        # Тот же объект, пока не изменились ни сегменты, ни пересечение с БД, ни удалённые
+        # клиенты, заезды и карты
+        segments = self.segments()
+        hot, orphans = self.hot_ids(db), self.orphans(db)
+        cached = self._columns
+        if cached is not None and np.array_equal(cached[0], hot) and all(
+            np.array_equal(cached[1][name], ids) for name, ids in orphans.items()
+        ):
+            return cached[2]
+        parts = [segment.lap_columns(hot, orphans) for segment in segments.values()]
+        columns = {
+            name: np.concatenate([part[name] for part in parts]) if parts else np.empty(0, dtype=np.int32)
+            for name in ("lap_time_id", "result_id", "client_id", "race_id", "kart_id", "lap_number", "lap_ms",
+                         "race_day", "season")
+        }
+        self._columns = hot, orphans, columns
+        return columns
+
+    def rows(self, db, kind: str, names: tuple, start: datetime = None, end: datetime = None) -> list:
+        # Пачки по сегментам для отчётов, читающих race_result и lap_time; строки, которые
+        # ещё есть в БД, отчёт прочитает оттуда
+        hot, orphans = self.hot_ids(db), self.orphans(db)
+        batches = [segment.rows(kind, names, start, end, hot, orphans) for segment in self.segments().values()]
+        return [batch for batch in batches if batch]
+
+    def laps(self) -> int:
+        return sum(segment.manifest["laps"] for segment in self.segments().values())
+
+
+store = ArchiveStore(ARCHIVE_DIR)
+
+
+# --- Чтение с архивом ---
+
+def _merge_results(db, hot: list, archived: list, related: dict) -> list:
+    # Архивные результаты с объектами связей из горячих таблиц; горячая строка с тем же
+    # id (перенос, прерванный до commit) важнее архивной
+    seen = {result.result_id for result in hot}
+    loaded = {
+        name: repository_for.get_many(db, {row[f"{name}_id"] for row in archived})
+        for name, repository_for in related.items()
+    }
+    rows = []
+    for row in archived:
+        if row["result_id"] in seen or any(row[f"{name}_id"] not in loaded[name] for name in related):
+            continue
+        rows.append({**row, **{name: loaded[name][row[f"{name}_id"]] for name in related}})
+    return rows + list(hot)
+
+
+def _as_dict(obj) -> dict:
+    return {attr.key: getattr(obj, attr.key) for attr in obj.__mapper__.column_attrs}
+
+
+def client_history(db, client_id: int):
+    client = repository.clients.get(db, client_id, "client_history")
+    archived = store.results_for("client_id", client_id) if client is not None else []
+    if not archived:
+        return client
+    race_results = _merge_results(
+        db, client.race_results, archived, {"race": repository.races, "kart": repository.karts}
+    )
+    return {**_as_dict(client), "race_results": race_results, "bookings": client.bookings}
+
+
+def race_detail(db, race_id: int):
+    race = repository.races.get(db, race_id, "race_detail")
+    archived = store.results_for("race_id", race_id) if race is not None else []
+    if not archived:
+        return race
+    race_results = _merge_results(
+        db, race.race_results, archived, {"client": repository.clients, "kart": repository.karts}
+    )
+    return {**_as_dict(race), "race_results": race_results}
+
+
+# --- Перенос и возврат ---
+
+def _month_start(day) -> datetime:
+    return datetime(day.year, day.month, 1)
+
+
+def _next_month(start: datetime) -> datetime:
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def _read(db, statement, convert) -> dict:
+    parts = [convert(rows) for rows in db.execute(statement.execution_options(yield_per=BATCH)).partitions()]
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]} if parts else None
+
+
+def _result_arrays(rows) -> dict:
+    result_id, race_datetime, race_position, client_id, race_id, kart_id = zip(*rows)
+    return {
+        "result_id": np.array(result_id, dtype=np.int32),
+        "race_datetime": np.array(race_datetime, dtype="datetime64[s]"),
+        "race_position": np.array([NO_POSITION if p is None else p for p in race_position], dtype=np.int16),
+        "client_id": np.array(client_id, dtype=np.int32),
+        "race_id": np.array(race_id, dtype=np.int32),
+        "kart_id": np.array(kart_id, dtype=np.int32),
+    }
+
+
+def _lap_arrays(rows) -> dict:
+    lap_time_id, result_id, lap_number, lap_time = zip(*rows)
+    return {
+        "lap_time_id": np.array(lap_time_id, dtype=np.int32),
+        "result_id": np.array(result_id, dtype=np.int32),
+        "lap_number": np.array(lap_number, dtype=np.int16),
+        "lap_ms": np.array(lap_time, dtype="timedelta64[ms]").astype(np.int32),
+    }
+
+
+def _combine(new: dict, old: Segment, columns: dict, key: str, table: str) -> dict:
+    # Дописанные задним числом строки добавляются к существующему сегменту; при
+    # совпадении id остаётся строка из БД
+    if old is None:
+        return new
+    previous = getattr(old, table)
+    if new is None:
+        return {name: np.asarray(previous[name]) for name in columns}
+    combined = {name: np.concatenate([new[name], previous[name]]) for name in columns}
+    _, first = np.unique(combined[key], return_index=True)
+    return {name: values[first] for name, values in combined.items()}
+
+
+def _write_segment(month: str, results: dict, laps: dict) -> str:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    partial = os.path.join(ARCHIVE_DIR, f".{month}.{os.getpid()}.tmp")
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    files = {f"results.{name}.npy": values for name, values in results.items()}
+    files.update({f"laps.{name}.npy": values for name, values in laps.items()})
+    for name in ("client_id", "race_id"):
+        files[f"results.{name}.order.npy"] = np.argsort(results[name], kind="stable").astype(np.int32)
+    for name, values in files.items():
+        with open(os.path.join(partial, name), "wb") as f:
+            np.save(f, values)
+            f.flush()
+            os.fsync(f.fileno())
+    manifest = {
+        "format": FORMAT,
+        "month": month,
+        "results": int(len(results["result_id"])),
+        "laps": int(len(laps["lap_time_id"])),
+        "archived_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(partial, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    return partial
+
+
+def _swap(source: str, month: str):
+    # Новый каталог встаёт на место сегмента; возвращается прежний для отката
+    target = os.path.join(ARCHIVE_DIR, month)
+    previous = None
+    if os.path.exists(target):
+        previous = os.path.join(ARCHIVE_DIR, f".{month}.{os.getpid()}.old")
+        shutil.rmtree(previous, ignore_errors=True)
+        os.rename(target, previous)
+    if source is not None:
+        os.rename(source, target)
+    return previous
+
+
+def _unswap(month: str, previous: str):
+    target = os.path.join(ARCHIVE_DIR, month)
+    shutil.rmtree(target, ignore_errors=True)
+    if previous is not None:
+        os.rename(previous, target)
+
+
+def _delete_hot(db, result_ids):
+    ids = [int(id) for id in result_ids]
+    for start in range(0, len(ids), repository.CHUNK_SIZE):
+        chunk = ids[start:start + repository.CHUNK_SIZE]
+        db.execute(
+            delete(database.LapTime).where(database.LapTime.result_id.in_(chunk)),
+            execution_options={"synchronize_session": False},
+        )
+        db.execute(
+            delete(database.RaceResult).where(database.RaceResult.result_id.in_(chunk)),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def archive_month(db, start: datetime) -> tuple:
+    # (результатов, кругов) перенесено из горячих таблиц
+    month = f"{start:%Y-%m}"
+    RaceResult, LapTime = database.RaceResult, database.LapTime
+    in_month = (RaceResult.race_datetime >= start) & (RaceResult.race_datetime < _next_month(start))
+    # FOR UPDATE: круги к переносимым результатам не дописываются до commit
+    results = _read(db, select(
+        RaceResult.result_id, RaceResult.race_datetime, RaceResult.race_position,
+        RaceResult.client_id, RaceResult.race_id, RaceResult.kart_id,
+    ).where(in_month).order_by(RaceResult.result_id).with_for_update(), _result_arrays)
+    if results is None:
+        db.rollback()
+        return 0, 0
+    laps = _read(db, select(LapTime.lap_time_id, LapTime.result_id, LapTime.lap_number, LapTime.lap_time)
+                 .join(RaceResult, RaceResult.result_id == LapTime.result_id).where(in_month)
+                 .order_by(LapTime.result_id, LapTime.lap_number, LapTime.lap_time_id), _lap_arrays)
+    if laps is None:
+        laps = {name: np.empty(0, dtype=dtype) for name, dtype in LAP_COLUMNS.items()}
+    moved = len(results["result_id"]), len(laps["lap_time_id"])
+
+    existing = store.segments().get(month)
+    hot_ids = results["result_id"]
+    results = _combine(results, existing, RESULT_COLUMNS, "result_id", "results")
+    laps = _combine(laps, existing, LAP_COLUMNS, "lap_time_id", "laps")
+    order = np.lexsort((laps["lap_number"], laps["result_id"]))
+    laps = {name: values[order] for name, values in laps.items()}
+
+    # Сегмент ставится на место до commit: при сбое между ними строки есть и в БД, и в
+    # архиве (чтение берёт строку из БД, следующий перенос сольёт их), но не теряются
+    partial = _write_segment(month, results, laps)
+    previous = None
+    try:
+        _delete_hot(db, hot_ids)
+        previous = _swap(partial, month)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        if os.path.exists(partial):
+            shutil.rmtree(partial, ignore_errors=True)
+        else:
+            _unswap(month, previous)
+        raise
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+    return moved
+
+
+def archive(before: datetime) -> dict:
+    # Переносятся целые месяцы, закончившиеся до before
+    moved = {}
+    db = database.SessionLocal(info={"primary": True})
+    try:
+        oldest = db.execute(select(func.min(database.RaceResult.race_datetime))).scalar()
+        if oldest is None:
+            return moved
+        start = _month_start(oldest)
+        while _next_month(start) <= before:
+            counts = archive_month(db, start)
+            if counts[0]:
+                moved[f"{start:%Y-%m}"] = counts
+            start = _next_month(start)
+    finally:
+        db.close()
+    return moved
+
+
+def _existing(db, column, ids) -> list:
+    ids = np.unique(ids).tolist()
+    found = []
+    for start in range(0, len(ids), repository.CHUNK_SIZE):
+        found.extend(db.scalars(select(column).where(column.in_(ids[start:start + repository.CHUNK_SIZE]))))
+    return found
+
+
+def restore(month: str) -> tuple:
+    # (результатов, кругов, пропущено результатов без клиента, заезда или карта)
+    segment = store.segments().get(month)
+    if segment is None:
+        raise SystemExit(f"Сегмент {month} не найден")
+    results = {name: np.asarray(values) for name, values in segment.results.items()}
+    laps = {name: np.asarray(values) for name, values in segment.laps.items()}
+    db = database.SessionLocal(info={"primary": True})
+    try:
+        # Строки, уже вернувшиеся в БД (прерванный перенос), не вставляются повторно;
+        # результаты удалённых после переноса клиентов, заездов и картов не возвращаются
+        keep = ~np.isin(results["result_id"], _existing(db, database.RaceResult.result_id, results["result_id"]))
+        orphaned = ~_keep(results, None, {
+            name: np.setdiff1d(results[name], _existing(db, column, results[name])) for name, column in RELATED.items()
+        })
+        dropped = int((keep & orphaned).sum())
+        keep &= ~orphaned
+        result_rows = [
+            {
+                "result_id": int(result_id), "race_datetime": race_datetime.astype(datetime),
+                "race_position": None if position == NO_POSITION else int(position),
+                "client_id": int(client_id), "race_id": int(race_id), "kart_id": int(kart_id),
+            }
+            for result_id, race_datetime, position, client_id, race_id, kart_id in zip(
+                *(results[name][keep] for name in RESULT_COLUMNS)
+            )
+        ]
+        keep = np.isin(laps["result_id"], results["result_id"][keep])
+        lap_rows = [
+            {
+                "lap_time_id": int(lap_time_id), "result_id": int(result_id),
+                "lap_number": int(lap_number), "lap_time": timedelta(milliseconds=int(lap_ms)),
+            }
+            for lap_time_id, result_id, lap_number, lap_ms in zip(*(laps[name][keep] for name in LAP_COLUMNS))
+        ]
+        for model, rows in ((database.RaceResult, result_rows), (database.LapTime, lap_rows)):
+            for start in range(0, len(rows), BATCH):
+                db.execute(insert(model), rows[start:start + BATCH])
+        db.commit()
+    finally:
+        db.close()
+    # Строки снова в БД - сегмент больше не нужен
+    shutil.rmtree(_swap(None, month), ignore_errors=True)
+    return len(result_rows), len(lap_rows), dropped
+
+
+def vacuum():
+    # После массового удаления: Postgres возвращает место и перестраивает раздутые индексы
+    # без блокировки записи, SQLite пересобирает файл
+    engine = database.engine
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "postgresql":
+            for table in ("lap_time", "race_result"):
+                conn.exec_driver_sql(f"VACUUM ANALYZE {table}")
+                conn.exec_driver_sql(f"REINDEX TABLE CONCURRENTLY {table}")
+        elif engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("VACUUM")
+
+
+def status():
+    segments = store.segments()
+    for month, segment in segments.items():
+        manifest = segment.manifest
+        print(f"{month}  {manifest['results']:>9} результатов {manifest['laps']:>10} кругов "
+              f"{segment.size() / 2 ** 20:>9.1f} MB  {manifest['archived_at']}")
+    with database.engine.connect() as conn:
+        hot = {
+            model.__tablename__: conn.execute(select(func.count()).select_from(model)).scalar()
+            for model in (database.RaceResult, database.LapTime)
+        }
+    print(f"в архиве: {len(segments)} сегментов, {store.laps()} кругов; в БД: "
+          f"{hot['race_result']} результатов, {hot['lap_time']} кругов")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive_parser = commands.add_parser("archive", help="перенести месяцы старше горизонта в архив")
+    archive_parser.add_argument("--horizon-days", type=int, default=HORIZON_DAYS)
+    archive_parser.add_argument("--before", type=datetime.fromisoformat, help="граница вместо горизонта")
+    archive_parser.add_argument("--vacuum", action="store_true", help="VACUUM и REINDEX после переноса")
+    restore_parser = commands.add_parser("restore", help="вернуть месяцы из архива в БД")
+    restore_parser.add_argument("months", nargs="+", help="YYYY-MM")
+    commands.add_parser("status")
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        before = args.before or datetime.now() - timedelta(days=args.horizon_days)
+        moved = archive(before)
+        for month, (results, laps) in moved.items():
+            print(f"{month}: {results} результатов, {laps} кругов")
+        print(f"перенесено месяцев: {len(moved)}")
+        if args.vacuum and moved:
+            vacuum()
+    elif args.command == "restore":
+        for month in args.months:
+            results, laps, dropped = restore(month)
+            print(f"{month}: возвращено {results} результатов, {laps} кругов")
+            if dropped:
+                print(f"{month}: пропущено {dropped} результатов без клиента, заезда или карта")
+    else:
+        status()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,225 @@
-from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
-from database import User, get_db
-from fastapi.security import OAuth2PasswordBearer
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, Request, status
 from jose import JWTError, jwt
+from sqlalchemy import delete, select
+from starlette.concurrency import run_in_threadpool
+
+import cache, changes, database, metrics
+
+# Токены для API (киоски, хронометраж): в токене id и роль пользователя, запись
+# пользователя берётся из кэша, отозванные токены проверяются по копии списка отзывов
+# из БД, которая перечитывается раз в AUTH_DENYLIST_REFRESH секунд. В обычном случае
+# запрос с токеном не обращается к БД.
 
-SECRET_KEY = "secretkey"
+SECRET_KEY = os.getenv("JWT_SECRET", "secretkey")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("TOKEN_EXPIRE_MINUTES", "30"))
+USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "300"))
+DENYLIST_REFRESH = float(os.getenv("AUTH_DENYLIST_REFRESH", "5"))
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 credentials_exception = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
     detail="Could not validate credentials",
     headers={"WWW-Authenticate": "Bearer"},
 )
 
-def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
-    to_encode = data.copy()
-    
-    if expires_delta:
-        expire = datetime.now() + expires_delta
-    else:
-        expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+token_checks = metrics.Counter("auth_token_checks_total", "Bearer token checks by outcome")
+user_lookups = metrics.Counter("auth_user_lookups_total", "User records loaded from the database for token auth")
+
+user_cache = cache.TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+# Как у страниц представлений: запись, прочитанная до commit в users, в кэш не попадёт
+_users_generation = 0
+_users_lock = threading.Lock()
+
+
+def create_access_token(user, expires_delta: timedelta = None) -> str:
+    now = datetime.now(timezone.utc)
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    claims = {
+        "sub": str(user.id),
+        "role": user.role,
+        "jti": secrets.token_urlsafe(9),
+        "iat": int(now.timestamp()),
+        "exp": int(expire.timestamp()),
+    }
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+
+class Denylist:
+    # Отзывы лежат в БД, общей для всех процессов, и нужны только до истечения срока
+    # затронутых токенов; отзыв всех токенов пользователя - одна отметка времени вместо
+    # списка jti. Копия в памяти только пополняется из БД: отзыв не отменяется
+
+    def __init__(self):
+        self._tokens = {}
+        self._users = {}
+        self._lock = threading.Lock()
+        self._next_refresh = 0.0
+        self._next_prune = 0.0
+
+    def revoke(self, jti: str, expires_at: int):
+        self._save(database.RevokedToken(jti=jti, expires_at=expires_at))
+        with self._lock:
+            self._tokens[jti] = expires_at
+
+    def revoke_user(self, user_id: int):
+        # Токены, выданные до отзыва, истекут не позже чем через срок жизни токена
+        now = int(time.time())
+        expires_at = now + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        self._save(database.RevokedUser(user_id=user_id, revoked_at=now, expires_at=expires_at))
+        with self._lock:
+            self._users[user_id] = (now, expires_at)
+
+    def _save(self, row):
+        db = database.SessionLocal()
+        try:
+            db.merge(row)
+            now = time.time()
+            if now >= self._next_prune:
+                self._next_prune = now + 60
+                for model in (database.RevokedToken, database.RevokedUser):
+                    db.execute(delete(model).where(model.expires_at < now))
+            db.commit()
+        finally:
+            db.close()
+
+    def refresh_due(self) -> bool:
+        # Вызывается в цикле событий: перечитывать список идёт только один запрос
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return False
+        self._next_refresh = now + DENYLIST_REFRESH
+        return True
+
+    def refresh(self):
+        now = int(time.time())
+        RevokedToken, RevokedUser = database.RevokedToken, database.RevokedUser
+        db = database.SessionLocal(info={"primary": True})
+        try:
+            tokens = db.execute(
+                select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at >= now)
+            ).all()
+            users = db.execute(
+                select(RevokedUser.user_id, RevokedUser.revoked_at, RevokedUser.expires_at)
+                .where(RevokedUser.expires_at >= now)
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            self._tokens.update(tokens)
+            for user_id, revoked_at, expires_at in users:
+                previous = self._users.get(user_id)
+                if previous is None or previous[0] < revoked_at:
+                    self._users[user_id] = (revoked_at, expires_at)
+            self._prune(now)
+
+    def is_revoked(self, claims: dict) -> bool:
+        revoked = self._users.get(int(claims["sub"]))
+        if revoked is not None and claims.get("iat", 0) <= revoked[0]:
+            return True
+        return claims.get("jti") in self._tokens
+
+    def _prune(self, now: int):
+        for jti in [jti for jti, expires_at in self._tokens.items() if expires_at < now]:
+            del self._tokens[jti]
+        for user_id in [user_id for user_id, (_, expires_at) in self._users.items() if expires_at < now]:
+            del self._users[user_id]
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+denylist = Denylist()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
 
+def _load_user(user_id: int):
+    db = database.SessionLocal()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        user = db.get(database.User, user_id)
+        return None if user is None else {"id": user.id, "username": user.username, "role": user.role}
+    finally:
+        db.close()
+
+
+async def get_user(user_id: int):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    seen_generation = _users_generation
+    user = await run_in_threadpool(_load_user, user_id)
+    user_lookups.inc()
+    if user is not None:
+        with _users_lock:
+            if _users_generation == seen_generation:
+                user_cache.set(user_id, user)
+    return user
+
 
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
+@changes.subscribe
+def _on_commit(changed: dict):
+    global _users_generation
+    if "users" not in changed:
+        return
+    with _users_lock:
+        _users_generation += 1
+    rows = changed["users"]
+    if rows is None or any(row.get("id") is None for row in rows):
+        user_cache.clear()
+        return
+    for row in rows:
+        user_cache.pop(row["id"])
+
+
+def decode_token(token: str) -> dict:
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        int(claims["sub"])
+    except (JWTError, KeyError, ValueError):
+        token_checks.inc(outcome="invalid")
         raise credentials_exception
+    if denylist.is_revoked(claims):
+        token_checks.inc(outcome="revoked")
+        raise credentials_exception
+    return claims
+
 
+async def user_from_token(token: str) -> dict:
+    if denylist.refresh_due():
+        await run_in_threadpool(denylist.refresh)
+    claims = decode_token(token)
+    user = await get_user(int(claims["sub"]))
+    # Роль из токена должна совпадать с текущей: после смены роли токен недействителен
+    if user is None or user["role"] != claims.get("role"):
+        token_checks.inc(outcome="stale")
+        raise credentials_exception
+    token_checks.inc(outcome="ok")
     return user
 
-def is_user_auth(request: Request, db: Session = Depends(get_db)) -> bool:
-    token = request.session.get("token")
+
+def bearer_token(request) -> str:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return token if scheme.lower() == "bearer" and token else None
+
+
+async def get_current_user(request: Request) -> dict:
+    token = bearer_token(request)
+    if token is None:
+        raise credentials_exception
+    return await user_from_token(token)
+
+
+async def is_user_auth(request: Request) -> bool:
+    token = bearer_token(request)
     if token is None:
         return False
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email_user: str = payload.get("sub")
-        if email_user is None:
-            return False
-        user = db.query(User).filter(User.email == email_user).first()
-        result = user is not None
-        return result
-    except JWTError:
-        return False
\ No newline at end of file
+        await user_from_token(token)
+    except HTTPException:
+        return False
+    return True
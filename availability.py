@@ -0,0 +1,442 @@
+import bisect
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import changes, database, metrics, repository, schemas
+from dependencies import get_crud_db, require_role, run_and_release
+
+# Занятость трассы: бронирования и заезды держатся в памяти интервалами по дням
+# (минуты от эпохи, отсортированные и слитые в непересекающиеся отрезки). Проверка
+# конфликта и свободные слоты - bisect по дню, без обращения к БД. Индекс загружается
+# один раз; новые строки догружаются по водяному знаку id, строки, изменённые в этом
+# процессе, перечитываются по id после commit, удаления в других воркерах замечаются по
+# числу строк. Бронирование отклоняется только после проверки по БД под блокировкой дня.
+# Время в БД и в индексе - местное время трассы без пояса; время с поясом переводится в
+# TRACK_TIMEZONE (по умолчанию - пояс сервера).
+
+SLOT_MINUTES = int(os.getenv("BOOKING_SLOT_MINUTES", "30"))
+OPEN_HOUR = int(os.getenv("TRACK_OPEN_HOUR", "10"))
+CLOSE_HOUR = int(os.getenv("TRACK_CLOSE_HOUR", "22"))
+TIMEZONE = ZoneInfo(os.environ["TRACK_TIMEZONE"]) if os.getenv("TRACK_TIMEZONE") else None
+REFRESH_INTERVAL = float(os.getenv("AVAILABILITY_REFRESH_INTERVAL", "5"))
+# Перенос времени в другом воркере виден в свободных слотах после полной перезагрузки
+RELOAD_INTERVAL = float(os.getenv("AVAILABILITY_RELOAD_INTERVAL", "3600"))
+MAX_RANGE_DAYS = 31
+
+# Сколько минут трасса занята бронированием каждого типа; неизвестный тип - один слот
+DURATIONS = {"Заезд": 30, "Тренировка": 60, "Корпоратив": 120, "Турнир": 180}
+MAX_BOOKING_MINUTES = max(DURATIONS.values())
+# Заезды считаются короче суток: при проверке по БД раньше не ищем
+MAX_RACE_MINUTES = 24 * 60
+
+EPOCH = datetime(1970, 1, 1)
+DAY = 24 * 60
+NAMES = {"booking": "бронирование", "race": "заезд"}
+
+router = APIRouter(prefix="/api")
+users = require_role()
+organizers = require_role("Организатор")
+
+refreshes = metrics.Counter("availability_refreshes_total", "Track availability index refreshes")
+conflicts_found = metrics.Counter("booking_conflicts_total", "Bookings rejected as overlapping")
+
+
+class BookingError(Exception):
+    # Нарушение правил бронирования; обработчик запроса отвечает status_code
+    status_code = 400
+
+
+class Conflict(BookingError):
+    status_code = 409
+
+    def __init__(self, keys: list):
+        self.keys = keys
+        super().__init__("Время занято: " + ", ".join(f"{NAMES[table]} {id}" for table, id in keys))
+
+
+class UnknownClient(BookingError):
+    status_code = 404
+
+    def __init__(self, client_id: int):
+        super().__init__(f"Клиент {client_id} не найден")
+
+
+def local(at: datetime) -> datetime:
+    if at.tzinfo is None:
+        return at
+    return at.astimezone(TIMEZONE).replace(tzinfo=None)
+
+
+def minutes(at: datetime) -> int:
+    return (local(at) - EPOCH) // timedelta(minutes=1)
+
+
+def moment(minute: int) -> datetime:
+    return EPOCH + timedelta(minutes=minute)
+
+
+def booking_span(booking_datetime: datetime, booking_type: str) -> tuple:
+    start = minutes(booking_datetime)
+    return start, start + DURATIONS.get(booking_type, SLOT_MINUTES)
+
+
+def race_span(race_datetime: datetime, duration: timedelta) -> tuple:
+    start = minutes(race_datetime)
+    return start, start + max(1, -(-duration // timedelta(minutes=1)))
+
+
+def _pieces(start: int, end: int):
+    # Интервал через полночь лежит в нескольких днях
+    for day in range(start // DAY, (end - 1) // DAY + 1):
+        yield day, max(start, day * DAY), min(end, (day + 1) * DAY)
+
+
+class _Day:
+    # Неизменяемый после создания: читатели не видят полуобновлённого дня
+
+    __slots__ = ("intervals", "starts", "ends")
+
+    def __init__(self, intervals: dict):
+        self.intervals = intervals
+        starts, ends = [], []
+        for start, end in sorted(intervals.values()):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self.starts, self.ends = starts, ends
+
+    def busy(self, start: int, end: int) -> bool:
+        # Последний отрезок, начавшийся до конца запроса, и заканчивается ли он после его начала
+        i = bisect.bisect_left(self.starts, end) - 1
+        return i >= 0 and self.ends[i] > start
+
+
+class Index:
+
+    def __init__(self):
+        self._days = {}
+        self._spans = {}
+        self._counts = {}
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def count(self, table: str) -> int:
+        return self._counts.get(table, 0)
+
+    def update(self, spans: dict):
+        # {(таблица, id): (начало, конец) или None для удалённой строки}
+        changed = {}
+        for key, span in spans.items():
+            old = self._spans.pop(key, None)
+            if old is not None:
+                self._counts[key[0]] -= 1
+                for day, _, _ in _pieces(*old):
+                    changed.setdefault(day, dict(self._days[day].intervals)).pop(key, None)
+            if span is not None:
+                self._spans[key] = span
+                self._counts[key[0]] = self._counts.get(key[0], 0) + 1
+                for day, start, end in _pieces(*span):
+                    intervals = changed.get(day)
+                    if intervals is None:
+                        intervals = changed[day] = dict(self._days[day].intervals) if day in self._days else {}
+                    intervals[key] = (start, end)
+        for day, intervals in changed.items():
+            if intervals:
+                self._days[day] = _Day(intervals)
+            else:
+                self._days.pop(day, None)
+
+    def busy(self, start: int, end: int) -> bool:
+        for day, day_start, day_end in _pieces(start, end):
+            entry = self._days.get(day)
+            if entry is not None and entry.busy(day_start, day_end):
+                return True
+        return False
+
+    def conflicts(self, start: int, end: int) -> list:
+        found = set()
+        for day, _, _ in _pieces(start, end):
+            entry = self._days.get(day)
+            if entry is not None and entry.busy(start, end):
+                found.update(key for key, (a, b) in entry.intervals.items() if a < end and b > start)
+        return sorted(found)
+
+    def free_slots(self, start: int, end: int, duration: int) -> list:
+        # Слоты сетки SLOT_MINUTES в часы работы, целиком свободные на duration минут
+        slots = []
+        for day in range(start // DAY, (end - 1) // DAY + 1):
+            opening, closing = day * DAY + OPEN_HOUR * 60, day * DAY + CLOSE_HOUR * 60
+            first = opening + -(-max(start - opening, 0) // SLOT_MINUTES) * SLOT_MINUTES
+            entry = self._days.get(day)
+            for slot in range(first, min(closing, end) - duration + 1, SLOT_MINUTES):
+                if entry is None or not entry.busy(slot, slot + duration):
+                    slots.append((slot, slot + duration))
+        return slots
+
+
+def _bookings(conn, condition) -> dict:
+    rows = conn.execute(
+        select(database.Booking.booking_id, database.Booking.booking_datetime, database.Booking.booking_type)
+        .where(condition)
+    )
+    return {("booking", id): booking_span(at, kind) for id, at, kind in rows}
+
+
+def _races(conn, condition) -> dict:
+    rows = conn.execute(
+        select(database.Race.race_id, database.Race.race_datetime, database.Race.duration).where(condition)
+    )
+    return {("race", id): race_span(at, duration) for id, at, duration in rows}
+
+
+LOADERS = {
+    "booking": (_bookings, database.Booking.booking_id),
+    "race": (_races, database.Race.race_id),
+}
+
+
+class AvailabilityStore:
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = {table: set() for table in LOADERS}
+        self._stale = False
+        self._refreshed = 0.0
+        self._loaded = 0.0
+        self.watermarks = dict.fromkeys(LOADERS, 0)
+
+    def __len__(self) -> int:
+        return len(self._index) if self._index is not None else 0
+
+    def invalidate(self):
+        self._stale = True
+
+    def changed(self, table: str, ids):
+        with self._pending_lock:
+            self._pending[table].update(ids)
+
+    def _due(self) -> bool:
+        return (
+            self._stale or any(self._pending.values())
+            or time.monotonic() - self._refreshed >= REFRESH_INTERVAL
+        )
+
+    def fresh(self) -> bool:
+        # index() ответит без обращения к БД
+        return self._index is not None and not self._due()
+
+    def index(self) -> Index:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._refresh()
+        elif self._due() and self._lock.acquire(blocking=False):
+            # Пока один поток обновляет индекс, остальные отвечают по текущему
+            try:
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self._index
+
+    def _refresh(self):
+        full = self._index is None or self._stale or time.monotonic() - self._loaded >= RELOAD_INTERVAL
+        self._stale = False
+        with self._pending_lock:
+            pending, self._pending = self._pending, {table: set() for table in LOADERS}
+        index = Index() if full else self._index
+        watermarks = dict.fromkeys(LOADERS, 0) if full else dict(self.watermarks)
+        spans = {}
+        with database.engine.connect() as conn:
+            for table, (load, pk) in LOADERS.items():
+                ids = () if full else pending[table]
+                # Перечитанные по id и не найденные строки удалены
+                spans.update(((table, id), None) for id in ids)
+                condition = pk > watermarks[table]
+                if ids:
+                    condition = or_(condition, pk.in_(ids))
+                loaded = load(conn, condition)
+                spans.update(loaded)
+                watermarks[table] = max([watermarks[table], *(id for _, id in loaded)])
+            index.update(spans)
+            # Удалённые другими воркерами строки остаются в индексе, и в нём строк больше,
+            # чем в БД. Считается после загрузки: новые строки не дают ложных срабатываний
+            if not full and any(
+                index.count(table) > conn.execute(select(func.count()).select_from(pk.table)).scalar()
+                for table, (_, pk) in LOADERS.items()
+            ):
+                self._stale = True
+        self._index, self.watermarks = index, watermarks
+        self._refreshed = time.monotonic()
+        if full:
+            self._loaded = self._refreshed
+        refreshes.inc(kind="full" if full else "incremental")
+
+
+store = AvailabilityStore()
+
+
+@changes.subscribe
+def _on_commit(changed: dict):
+    for table, (_, pk) in LOADERS.items():
+        rows = changed.get(table, [])
+        if rows is None:
+            store.invalidate()
+        else:
+            store.changed(table, [row[pk.key] for row in rows if row.get(pk.key) is not None])
+
+
+def _check_hours(start: int, end: int):
+    day = start // DAY
+    if start < day * DAY + OPEN_HOUR * 60 or end > day * DAY + CLOSE_HOUR * 60:
+        raise BookingError(f"Трасса работает с {OPEN_HOUR}:00 до {CLOSE_HOUR}:00")
+
+
+def _conflict(keys: list, stage: str) -> Conflict:
+    conflicts_found.inc(stage=stage)
+    return Conflict(keys)
+
+
+# Проверка и вставка для одного дня не идут параллельно: в процессе - полосатые
+# блокировки по дню, между процессами на Postgres - advisory-блокировка до commit
+_day_locks = [threading.Lock() for _ in range(64)]
+
+
+def _lock_days(db: Session, days: list):
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for day in days:
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": zlib.crc32(f"booking:{day}".encode())})
+
+
+def _stored_conflicts(db: Session, start: int, end: int) -> list:
+    spans = {}
+    spans.update(_bookings(db, (database.Booking.booking_datetime >= moment(start - MAX_BOOKING_MINUTES))
+                           & (database.Booking.booking_datetime < moment(end))))
+    spans.update(_races(db, (database.Race.race_datetime >= moment(start - MAX_RACE_MINUTES))
+                        & (database.Race.race_datetime < moment(end))))
+    return sorted(key for key, (a, b) in spans.items() if a < end and b > start)
+
+
+def _prepare(data: dict) -> tuple:
+    # Проверки без обращения к БД. Занятость по индексу только запоминается: в индексе
+    # может остаться строка, удалённая или перенесённая другим воркером
+    data = {**data, "booking_datetime": local(data["booking_datetime"])}
+    start, end = booking_span(data["booking_datetime"], data["booking_type"])
+    _check_hours(start, end)
+    busy = store.index().busy(start, end)
+    days = sorted({day for day, _, _ in _pieces(start, end)})
+    locks = [_day_locks[i] for i in sorted({day % len(_day_locks) for day in days})]
+    return data, start, end, days, locks, busy
+
+
+def _insert(db: Session, data: dict, start: int, end: int, days: list, busy: bool):
+    # Под блокировками дней: проверка по БД и вставка в одной транзакции
+    database.use_primary(db)
+    with repository.unit_of_work(db):
+        _lock_days(db, days)
+        if db.get(database.Client, data["client_id"]) is None:
+            raise UnknownClient(data["client_id"])
+        # Индекс мог не успеть увидеть бронирования других воркеров
+        stored = _stored_conflicts(db, start, end)
+        if stored:
+            raise _conflict(stored, "index" if busy else "database")
+        if busy:
+            # Конфликт по индексу не подтвердился - индекс устарел
+            store.invalidate()
+        try:
+            return repository.bookings.create(db, data)
+        except IntegrityError:
+            # Клиента удалили после проверки
+            raise UnknownClient(data["client_id"])
+
+
+def create_booking(db: Session, data: dict):
+    # BookingError, если время вне часов работы или занято; UnknownClient - нет клиента
+    data, start, end, days, locks, busy = _prepare(data)
+    for lock in locks:
+        lock.acquire()
+    try:
+        return _insert(db, data, start, end, days, busy)
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+
+
+async def create_booking_async(db, data: dict):
+    # То же на AsyncSession: индекс обновляется и блокировки дней ждутся в threadpool,
+    # чтобы не останавливать цикл событий
+    if not store.fresh():
+        await run_in_threadpool(store.index)
+    data, start, end, days, locks, busy = _prepare(data)
+    acquired = []
+    try:
+        for lock in locks:
+            await run_in_threadpool(lock.acquire)
+            acquired.append(lock)
+        return await db.run_sync(_insert, data, start, end, days, busy)
+    finally:
+        for lock in reversed(acquired):
+            lock.release()
+
+
+
+def free_slots(start: datetime, end: datetime, booking_type: str) -> list:
+    duration = DURATIONS.get(booking_type, SLOT_MINUTES)
+    return [
+        {"start": moment(a), "end": moment(b)}
+        for a, b in store.index().free_slots(minutes(start), minutes(end), duration)
+    ]
+
+
+def check(booking_datetime: datetime, booking_type: str) -> dict:
+    start, end = booking_span(booking_datetime, booking_type)
+    conflicts = store.index().conflicts(start, end)
+    return {
+        "free": not conflicts,
+        "start": moment(start),
+        "end": moment(end),
+        "conflicts": [{"type": table, "id": id} for table, id in conflicts],
+    }
+
+
+@router.get("/availability")
+async def get_availability(start: datetime, end: datetime, booking_type: str = "Заезд", user: dict = Depends(users)):
+    start, end = local(start), local(end)
+    if end <= start or end - start > timedelta(days=MAX_RANGE_DAYS):
+        raise HTTPException(status_code=400, detail=f"Диапазон - от 1 минуты до {MAX_RANGE_DAYS} дней")
+    slots = await run_in_threadpool(free_slots, start, end, booking_type)
+    return {
+        "booking_type": booking_type,
+        "duration_minutes": DURATIONS.get(booking_type, SLOT_MINUTES),
+        "slots": slots,
+    }
+
+
+@router.get("/availability/check")
+async def get_availability_check(booking_datetime: datetime, booking_type: str, user: dict = Depends(users)):
+    return await run_in_threadpool(check, booking_datetime, booking_type)
+
+
+@router.post("/bookings", response_model=schemas.BookingResponse, status_code=201)
+async def post_booking(booking: schemas.BookingCreate, db=Depends(get_crud_db), user: dict = Depends(organizers)):
+    try:
+        if database.USE_ASYNC:
+            return await create_booking_async(db, booking.dict())
+        return await run_in_threadpool(run_and_release, db, create_booking, booking.dict())
+    except BookingError as error:
+        raise HTTPException(status_code=error.status_code, detail=str(error))
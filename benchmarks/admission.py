@@ -0,0 +1,126 @@
+"""Допуск тяжёлых запросов по ролям: организатор открывает большое представление в
+десяти вкладках, пока клиент читает свою историю бронирований. Сравниваются задержки
+клиента без ограничений и с пределами admission при маленьком пуле соединений.
+
+    python -m benchmarks.admission
+    python -m benchmarks.admission --clients 20000 --tabs 20 --seconds 10
+
+Без ограничений вкладки организатора занимают все соединения пула, и запросы клиента
+ждут их освобождения. С пределами лишние вкладки получают 429/503 с Retry-After,
+а клиент читает через свою квоту. Отказ без Retry-After или неожиданный статус
+завершает скрипт с кодом 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import sqlite_url, start_server, summarize
+
+VIEW = "Organizer_Race_Booking_Overview"
+CLIENT_VIEW = "Client_Booking_History"
+POOL_SIZE = 4
+UNLIMITED = {
+    role: {"concurrency": 1000, "per_user": 1000, "queue": 1000, "db_seconds_per_second": 1000, "db_burst_seconds": 1000}
+    for role in ("Клиент", "Организатор")
+}
+LIMITED = {"Организатор": {"concurrency": 2, "per_user": 2, "queue": 2, "wait_ms": 200}}
+
+
+async def login(base: str, username: str, role: str) -> httpx.AsyncClient:
+    client = httpx.AsyncClient(base_url=base, timeout=120)
+    form = {"username": username, "password": username, "role": role}
+    await client.post("/register", data=form)
+    await client.post("/login", data=form)
+    return client
+
+
+async def run(base: str, tabs: int, seconds: float) -> dict:
+    organizer = await login(base, "bench-organizer", "Организатор")
+    client = await login(base, "bench-client", "Клиент")
+    statuses, bad = {}, []
+    client_latencies = []
+    stop = time.perf_counter() + seconds
+
+    async def tab():
+        while time.perf_counter() < stop:
+            response = await organizer.get(f"/view/{VIEW}?limit=0")
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code in (429, 503):
+                if "retry-after" not in response.headers:
+                    bad.append(response.status_code)
+                await asyncio.sleep(min(float(response.headers.get("retry-after", 1)), 0.2))
+            elif response.status_code != 200:
+                bad.append(response.status_code)
+
+    async def booker():
+        await asyncio.sleep(0.5)
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            response = await client.get(f"/view/{CLIENT_VIEW}?limit=0")
+            if response.status_code != 200:
+                bad.append(response.status_code)
+            client_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    await asyncio.gather(booker(), *(tab() for _ in range(tabs)))
+    elapsed = time.perf_counter() - started
+    await organizer.aclose()
+    await client.aclose()
+    return {"client": summarize(client_latencies, elapsed), "organizer": statuses, "bad": bad}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--tabs", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=6)
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="admission-")
+    path = os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = sqlite_url(path)
+    import database
+    from benchmarks.seed import create_stand_in_views, seed_schema
+
+    database.migrate()
+    counts = seed_schema(database, args.clients)
+    create_stand_in_views(database)
+    database.engine.dispose()
+    print(f"{VIEW}: {counts['booking']} строк, пул {POOL_SIZE} соединений, {args.tabs} вкладок организатора\n")
+
+    failed = False
+    print(f"{'':<14}{'client p50 ms':>14}{'p99 ms':>10}{'max ms':>10}   organizer statuses")
+    try:
+        for name, limits in (("unlimited", UNLIMITED), ("admission", LIMITED)):
+            process, base = start_server(
+                args.port, DATABASE_URL=sqlite_url(path), DB_POOL_SIZE=str(POOL_SIZE), DB_MAX_OVERFLOW="0",
+                ADMISSION_LIMITS=json.dumps(limits),
+            )
+            try:
+                result = asyncio.run(run(base, args.tabs, args.seconds))
+            finally:
+                process.terminate()
+                process.wait()
+            client = result["client"]
+            print(f"{name:<14}{client['p50_ms']:>14.1f}{client['p99_ms']:>10.1f}{client['max_ms']:>10.1f}   "
+                  f"{dict(sorted(result['organizer'].items()))}")
+            if result["bad"]:
+                print(f"  неожиданные ответы: {sorted(set(result['bad']))}")
+                failed = True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
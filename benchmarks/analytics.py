@@ -0,0 +1,161 @@
+"""Аналитика по кругам: векторные метрики по колонкам NumPy против построчного
+расчёта по объектам (как при обходе LapTime из ORM), плюс загрузка колонок из БД.
+
+    python -m benchmarks.analytics --laps 10000000
+    python -m benchmarks.analytics --laps 10000000 --db-clients 5000
+
+Колонки на --laps кругов генерируются прямо в памяти; построчный расчёт меряется на
+--baseline-laps кругах и пересчитывается на полный объём. С --db-clients дополнительно
+заполняется SQLite-база и меряются полная загрузка и догрузка по водяному знаку.
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from benchmarks.common import peak_rss_mb, sqlite_url
+
+LAPS_PER_RESULT = 10
+PER_RACE = 8
+
+
+def synthetic_snapshot(analytics, laps: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    results = laps // LAPS_PER_RESULT
+    races = max(results // PER_RACE, 1)
+    clients = max(results // 50, 1)
+    karts = 60
+    start = np.datetime64("2022-01-01").astype(np.int64)
+
+    race_day = (start + np.sort(rng.integers(0, 3 * 365, races))).astype(np.int32)
+    result_race = np.minimum(np.arange(results, dtype=np.int32) // PER_RACE + 1, races)
+    result_client = rng.integers(1, clients + 1, results, dtype=np.int32)
+    result_kart = rng.integers(1, karts + 1, results, dtype=np.int32)
+    skill = rng.normal(42000, 2500, clients + 1)
+
+    result_id = np.repeat(np.arange(1, results + 1, dtype=np.int32), LAPS_PER_RESULT)
+    client = result_client[result_id - 1]
+    race = result_race[result_id - 1]
+    day = race_day[race - 1]
+    lap_ms = skill[client] + rng.normal(0, 600, len(result_id))
+    lap_ms[np.arange(len(result_id)) % LAPS_PER_RESULT == 0] += 4000
+    columns = {
+        "lap_time_id": np.arange(1, len(result_id) + 1, dtype=np.int32),
+        "result_id": result_id,
+        "client_id": client,
+        "race_id": race,
+        "kart_id": result_kart[result_id - 1],
+        "lap_number": (np.arange(len(result_id)) % LAPS_PER_RESULT + 1).astype(np.int16),
+        "lap_ms": lap_ms.astype(np.int32),
+        "race_day": day,
+        "season": (day.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int16) + 1970).astype(np.int16),
+    }
+    maintenance_kart = np.repeat(np.arange(1, karts + 1, dtype=np.int32), 36)
+    maintenance_day = (start + np.tile(np.arange(36) * 30, karts) + rng.integers(0, 10, karts * 36)).astype(np.int32)
+    return analytics.Snapshot(columns, len(result_id), (maintenance_kart, maintenance_day), 1)
+
+
+def python_baseline(snapshot, laps: int) -> float:
+    # Строки в виде объектов Python с timedelta, как после выборки LapTime через ORM
+    columns = snapshot.columns
+    rows = [
+        (int(client), timedelta(milliseconds=int(ms)))
+        for client, ms in zip(columns["client_id"][:laps], columns["lap_ms"][:laps])
+    ]
+    started = time.perf_counter()
+    best, times = {}, {}
+    for client, lap_time in rows:
+        ms = lap_time / timedelta(milliseconds=1)
+        if ms < best.get(client, float("inf")):
+            best[client] = ms
+        times.setdefault(client, []).append(ms)
+    sorted(best.items(), key=lambda item: item[1])[:100]
+    spread = {client: statistics.stdev(values) for client, values in times.items() if len(values) >= 10}
+    sorted(spread.items(), key=lambda item: item[1])[:100]
+    return time.perf_counter() - started
+
+
+def measure(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def run_compute(analytics, laps: int, baseline_laps: int, repeat: int):
+    started = time.perf_counter()
+    snapshot = synthetic_snapshot(analytics, laps)
+    size = sum(array.nbytes for array in snapshot.columns.values())
+    print(f"generated {snapshot.length} laps in {time.perf_counter() - started:.1f} s, "
+          f"columns {size / 2 ** 20:.0f} MB ({size / snapshot.length:.0f} B/lap)")
+
+    season = int(snapshot.columns["season"].max())
+    checks = [
+        ("best_laps", lambda: analytics.best_laps(snapshot)),
+        ("best_laps season", lambda: analytics.best_laps(snapshot, season)),
+        ("consistency", lambda: analytics.consistency(snapshot)),
+        ("kart_degradation", lambda: analytics.kart_degradation(snapshot)),
+        ("rankings season", lambda: analytics.rankings(snapshot, season)),
+    ]
+    print(f"{'metric':<24}{'median ms':>12}{'Mlaps/s':>10}")
+    for name, function in checks:
+        seconds = measure(function, repeat)
+        print(f"{name:<24}{seconds * 1000:>12.1f}{snapshot.length / seconds / 1e6:>10.1f}")
+
+    baseline_laps = min(baseline_laps, snapshot.length)
+    seconds = python_baseline(snapshot, baseline_laps)
+    vectorized = measure(lambda: (analytics.best_laps(snapshot), analytics.consistency(snapshot)), repeat)
+    projected = seconds * snapshot.length / baseline_laps
+    print(f"python best+stddev: {seconds:.2f} s on {baseline_laps} laps, "
+          f"~{projected:.1f} s on {snapshot.length} (vectorized {vectorized:.2f} s, x{projected / vectorized:.0f})")
+
+
+def run_load(analytics, database, clients: int):
+    from benchmarks.seed import reset, seed_schema
+
+    reset(database)
+    counts = seed_schema(database, clients)
+    analytics.store.invalidate()
+    started = time.perf_counter()
+    snapshot = analytics.store.snapshot()
+    seconds = time.perf_counter() - started
+    print(f"full load: {snapshot.length} laps in {seconds:.2f} s ({snapshot.length / seconds:.0f} laps/s)")
+
+    with database.engine.begin() as conn:
+        result_id = conn.execute(database.RaceResult.__table__.select().limit(1)).first().result_id
+        conn.execute(database.LapTime.__table__.insert(), [
+            {"result_id": result_id, "lap_time": timedelta(seconds=40), "lap_number": 100 + i} for i in range(1000)
+        ])
+    analytics.store._refreshed = 0
+    started = time.perf_counter()
+    snapshot = analytics.store.snapshot()
+    print(f"incremental: +1000 laps in {(time.perf_counter() - started) * 1000:.1f} ms "
+          f"(total {snapshot.length}, lap_time rows {counts['lap_time'] + 1000})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--laps", type=int, default=10_000_000)
+    parser.add_argument("--baseline-laps", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db-clients", type=int, default=0, help="заполнить БД и померить загрузку колонок")
+    parser.add_argument("--db", default="bench_analytics.db")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", sqlite_url(args.db))
+    import analytics, database
+
+    run_compute(analytics, args.laps, args.baseline_laps, args.repeat)
+    if args.db_clients:
+        database.Base.metadata.create_all(database.engine)
+        run_load(analytics, database, args.db_clients)
+    print(f"peak RSS {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Холодный архив истории кругов: размер горячих таблиц и задержки чтения до и после
+переноса старых месяцев из race_result и lap_time в сегменты archive.
+
+    python -m benchmarks.archive
+    python -m benchmarks.archive --clients 20000 --laps-per-result 12 --before 2024-10-01
+
+Сравниваются число строк и размер базы после VACUUM, размер сегментов на диске,
+задержка полного представления Organizer_Race_Schedule_Results, истории клиента и
+ответа по заезду, время полной перезагрузки колонок аналитики. История клиентов и
+ответы по заездам до и после переноса должны совпадать, иначе скрипт завершается с
+кодом 1.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import func, select
+
+from benchmarks.common import sqlite_url, start_server, summarize
+
+VIEW = "Organizer_Race_Schedule_Results"
+UNLIMITED = {
+    "Организатор": {"concurrency": 1000, "per_user": 1000, "queue": 1000, "db_seconds_per_second": 1000, "db_burst_seconds": 1000}
+}
+
+
+def hot_size(database) -> dict:
+    with database.engine.connect() as conn:
+        counts = {
+            model.__tablename__: conn.execute(select(func.count()).select_from(model)).scalar()
+            for model in (database.RaceResult, database.LapTime)
+        }
+    return {**counts, "db_mb": os.path.getsize(database.engine.url.database) / 2 ** 20}
+
+
+def directory_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 2 ** 20
+
+
+def measure(base: str, clients: list, races: list, repeat: int) -> tuple:
+    timings = {"view": [], "history": [], "race": []}
+    answers = {}
+    with httpx.Client(base_url=base, timeout=120) as client:
+        form = {"username": "bench", "password": "bench", "role": "Организатор"}
+        client.post("/register", data=form)
+        client.post("/login", data=form)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            client.get(f"/view/{VIEW}?limit=0").raise_for_status()
+            timings["view"].append(time.perf_counter() - started)
+        for kind, ids, url in (("history", clients, "/api/clients/{}/history"), ("race", races, "/api/races/{}")):
+            for id in ids:
+                started = time.perf_counter()
+                response = client.get(url.format(id))
+                response.raise_for_status()
+                timings[kind].append(time.perf_counter() - started)
+                answers[(kind, id)] = _normalized(response.json())
+    return timings, answers
+
+
+def _normalized(body: dict) -> list:
+    # Архивные результаты идут перед горячими, поэтому сравнение без учёта порядка
+    return sorted(json.dumps(result, sort_keys=True) for result in body["race_results"])
+
+
+def analytics_reload(repeat: int) -> float:
+    import analytics
+
+    seconds = []
+    for _ in range(repeat):
+        analytics.store.invalidate()
+        started = time.perf_counter()
+        analytics.store.snapshot()
+        seconds.append(time.perf_counter() - started)
+    return min(seconds) * 1000
+
+
+def vacuum(database):
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--laps-per-result", type=int, default=10)
+    parser.add_argument("--before", default="2024-07-01", help="месяцы до этой даты уходят в архив")
+    parser.add_argument("--sample", type=int, default=50, help="клиентов и заездов для проверки ответов")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8771)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="archive-")
+    path = os.path.join(workdir, "bench.db")
+    archive_dir = os.path.join(workdir, "archive")
+    os.environ["DATABASE_URL"] = sqlite_url(path)
+    os.environ["ARCHIVE_DIR"] = archive_dir
+    import database
+    from benchmarks.seed import create_stand_in_views, seed_schema
+
+    database.migrate()
+    seed_schema(database, args.clients, laps_per_result=args.laps_per_result)
+    create_stand_in_views(database)
+    vacuum(database)
+    step = max(args.clients // args.sample, 1)
+    clients = list(range(1, args.clients + 1, step))[:args.sample]
+    races = list(range(1, max(args.clients // 5, 10) + 1, max(args.clients // 5 // args.sample, 1)))[:args.sample]
+
+    env = {"DATABASE_URL": sqlite_url(path), "ARCHIVE_DIR": archive_dir, "ADMISSION_LIMITS": json.dumps(UNLIMITED)}
+    phases = {}
+    failed = False
+    try:
+        for phase in ("hot", "archived"):
+            if phase == "archived":
+                database.engine.dispose()
+                started = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, "archive.py", "archive", "--before", args.before, "--vacuum"],
+                    check=True, stdout=subprocess.DEVNULL,
+                )
+                print(f"перенос в архив до {args.before}: {time.perf_counter() - started:.1f} s\n")
+            size = hot_size(database)
+            reload_ms = analytics_reload(args.repeat)
+            database.engine.dispose()
+            process, base = start_server(args.port, **env)
+            try:
+                timings, answers = measure(base, clients, races, args.repeat)
+            finally:
+                process.terminate()
+                process.wait()
+            phases[phase] = answers
+            print(f"{phase}: race_result {size['race_result']}, lap_time {size['lap_time']}, "
+                  f"база {size['db_mb']:.1f} MB, архив {directory_mb(archive_dir):.1f} MB")
+            print(f"  {'':<34}{'p50 ms':>10}{'p99 ms':>10}")
+            for kind, label in (("view", VIEW), ("history", "client history"), ("race", "race detail")):
+                summary = summarize(timings[kind], 1)
+                print(f"  {label:<34}{summary['p50_ms']:>10.1f}{summary['p99_ms']:>10.1f}")
+            print(f"  {'analytics full reload':<34}{reload_ms:>10.1f}\n")
+        mismatched = [key for key, answer in phases["hot"].items() if phases["archived"].get(key) != answer]
+        if mismatched:
+            print(f"ответы после переноса отличаются: {mismatched[:10]}")
+            failed = True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
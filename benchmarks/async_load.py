@@ -0,0 +1,71 @@
+"""Нагрузочный тест /view/{view} в синхронном и асинхронном режимах при одном воркере.
+
+    python -m benchmarks.async_load --concurrency 10,100,400
+
+Для запуска нужны uvicorn и httpx. Страницы запрашиваются с limit=0, чтобы
+каждый запрос доходил до базы, а не до кэша страниц.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import SYNTHETIC_VIEW, build_synthetic_view, sqlite_url, start_server, summarize
+
+
+async def login(client: httpx.AsyncClient):
+    form = {"username": "bench", "password": "bench", "role": "Организатор"}
+    await client.post("/register", data=form)
+    await client.post("/login", data=form)
+
+
+async def hammer(base: str, concurrency: int, requests: int):
+    latencies = []
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        await login(client)
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(f"/view/{SYNTHETIC_VIEW}?limit=0")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--concurrency", default="10,100,400")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--db", default="bench_async.db")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    build_synthetic_view(args.db, args.rows)
+    print(f"{'mode':<8}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for use_async in (False, True):
+        process, base = start_server(
+            args.port, DATABASE_URL=sqlite_url(args.db), DB_ASYNC="1" if use_async else "0"
+        )
+        try:
+            for concurrency in map(int, args.concurrency.split(",")):
+                stats = asyncio.run(hammer(base, concurrency, args.requests))
+                print(f"{'async' if use_async else 'sync':<8}{concurrency:>6}"
+                      f"{stats['rps']:>10.0f}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Стоимость аутентификации запроса: cookie сессии (require_auth) против токена
+с кэшем пользователей и против токена без кэша (поиск пользователя в БД на каждый запрос).
+
+    python -m benchmarks.auth_paths --requests 5000 --concurrency 50
+
+Все режимы запрашивают /api/me, который принимает и сессию, и токен. Число SQL на
+запрос берётся из гистограммы http_request_queries в /metrics сервера.
+"""
+import argparse
+import asyncio
+import re
+import time
+
+import httpx
+
+from benchmarks.common import scrape, sqlite_url, start_server, summarize
+
+FORM = {"username": "bench-auth", "password": "bench-auth", "role": "Технический персонал"}
+
+
+def queries_per_request(base: str) -> tuple:
+    text = scrape(base)
+    values = {}
+    for suffix in ("sum", "count"):
+        match = re.search(rf'^http_request_queries_{suffix}{{route="/api/me"}} (\S+)$', text, re.MULTILINE)
+        values[suffix] = float(match.group(1)) if match else 0.0
+    return values["sum"], values["count"]
+
+
+async def hammer(base: str, mode: str, requests: int, concurrency: int):
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        await client.post("/register", data=FORM)
+        headers = {}
+        if mode == "session":
+            await client.post("/login", data=FORM)
+        else:
+            token = (await client.post("/token", data=FORM)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+        (await client.get("/api/me", headers=headers)).raise_for_status()
+
+        latencies = []
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.get("/api/me", headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db", default="bench_auth.db")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    modes = [("session", {}), ("token", {}), ("token-nocache", {"AUTH_USER_CACHE_SIZE": "0"})]
+    print(f"{'mode':<16}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'SQL/req':>10}")
+    for mode, env in modes:
+        process, base = start_server(args.port, DATABASE_URL=sqlite_url(args.db), **env)
+        try:
+            before = queries_per_request(base)
+            stats = asyncio.run(hammer(base, mode.split("-")[0], args.requests, args.concurrency))
+            after = queries_per_request(base)
+        finally:
+            process.terminate()
+            process.wait()
+        # В дельту попадают и запросы прогрева, поэтому считается среднее по всем
+        per_request = (after[0] - before[0]) / max(after[1] - before[1], 1)
+        print(f"{mode:<16}{stats['rps']:>10.0f}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}{per_request:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Индекс занятости трассы на сезоне бронирований и заездов: загрузка индекса, проверка
+конфликта и поиск свободных слотов на неделю и месяц против того же ответа запросами к БД.
+
+    python -m benchmarks.availability
+    python -m benchmarks.availability --days 365 --checks 20000
+
+Сезон заполняется без пересечений: в каждый день работы трассы подряд ставятся заезды
+и бронирования случайной длины с промежутками. В конце несколько потоков одновременно
+бронируют одно и то же время; успешным должно быть ровно одно бронирование, иначе
+скрипт завершается с кодом 1.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import sqlite_url
+
+SEASON_START = datetime(2025, 4, 1)
+
+
+def seed_season(database, availability, days: int, seed: int) -> tuple:
+    rnd = random.Random(seed)
+    bookings, races = [], []
+    for day in range(days):
+        at = SEASON_START + timedelta(days=day, hours=availability.OPEN_HOUR)
+        closing = SEASON_START + timedelta(days=day, hours=availability.CLOSE_HOUR)
+        while True:
+            at += timedelta(minutes=availability.SLOT_MINUTES * rnd.randint(0, 2))
+            if rnd.random() < 0.3:
+                duration = timedelta(minutes=rnd.choice([15, 20, 30]))
+                if at + duration > closing:
+                    break
+                races.append({"race_datetime": at, "participant_count": rnd.randint(2, 12), "duration": duration})
+            else:
+                kind = rnd.choice(list(availability.DURATIONS))
+                duration = timedelta(minutes=availability.DURATIONS[kind])
+                if at + duration > closing:
+                    break
+                bookings.append({"booking_datetime": at, "booking_type": kind, "client_id": 1})
+            # Следующее событие начинается на сетке слотов
+            at += duration + timedelta(minutes=-(duration.seconds // 60) % availability.SLOT_MINUTES)
+    with database.engine.begin() as conn:
+        conn.execute(database.Client.__table__.insert(), [{
+            "name": "bench", "email": "bench@example.com", "registration_date": SEASON_START.date(),
+        }])
+        conn.execute(database.Booking.__table__.insert(), bookings)
+        conn.execute(database.Race.__table__.insert(), races)
+    return len(bookings), len(races)
+
+
+def timed(function, arguments: list) -> float:
+    started = time.perf_counter()
+    for argument in arguments:
+        function(*argument)
+    return (time.perf_counter() - started) / len(arguments)
+
+
+def report(name: str, index_seconds: float, sql_seconds: float):
+    print(f"{name:<34}{index_seconds * 1e6:>12.1f}{sql_seconds * 1e6:>12.1f}{sql_seconds / index_seconds:>10.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="bench_availability.db")
+    parser.add_argument("--days", type=int, default=183)
+    parser.add_argument("--checks", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = sqlite_url(args.db)
+    import availability
+    import database
+
+    database.migrate()
+    bookings, races = seed_season(database, availability, args.days, args.seed)
+    print(f"{bookings} бронирований, {races} заездов за {args.days} дней")
+
+    started = time.perf_counter()
+    index = availability.store.index()
+    print(f"загрузка индекса: {(time.perf_counter() - started) * 1000:.0f} ms, {len(index)} интервалов\n")
+
+    rnd = random.Random(args.seed)
+    season = availability.minutes(SEASON_START)
+    spans = []
+    for _ in range(args.checks):
+        start = season + rnd.randrange(args.days) * availability.DAY + availability.OPEN_HOUR * 60
+        start += availability.SLOT_MINUTES * rnd.randrange(20)
+        spans.append((start, start + rnd.choice(list(availability.DURATIONS.values()))))
+
+    db = database.SessionLocal()
+    try:
+        print(f"{'':<34}{'index us':>12}{'SQL us':>12}{'':>10}")
+        report(
+            "conflict check",
+            timed(index.conflicts, spans),
+            timed(lambda start, end: availability._stored_conflicts(db, start, end), spans),
+        )
+        mismatched = sum(index.conflicts(*span) != availability._stored_conflicts(db, *span) for span in spans[:500])
+
+        for name, days in (("free slots, week", 7), ("free slots, month", 30)):
+            ranges = []
+            for _ in range(max(args.checks // 50, 10)):
+                start = season + rnd.randrange(max(args.days - days, 1)) * availability.DAY
+                ranges.append((start, start + days * availability.DAY, 60))
+
+            def scan(start, end, duration):
+                # Без индекса: все интервалы диапазона из БД и проверка каждого слота
+                Booking, Race = database.Booking, database.Race
+                stored = [
+                    *availability._bookings(db, (Booking.booking_datetime >= availability.moment(start - 24 * 60))
+                                            & (Booking.booking_datetime < availability.moment(end))).values(),
+                    *availability._races(db, (Race.race_datetime >= availability.moment(start - 24 * 60))
+                                         & (Race.race_datetime < availability.moment(end))).values(),
+                ]
+                return [
+                    slot for day in range(start // availability.DAY, end // availability.DAY)
+                    for slot in range(day * availability.DAY + availability.OPEN_HOUR * 60,
+                                      day * availability.DAY + availability.CLOSE_HOUR * 60 - duration + 1,
+                                      availability.SLOT_MINUTES)
+                    if not any(a < slot + duration and b > slot for a, b in stored)
+                ]
+
+            report(name, timed(index.free_slots, ranges), timed(scan, ranges))
+    finally:
+        db.close()
+    print(f"\nрасхождений индекса с БД: {mismatched}")
+
+    at = SEASON_START + timedelta(days=args.days + 1, hours=12)
+    outcomes = []
+    barrier = threading.Barrier(args.threads)
+
+    def book():
+        session = database.SessionLocal()
+        try:
+            barrier.wait()
+            availability.create_booking(session, {"booking_datetime": at, "booking_type": "Корпоратив", "client_id": 1})
+            outcomes.append(201)
+        except availability.BookingError as exc:
+            outcomes.append(exc.status_code)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=book) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    succeeded = outcomes.count(201)
+    print(f"одновременные бронирования одного времени: {succeeded} из {args.threads} успешно")
+    if mismatched or succeeded != 1:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Пропускная способность загрузки времён кругов: по строке через crud.create_lap_time
+против crud.bulk_create_lap_times.
+
+    python -m benchmarks.bulk_ingest --laps 600,6000,60000
+    DATABASE_URL=postgresql://... python -m benchmarks.bulk_ingest
+
+По умолчанию используется SQLite-файл; таблицы пересоздаются перед каждым замером.
+"""
+import argparse
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.common import sqlite_url
+
+
+def prepare(database, crud, schemas, karts: int = 20):
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    client = crud.create_client(db, schemas.ClientCreate(name="Bench", email="bench@example.com", registration_date=date.today()))
+    race = crud.create_race(db, schemas.RaceCreate(race_datetime=datetime.now(), participant_count=karts, duration=timedelta(minutes=20)))
+    result_ids = []
+    for _ in range(karts):
+        kart = crud.create_kart(db, schemas.KartCreate(brand="Bench", technical_condition="ok"))
+        result_ids.append(crud.create_race_result(db, schemas.RaceResultCreate(
+            race_datetime=race.race_datetime, client_id=client.client_id, race_id=race.race_id, kart_id=kart.kart_id
+        )).result_id)
+    db.close()
+    return result_ids
+
+
+def laps_for(result_ids, count: int, schemas):
+    return [
+        schemas.LapTimeCreate(
+            result_id=result_ids[i % len(result_ids)], lap_time=timedelta(seconds=40 + i % 7), lap_number=i // len(result_ids) + 1
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--laps", default="600,6000,60000")
+    parser.add_argument("--row-limit", type=int, default=6000, help="не гонять построчный путь на больших объёмах")
+    parser.add_argument("--db", default="bench_ingest.db")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", sqlite_url(args.db))
+    import database, crud, schemas
+
+    print(f"{'laps':>8}{'per-row laps/s':>16}{'bulk laps/s':>14}")
+    for count in map(int, args.laps.split(",")):
+        per_row = float("nan")
+        if count <= args.row_limit:
+            laps = laps_for(prepare(database, crud, schemas), count, schemas)
+            db = database.SessionLocal()
+            started = time.perf_counter()
+            for lap in laps:
+                crud.create_lap_time(db, lap)
+            per_row = count / (time.perf_counter() - started)
+            db.close()
+
+        laps = laps_for(prepare(database, crud, schemas), count, schemas)
+        db = database.SessionLocal()
+        started = time.perf_counter()
+        ids, errors = crud.bulk_create_lap_times(db, laps)
+        bulk = count / (time.perf_counter() - started)
+        db.close()
+        assert len(ids) == count and not errors
+        print(f"{count:>8}{per_row:>16.0f}{bulk:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
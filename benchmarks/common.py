@@ -0,0 +1,99 @@
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import create_engine, text
+
+# Представление, на котором меряются пути чтения (в SQLite это обычная таблица)
+SYNTHETIC_VIEW = "Organizer_Race_Booking_Overview"
+# METRICS_TOKEN сервера бенчмарка: /metrics без него доступен только администраторам
+METRICS_TOKEN = "bench-metrics"
+
+
+def sqlite_url(path: str) -> str:
+    return f"sqlite:///{os.path.abspath(path)}"
+
+
+def build_synthetic_view(path: str, rows: int, seed: int = 42):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(sqlite_url(path))
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1, 10, 0)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE {SYNTHETIC_VIEW} ("
+            "booking_id INTEGER PRIMARY KEY, booking_datetime TIMESTAMP, booking_type VARCHAR(50), "
+            "client_id INTEGER, name VARCHAR(100), email VARCHAR(100), phone VARCHAR(20))"
+        ))
+        batch = []
+        for booking_id in range(1, rows + 1):
+            client_id = rnd.randint(1, max(rows // 20, 1))
+            batch.append({
+                "booking_id": booking_id,
+                "booking_datetime": start + timedelta(minutes=15 * booking_id),
+                "booking_type": rnd.choice(["Заезд", "Тренировка", "Корпоратив"]),
+                "client_id": client_id,
+                "name": f"Клиент {client_id}",
+                "email": f"client{client_id}@example.com",
+                "phone": f"+7900{client_id:07d}",
+            })
+            if len(batch) == 10000:
+                conn.execute(text(
+                    f"INSERT INTO {SYNTHETIC_VIEW} VALUES (:booking_id, :booking_datetime, :booking_type, "
+                    ":client_id, :name, :email, :phone)"
+                ), batch)
+                batch = []
+        if batch:
+            conn.execute(text(
+                f"INSERT INTO {SYNTHETIC_VIEW} VALUES (:booking_id, :booking_datetime, :booking_type, "
+                ":client_id, :name, :email, :phone)"
+            ), batch)
+    engine.dispose()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux возвращается в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def start_server(port: int, **env):
+    # uvicorn с одним воркером; переменные окружения задают режим приложения.
+    # Таблицы во временной базе бенчмарка создаются при старте сервера
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        env={**os.environ, "DB_MIGRATE_ON_STARTUP": "1", "METRICS_TOKEN": METRICS_TOKEN, **env},
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/metrics", timeout=1)
+            return process, base
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Сервер не запустился")
+
+
+def scrape(base: str) -> str:
+    return httpx.get(f"{base}/metrics", headers={"Authorization": f"Bearer {METRICS_TOKEN}"}).text
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "rps": 0.0, "p50_ms": 0.0, "p90_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p90_ms": latencies[max(int(len(latencies) * 0.90) - 1, 0)] * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
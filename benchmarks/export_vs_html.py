@@ -0,0 +1,78 @@
+"""Сравнение HTML-пути /view/{view} и потоковой выгрузки по скорости и пиковому RSS.
+
+    python -m benchmarks.export_vs_html --rows 500000
+"""
+import argparse
+import multiprocessing
+import time
+
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy import create_engine, text
+
+from benchmarks.common import SYNTHETIC_VIEW, build_synthetic_view, peak_rss_mb, sqlite_url
+import export
+
+
+def run_html(url: str, _):
+    # Путь print_data до пагинации: fetchall, словарь на строку, рендеринг всей страницы
+    engine = create_engine(url)
+    environment = Environment(loader=FileSystemLoader("templates"), autoescape=True)
+    environment.globals["static_url"] = lambda name: f"/static/{name}"
+    template = environment.get_template("data.html")
+    with engine.connect() as conn:
+        result = conn.execute(text(f"SELECT * FROM {SYNTHETIC_VIEW}"))
+        columns = result.keys()
+        data = [dict(zip(columns, row)) for row in result.fetchall()]
+        return len(template.render(data=data, columns=columns, view=SYNTHETIC_VIEW))
+
+
+def run_export(url: str, options):
+    fmt, compress = options
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=export.EXPORT_BATCH).execute(
+            text(f"SELECT * FROM {SYNTHETIC_VIEW}")
+        )
+        chunks = export.export_result(result, fmt)
+        if compress:
+            chunks = export.gzipped(chunks)
+        return sum(len(chunk) for chunk in chunks)
+
+
+def _measure(target, url, options, queue):
+    started = time.perf_counter()
+    size = target(url, options)
+    queue.put((time.perf_counter() - started, size, peak_rss_mb()))
+
+
+def measure(target, url, options=None):
+    # Каждый путь в отдельном процессе, иначе пиковый RSS накапливается
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(target, url, options, queue))
+    process.start()
+    outcome = queue.get()
+    process.join()
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--db", default="bench_export.db")
+    args = parser.parse_args()
+
+    build_synthetic_view(args.db, args.rows)
+    url = sqlite_url(args.db)
+    cases = [("html", run_html, None)]
+    for fmt in export.FORMATS:
+        cases.append((fmt, run_export, (fmt, False)))
+        cases.append((f"{fmt}+gzip", run_export, (fmt, True)))
+
+    print(f"{'path':<16}{'rows/s':>12}{'MB out':>10}{'peak RSS MB':>14}")
+    for name, target, options in cases:
+        seconds, size, rss = measure(target, url, options)
+        print(f"{name:<16}{args.rows / seconds:>12.0f}{size / 2 ** 20:>10.1f}{rss:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Сквозная нагрузка на main.app: для каждой роли вход -> главная -> /view/{view}.
+
+    python -m benchmarks.seed --clients 20000 --db bench_load.db
+    python -m benchmarks.load --db bench_load.db --concurrency 30 --duration 30 --output load.json
+    python -m benchmarks.load --url http://127.0.0.1:8000 --concurrency 100
+
+Без --url запускается uvicorn с одним воркером на базе из DATABASE_URL или --db.
+Виртуальные пользователи поровну делятся между ролями, каждый в цикле входит,
+открывает главную и --pages раз проходит по представлениям из ссылок на ней.
+Результат - JSON с коммитом, параметрами, объёмами данных и по каждому эндпоинту
+числом запросов и ошибок, req/s и перцентилями; первые --warmup секунд не учитываются.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import create_engine, inspect, text
+
+from benchmarks.common import sqlite_url, start_server, summarize
+
+ROLES = ["Клиент", "Организатор", "Технический персонал"]
+PASSWORD = "load-test"
+VIEW_LINK = re.compile(r"/view/(\w+)")
+
+
+def git_revision() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def table_counts(url: str) -> dict:
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            return {
+                table: conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+                for table in inspect(conn).get_table_names()
+            }
+    finally:
+        engine.dispose()
+
+
+class Recorder:
+
+    def __init__(self, warmup_until: float):
+        self.warmup_until = warmup_until
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, label: str, request, expected: int):
+        started = time.perf_counter()
+        try:
+            response = await request()
+            status = response.status_code
+        except httpx.HTTPError as exc:
+            response, status = None, type(exc).__name__
+        if started < self.warmup_until:
+            return response
+        if status == expected:
+            self.latencies[label].append(time.perf_counter() - started)
+        else:
+            self.errors[label][str(status)] += 1
+        return response if status == expected else None
+
+
+def user_form(number: int) -> dict:
+    return {"username": f"load{number}", "password": PASSWORD, "role": ROLES[number % len(ROLES)]}
+
+
+async def virtual_user(base: str, number: int, recorder: Recorder, deadline: float, pages: int, limit: int):
+    form = user_form(number)
+    while time.perf_counter() < deadline:
+        # Новая сессия на каждый круг: вход входит в измеряемый сценарий
+        async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+            if await recorder.call("POST /login", lambda: client.post("/login", data=form), 303) is None:
+                continue
+            home = await recorder.call("GET /", lambda: client.get("/"), 200)
+            if home is None:
+                continue
+            views = list(dict.fromkeys(VIEW_LINK.findall(home.text)))
+            for _ in range(pages):
+                for view in views:
+                    if time.perf_counter() >= deadline:
+                        return
+                    await recorder.call(
+                        f"GET /view/{view}", lambda view=view: client.get(f"/view/{view}", params={"limit": limit}), 200
+                    )
+
+
+async def run(base: str, concurrency: int, duration: float, warmup: float, pages: int, limit: int):
+    # Пользователи регистрируются до начала замера; повторная регистрация отвечает 400
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        for number in range(concurrency):
+            await client.post("/register", data=user_form(number))
+    started = time.perf_counter()
+    recorder = Recorder(started + warmup)
+    await asyncio.gather(*(
+        virtual_user(base, number, recorder, started + warmup + duration, pages, limit)
+        for number in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started - warmup
+    endpoints = {}
+    for label in sorted(set(recorder.latencies) | set(recorder.errors)):
+        stats = summarize(recorder.latencies[label], elapsed)
+        stats["errors"] = dict(recorder.errors[label])
+        endpoints[label] = stats
+    total = summarize([latency for values in recorder.latencies.values() for latency in values], elapsed)
+    total["errors"] = sum(sum(errors.values()) for errors in recorder.errors.values())
+    return {"elapsed_s": elapsed, "endpoints": endpoints, "total": total}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="адрес уже запущенного сервера")
+    parser.add_argument("--db", default="bench_load.db", help="файл SQLite, если DATABASE_URL не задан")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="запустить сервер с DB_ASYNC=1")
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--pages", type=int, default=5, help="проходов по представлениям на один вход")
+    parser.add_argument("--limit", type=int, default=500, help="размер страницы представления")
+    parser.add_argument("--output", help="файл для JSON; без него JSON печатается в stdout")
+    args = parser.parse_args()
+
+    url = os.environ.get("DATABASE_URL", sqlite_url(args.db))
+    process = None
+    base = args.url
+    if base is None:
+        process, base = start_server(args.port, DATABASE_URL=url, DB_ASYNC="1" if args.use_async else "0")
+    try:
+        result = asyncio.run(run(base, args.concurrency, args.duration, args.warmup, args.pages, args.limit))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "dialect": url.split(":", 1)[0],
+            "tables": table_counts(url),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "port")},
+        },
+        **result,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"{'endpoint':<48}{'req':>8}{'err':>6}{'req/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}")
+        for label, stats in {**result["endpoints"], "total": result["total"]}.items():
+            errors = stats["errors"] if isinstance(stats["errors"], int) else sum(stats["errors"].values())
+            print(f"{label:<48}{stats['requests']:>8}{errors:>6}{stats['rps']:>9.1f}"
+                  f"{stats['p50_ms']:>8.1f}{stats['p95_ms']:>8.1f}{stats['p99_ms']:>8.1f}")
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Задержка /view/{view} во время одновременного входа большой группы.
+
+    python -m benchmarks.login_burst --logins 200
+
+Сервер запускается с HASH_EXECUTOR=inline (bcrypt в общем threadpool, как было),
+thread и process. Для каждого режима печатаются p50/p99 страницы представления
+без нагрузки и во время волны входов, а также число входов, отбитых 503.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+from passlib.context import CryptContext
+from sqlalchemy import column, create_engine, insert, table, text
+
+from benchmarks.common import SYNTHETIC_VIEW, build_synthetic_view, sqlite_url, start_server, summarize
+
+users = table("users", column("username"), column("hashed_password"), column("role"))
+
+
+def seed_users(url: str, count: int):
+    rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    hashed = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash("secret")
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM users"))
+        conn.execute(insert(users), [
+            {"username": f"user{i}", "hashed_password": hashed, "role": "Организатор"} for i in range(count + 1)
+        ])
+    engine.dispose()
+
+
+async def view_loop(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get(f"/view/{SYNTHETIC_VIEW}?limit=0")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(base: str, logins: int, quiet_seconds: float):
+    async with httpx.AsyncClient(base_url=base, timeout=120) as viewer:
+        await viewer.post("/login", data={"username": "user0", "password": "secret"})
+
+        quiet = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(view_loop(viewer, stop, quiet))
+        await asyncio.sleep(quiet_seconds)
+        stop.set()
+        await task
+
+        busy = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(view_loop(viewer, stop, busy))
+        async with httpx.AsyncClient(base_url=base, timeout=120) as crowd:
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                crowd.post("/login", data={"username": f"user{i}", "password": "secret"})
+                for i in range(1, logins + 1)
+            ))
+            burst = time.perf_counter() - started
+        stop.set()
+        await task
+
+    statuses = [response.status_code for response in responses]
+    return summarize(quiet, quiet_seconds), summarize(busy, burst), statuses.count(503), burst
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--quiet-seconds", type=float, default=3)
+    parser.add_argument("--db", default="bench_login.db")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    build_synthetic_view(args.db, args.rows)
+    url = sqlite_url(args.db)
+    print(f"{'executor':<10}{'quiet p50':>10}{'quiet p99':>10}{'burst p50':>10}{'burst p99':>10}{'503':>6}{'burst s':>9}")
+    for executor in ("inline", "thread", "process"):
+        process, base = start_server(args.port, DATABASE_URL=url, HASH_EXECUTOR=executor)
+        try:
+            seed_users(url, args.logins)
+            quiet, busy, rejected, burst = asyncio.run(run(base, args.logins, args.quiet_seconds))
+            print(f"{executor:<10}{quiet['p50_ms']:>10.1f}{quiet['p99_ms']:>10.1f}"
+                  f"{busy['p50_ms']:>10.1f}{busy['p99_ms']:>10.1f}{rejected:>6}{burst:>9.1f}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
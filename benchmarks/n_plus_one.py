@@ -0,0 +1,132 @@
+"""Поиск N+1: каждый эндпоинт вызывается на данных двух размеров, число SQL на запрос
+берётся из заголовка Server-Timing. Если на большем наборе запросов больше, эндпоинт
+считается растущим с объёмом ответа и скрипт завершается с кодом 1.
+
+    python -m benchmarks.n_plus_one
+    python -m benchmarks.n_plus_one --sizes 3 30
+
+Для сравнения печатается число SQL при сериализации тех же объектов с ленивой
+загрузкой связей (без профиля).
+"""
+import argparse
+import os
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from benchmarks.common import sqlite_url
+
+FORM = {"username": "bench-n1", "password": "bench-n1", "role": "Организатор"}
+
+
+def build(repository, size: int) -> dict:
+    # Заезд с size результатами по size кругов и клиент с size заездами и бронированиями
+    db = repository.database.SessionLocal()
+    try:
+        with repository.unit_of_work(db):
+            clients = repository.clients.create_many(db, [
+                {"name": f"n1-{size}-{i}", "email": f"n1-{size}-{i}@example.com", "registration_date": date(2024, 1, 1)}
+                for i in range(size)
+            ])
+            karts = repository.karts.create_many(db, [
+                {"brand": f"n1-{size}-{i}", "technical_condition": "ok"} for i in range(size)
+            ])
+            started = datetime(2024, 6, 1, 10, 0)
+            races = repository.races.create_many(db, [
+                {"race_datetime": started + timedelta(hours=i), "participant_count": size, "duration": timedelta(minutes=10)}
+                for i in range(size)
+            ])
+            results = repository.race_results.create_many(db, [
+                {"race_datetime": races[0].race_datetime, "race_position": i + 1, "client_id": clients[i].client_id,
+                 "race_id": races[0].race_id, "kart_id": karts[i].kart_id}
+                for i in range(size)
+            ] + [
+                {"race_datetime": race.race_datetime, "race_position": 1, "client_id": clients[0].client_id,
+                 "race_id": race.race_id, "kart_id": karts[i].kart_id}
+                for i, race in enumerate(races[1:], 1)
+            ])
+            repository.lap_times.create_many(db, [
+                {"result_id": result.result_id, "lap_time": timedelta(seconds=40 + lap), "lap_number": lap + 1}
+                for result in results for lap in range(size)
+            ])
+            repository.bookings.create_many(db, [
+                {"booking_datetime": started + timedelta(days=i), "booking_type": "Заезд", "client_id": clients[0].client_id}
+                for i in range(size)
+            ])
+        return {"race_id": races[0].race_id, "client_id": clients[0].client_id}
+    finally:
+        db.close()
+
+
+def checks(repository, schemas):
+    # (путь, ключ id, сериализация без профиля для сравнения)
+    return [
+        ("/api/races/{race_id}", "race_id",
+         lambda db, id: schemas.RaceDetail.model_validate(repository.races.get(db, id), from_attributes=True)),
+        ("/api/clients/{client_id}/history", "client_id",
+         lambda db, id: schemas.ClientHistory.model_validate(repository.clients.get(db, id), from_attributes=True)),
+    ]
+
+
+def queries(response) -> int:
+    match = re.search(r'queries;desc="(\d+)"', response.headers.get("server-timing", ""))
+    return int(match.group(1)) if match else 0
+
+
+def lazy_queries(database, serialize, id: int) -> int:
+    count = [0]
+
+    def capture(*args):
+        count[0] += 1
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+    db = database.SessionLocal()
+    try:
+        serialize(db, id)
+    finally:
+        db.close()
+        event.remove(database.engine, "before_cursor_execute", capture)
+    return count[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs=2, default=(2, 20))
+    parser.add_argument("--db", default="bench_n_plus_one.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ.setdefault("DATABASE_URL", sqlite_url(args.db))
+    from fastapi.testclient import TestClient
+    import database, main as app_main, repository, schemas
+
+    database.migrate()
+    datasets = [build(repository, size) for size in args.sizes]
+    client = TestClient(app_main.app)
+    client.post("/register", data=FORM)
+    client.post("/login", data=FORM)
+
+    failed = []
+    small, large = args.sizes
+    print(f"{'endpoint':<36}{f'SQL n={small}':>10}{f'SQL n={large}':>10}{'lazy':>12}  status")
+    for path, key, serialize in checks(repository, schemas):
+        counts = []
+        for dataset in datasets:
+            response = client.get(path.format(**dataset))
+            response.raise_for_status()
+            counts.append(queries(response))
+        lazy = [lazy_queries(database, serialize, dataset[key]) for dataset in datasets]
+        status = "ok" if counts[1] <= counts[0] else "N+1"
+        if status != "ok":
+            failed.append(path)
+        print(f"{path:<36}{counts[0]:>10}{counts[1]:>10}{f'{lazy[0]}->{lazy[1]}':>12}  {status}")
+    if failed:
+        print("число запросов растёт с объёмом ответа:", ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Регрессия планов запросов: синтетические данные во всех таблицах, EXPLAIN и время
+каждого запроса ролевых представлений и функций crud.get_*.
+
+    python -m benchmarks.query_plans --clients 20000 --budget-ms 50
+    DATABASE_URL=postgresql://... python -m benchmarks.query_plans --output plans.json
+
+Код возврата 1, если запрос читает таблицу последовательным сканированием или его p95
+превышает бюджет. В SQLite обход таблицы по rowid для первой страницы с ORDER BY ключ
+LIMIT выглядит как SCAN, поэтому для первых страниц такой SCAN там допускается; обход
+материализованного подзапроса или сортировка во временном B-дереве - нет. Вторая
+страница (keyset) должна искать по индексу.
+В SQLite вместо ролевых представлений создаются упрощённые из benchmarks.seed;
+отсутствие представления в базе - ошибка, материализованные копии проверяются, если
+они есть. Таблицы перед заполнением очищаются - запускать на отдельной базе;
+--no-seed проверяет уже заполненную базу.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import event, inspect, text
+
+from benchmarks.common import sqlite_url
+from benchmarks.seed import create_stand_in_views, reset, seed_schema
+
+
+def crud_checks(crud, clients: int):
+    # (имя, функция от сессии, первая страница по первичному ключу с LIMIT). Списки
+    # crud.get_* проверяются на первой странице: глубокие страницы OFFSET читают все
+    # пропущенные строки, для них есть keyset-страницы представлений
+    some = clients // 2
+    return [
+        ("get_user_by_username", lambda db: crud.get_user_by_username(db, f"user{some}"), False),
+        ("get_client", lambda db: crud.get_client(db, some), False),
+        ("get_booking", lambda db: crud.get_booking(db, some), False),
+        ("get_race", lambda db: crud.get_race(db, some // 5), False),
+        ("get_kart", lambda db: crud.get_kart(db, 5), False),
+        ("get_race_result", lambda db: crud.get_race_result(db, some), False),
+        ("get_lap_time", lambda db: crud.get_lap_time(db, some), False),
+        ("get_maintenance", lambda db: crud.get_maintenance(db, 5), False),
+        ("get_clients", lambda db: crud.get_clients(db, limit=10), True),
+        ("get_bookings", lambda db: crud.get_bookings(db, limit=10), True),
+        ("get_races", lambda db: crud.get_races(db, limit=10), True),
+        ("get_karts", lambda db: crud.get_karts(db, limit=10), True),
+        ("get_race_results", lambda db: crud.get_race_results(db, limit=10), True),
+        ("get_lap_times", lambda db: crud.get_lap_times(db, limit=10), True),
+        ("get_maintenances", lambda db: crud.get_maintenances(db, limit=10), True),
+        ("race_results.get_many", lambda db: crud.repository.race_results.get_many(db, range(some, some + 50)), False),
+        # Ленивые загрузки связей: по ним же идёт каскадное удаление
+        ("client.bookings", lambda db: crud.get_client(db, some).bookings, False),
+        ("client.race_results", lambda db: crud.get_client(db, some).race_results, False),
+        ("race.race_results", lambda db: crud.get_race(db, some // 5).race_results, False),
+        ("kart.maintenances", lambda db: crud.get_kart(db, 5).maintenances, False),
+        ("race_result.lap_times", lambda db: crud.get_race_result(db, some).lap_times, False),
+    ]
+
+
+def view_checks(database, pagination, matviews, views):
+    views.load(database.engine)
+    inspector = inspect(database.engine)
+    existing = {name.lower() for name in inspector.get_view_names() + inspector.get_table_names()}
+    checks, missing, skipped = [], [], []
+    for name, view in views.REGISTRY.items():
+        if not view.available:
+            missing.append(name)
+            continue
+        for source in dict.fromkeys([name, matviews.table_for(name)]):
+            if source.lower() not in existing:
+                # Материализованная копия есть, только если её включили
+                skipped.append(source)
+                continue
+
+            def first(db, view=view, source=source):
+                query, params = view.query(pagination.PAGE_SIZE, source=source)
+                return db.execute(query, params).mappings().all()
+
+            # Курсор второй страницы берётся заранее: в её план не попадает запрос первой
+            db = database.SessionLocal()
+            try:
+                rows = first(db)
+            finally:
+                db.close()
+            checks.append((f"{source} page 1", first, True))
+            if not rows:
+                continue
+            after = [rows[-1][key] for key in view.keys]
+
+            def second(db, view=view, source=source, after=after):
+                query, params = view.query(pagination.PAGE_SIZE, after, source)
+                return db.execute(query, params).all()
+
+            checks.append((f"{source} page 2", second, False))
+    return checks, missing, skipped
+
+
+def explain(conn, statement: str, parameters):
+    # Возвращает текст плана, таблицы, прочитанные последовательным сканированием, и те
+    # из них, что не допускаются и на первой странице
+    if conn.dialect.name == "postgresql":
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        scans, nodes = [], [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                scans.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        return json.dumps(plan, ensure_ascii=False), scans, scans
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    details = [row[-1] for row in rows]
+    scans = [
+        detail.split()[1] for detail in details
+        if detail.startswith("SCAN ") and "USING" not in detail and "CONSTANT" not in detail
+    ]
+    # Сортировка во временном B-дереве читает всё до LIMIT; подзапрос (представление с
+    # GROUP BY) материализуется целиком
+    if any(detail.startswith("USE TEMP B-TREE FOR") and "ORDER BY" in detail for detail in details):
+        return "\n".join(details), scans, scans
+    materialized = {
+        detail.split()[1] for detail in details if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+    }
+    return "\n".join(details), scans, [scan for scan in scans if scan in materialized]
+
+
+def run_check(database, name: str, function, first_page: bool, repeat: int, budget_ms: float):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+    db = database.SessionLocal()
+    try:
+        function(db)
+    finally:
+        db.close()
+        event.remove(database.engine, "before_cursor_execute", capture)
+
+    plans, scans, flagged = [], [], []
+    waived = first_page and database.engine.dialect.name == "sqlite"
+    with database.engine.connect() as conn:
+        for statement, parameters in statements:
+            plan, scanned, unbounded = explain(conn, statement, parameters)
+            plans.append({"sql": statement, "plan": plan})
+            scans.extend(scanned)
+            flagged.extend(unbounded if waived else scanned)
+
+    timings = []
+    for _ in range(repeat):
+        db = database.SessionLocal()
+        started = time.perf_counter()
+        try:
+            function(db)
+        finally:
+            db.close()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+
+    problems = []
+    if flagged:
+        problems.append("seq scan: " + ", ".join(sorted(set(flagged))))
+    if p95 > budget_ms:
+        problems.append(f"p95 {p95:.1f} ms > {budget_ms:.0f} ms")
+    return {"name": name, "p95_ms": p95, "scans": sorted(set(scans)), "problems": problems, "statements": plans}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=50)
+    parser.add_argument("--db", default="bench_plans.db")
+    parser.add_argument("--no-seed", action="store_true")
+    parser.add_argument("--output", help="файл для JSON с планами и замерами")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", sqlite_url(args.db))
+    import database, crud, pagination, matviews, views
+
+    if not args.no_seed:
+        reset(database)
+        started = time.perf_counter()
+        seed_schema(database, args.clients)
+        print(f"seeded {args.clients} clients in {time.perf_counter() - started:.1f} s")
+    create_stand_in_views(database)
+    with database.engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    checks, missing, skipped = view_checks(database, pagination, matviews, views)
+    checks = crud_checks(crud, args.clients) + checks
+    results = [run_check(database, name, function, first_page, args.repeat, args.budget_ms)
+               for name, function, first_page in checks]
+
+    print(f"{'query':<48}{'p95 ms':>9}  {'seq scans':<24}status")
+    for result in results:
+        status = "; ".join(result["problems"]) or "ok"
+        print(f"{result['name']:<48}{result['p95_ms']:>9.2f}  {','.join(result['scans']) or '-':<24}{status}")
+    if skipped:
+        print("материализованных копий нет в базе, пропущены:", ", ".join(skipped))
+    if missing:
+        print("представлений нет в базе:", ", ".join(missing))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump({"dialect": database.engine.dialect.name, "results": results, "missing": missing,
+                       "skipped": skipped}, output, ensure_ascii=False, indent=2)
+
+    failed = [result["name"] for result in results if result["problems"]] + missing
+    if failed:
+        print(f"регрессии: {len(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Маршрутизация чтения на реплики на двух файлах SQLite. Реплику изображает копия
+основной базы, которая не получает новых записей, поэтому по ответам видно, откуда
+прочитаны данные.
+
+    python -m benchmarks.replica_routing
+    python -m benchmarks.replica_routing --requests 200
+
+Проверяется: пока файла реплики нет, health check держит её вне ротации и всё читается
+с основной БД; после появления реплики страницы /view/{view} читаются с неё; клиент,
+только что записавший результат, видит его (cookie read-your-writes), а другой клиент
+читает неизменную копию. При нарушении скрипт завершается с кодом 1.
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import scrape, sqlite_url, start_server
+
+VIEW = "Organizer_Race_Schedule_Results"
+CHECK_INTERVAL = 0.3
+READ_YOUR_WRITES = 2
+
+
+def routed(base: str) -> dict:
+    text = scrape(base)
+    return {
+        target: float(value)
+        for target, value in re.findall(r'db_routed_statements_total\{target="(\w+)"\} ([\d.]+)', text)
+    }
+
+
+def delta(before: dict, after: dict) -> dict:
+    return {target: int(after.get(target, 0) - before.get(target, 0)) for target in ("primary", "replica")}
+
+
+def login(base: str, username: str) -> httpx.Client:
+    client = httpx.Client(base_url=base)
+    form = {"username": username, "password": username, "role": "Организатор"}
+    client.post("/register", data=form)
+    if client.post("/login", data=form).status_code != 303:
+        raise RuntimeError(f"Не удалось войти как {username}")
+    return client
+
+
+def read_views(client: httpx.Client, requests: int):
+    for _ in range(requests):
+        # limit=0 - потоковая выдача мимо кэша страниц, каждый запрос читает из БД
+        client.get(f"/view/{VIEW}?limit=0").raise_for_status()
+
+
+def results(client: httpx.Client, race_id: int) -> int:
+    response = client.get(f"/api/races/{race_id}")
+    response.raise_for_status()
+    return len(response.json()["race_results"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="replica-routing-")
+    primary = os.path.join(workdir, "primary.db")
+    replica = os.path.join(workdir, "replica", "replica.db")
+    os.environ["DATABASE_URL"] = sqlite_url(primary)
+    import database
+    from benchmarks.seed import create_stand_in_views, seed_schema
+
+    database.migrate()
+    seed_schema(database, args.clients)
+    create_stand_in_views(database)
+    with database.engine.connect() as conn:
+        race = conn.execute(database.RaceResult.__table__.select().limit(1)).first()
+    database.engine.dispose()
+
+    failed = []
+
+    def expect(name: str, ok: bool, detail):
+        print(f"{name:<52}{detail!s:<32}{'ok' if ok else 'FAIL'}")
+        if not ok:
+            failed.append(name)
+
+    process, base = start_server(
+        args.port, DATABASE_URL=sqlite_url(primary), DATABASE_REPLICA_URLS=sqlite_url(replica),
+        DB_REPLICA_CHECK_INTERVAL=str(CHECK_INTERVAL), DB_READ_YOUR_WRITES=str(READ_YOUR_WRITES),
+    )
+    try:
+        writer, reader = login(base, "bench-writer"), login(base, "bench-reader")
+        time.sleep(READ_YOUR_WRITES)
+
+        before = routed(base)
+        read_views(reader, args.requests)
+        counts = delta(before, routed(base))
+        expect("replica down: reads go to the primary", counts["replica"] == 0, counts)
+
+        os.makedirs(os.path.dirname(replica))
+        shutil.copy(primary, replica)
+        time.sleep(CHECK_INTERVAL * 3)
+        before = routed(base)
+        started = time.perf_counter()
+        read_views(reader, args.requests)
+        elapsed = time.perf_counter() - started
+        counts = delta(before, routed(base))
+        expect("replica up: view reads go to the replica", counts["replica"] >= args.requests and not counts["primary"], counts)
+        print(f"  {args.requests / elapsed:.0f} req/s")
+
+        initial = results(reader, race.race_id)
+        writer.post("/api/race_results/bulk", json=[{
+            "race_datetime": race.race_datetime.isoformat(), "race_position": 99,
+            "client_id": race.client_id, "race_id": race.race_id, "kart_id": race.kart_id,
+        }]).raise_for_status()
+        expect("writer reads its own write", results(writer, race.race_id) == initial + 1,
+               f"{initial} -> {results(writer, race.race_id)}")
+        expect("other client reads the replica copy", results(reader, race.race_id) == initial,
+               results(reader, race.race_id))
+        time.sleep(READ_YOUR_WRITES + 0.5)
+        expect("writer back on the replica after the window", results(writer, race.race_id) == initial,
+               results(writer, race.race_id))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Фоновые отчёты через /api/jobs на засеянной базе: время построения отчётов в пуле
+процессов и задержка обычных запросов, пока отчёт строится.
+
+    python -m benchmarks.report_jobs
+    python -m benchmarks.report_jobs --clients 20000 --laps-per-result 12
+
+Проверяется: одновременные одинаковые запросы отчёта получают одно задание, прогресс
+растёт до 100%, результат отдаётся NDJSON, отменённое задание не строится, а запросы
+API во время отчёта отвечают без ожидания отчёта. При нарушении скрипт завершается
+с кодом 1.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import sqlite_url, start_server, summarize
+
+
+async def probe_latency(client: httpx.AsyncClient, until) -> list:
+    # Лёгкий запрос API, пока until() ложно
+    latencies = []
+    while not until():
+        started = time.perf_counter()
+        (await client.get("/api/availability/check", params={
+            "booking_datetime": "2030-01-01T12:00", "booking_type": "Заезд",
+        })).raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def run(base: str, submissions: int) -> list:
+    failed = []
+
+    def expect(name: str, ok: bool, detail):
+        print(f"{name:<52}{detail!s:<32}{'ok' if ok else 'FAIL'}")
+        if not ok:
+            failed.append(name)
+
+    async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+        form = {"username": "bench", "password": "bench", "role": "Организатор"}
+        await client.post("/register", data=form)
+        await client.post("/login", data=form)
+
+        idle = summarize(*await timed(probe_latency(client, deadline(2))))
+        print(f"idle API p50 {idle['p50_ms']:.1f} ms, p99 {idle['p99_ms']:.1f} ms")
+
+        for report in ("season_standings", "kart_wear"):
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/api/jobs", json={"report": report}) for _ in range(submissions)
+            ))
+            ids = {response.json()["id"] for response in responses}
+            expect(f"{report}: {submissions} submissions, one job", len(ids) == 1, len(ids))
+            job_id = ids.pop()
+            done = {}
+            progress = []
+
+            async def poll():
+                while True:
+                    status = (await client.get(f"/api/jobs/{job_id}")).json()
+                    progress.append(status["progress"]["percent"] or 0)
+                    if status["status"] not in ("queued", "running"):
+                        done.update(status)
+                        return
+                    await asyncio.sleep(0.1)
+
+            (latencies, elapsed), _ = await asyncio.gather(timed(probe_latency(client, lambda: done)), poll())
+            seconds = time.perf_counter() - started
+            busy = summarize(latencies, elapsed)
+            expect(f"{report}: done", done.get("status") == "done", done.get("status"))
+            expect(f"{report}: progress reaches 100%", progress == sorted(progress) and progress[-1] == 100,
+                   f"{len(progress)} polls")
+            result = await client.get(f"/api/jobs/{job_id}/result")
+            lines = result.text.splitlines()
+            expect(f"{report}: NDJSON result", result.status_code == 200 and len(lines) == done.get("rows"),
+                   f"{len(lines)} rows, {len(result.content) / 1024:.0f} KB")
+            print(f"  {seconds:.2f} s; API during the job p50 {busy['p50_ms']:.1f} ms, p99 {busy['p99_ms']:.1f} ms")
+
+        job_id = (await client.post("/api/jobs", json={"report": "season_standings", "params": {"season": 2023}})).json()["id"]
+        await client.delete(f"/api/jobs/{job_id}")
+        status = (await client.get(f"/api/jobs/{job_id}", params={"wait": 30})).json()["status"]
+        expect("cancelled job", status == "cancelled", status)
+    return failed
+
+
+def deadline(seconds: float):
+    end = time.perf_counter() + seconds
+    return lambda: time.perf_counter() >= end
+
+
+async def timed(coroutine) -> tuple:
+    started = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--laps-per-result", type=int, default=10)
+    parser.add_argument("--submissions", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8769)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="report-jobs-")
+    path = os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = sqlite_url(path)
+    import database
+    from benchmarks.seed import seed_schema
+
+    database.migrate()
+    counts = seed_schema(database, args.clients, laps_per_result=args.laps_per_result)
+    database.engine.dispose()
+    print(", ".join(f"{table} {count}" for table, count in counts.items()))
+
+    process, base = start_server(args.port, DATABASE_URL=sqlite_url(path), JOB_RESULT_DIR=os.path.join(workdir, "jobs"))
+    try:
+        failed = asyncio.run(run(base, args.submissions))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
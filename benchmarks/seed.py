@@ -0,0 +1,275 @@
+"""Генератор синтетических данных для схемы database.py (SQLite и Postgres).
+
+    python -m benchmarks.seed --clients 100000 --races 50000 --laps-per-result 12
+    DATABASE_URL=postgresql://... python -m benchmarks.seed --clients 200000 --reset
+
+Объёмы задаются по таблицам, данные детерминированы по --seed, поэтому одна и та же
+командная строка даёт одну и ту же базу. Строки пишутся пачками через executemany
+(insertmanyvalues в Postgres). На SQLite недостающие ролевые представления создаются
+упрощёнными заменами, чтобы страницы /view/{view} можно было нагружать локально.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+from benchmarks.common import sqlite_url
+
+BRANDS = ["Sodi", "CRG", "Tony Kart", "Birel", "OTK"]
+BOOKING_TYPES = ["Заезд", "Тренировка", "Корпоратив", "Турнир"]
+WORKS = ["Замена цепи", "Замена шин", "Регулировка тормозов", "Плановое ТО", "Замена свечи"]
+ROLES = ["Клиент", "Организатор", "Технический персонал"]
+
+# Упрощённые определения представлений для SQLite; колонки покрывают
+# ключи и колонки разбиения из views.VIEWS
+STAND_IN_VIEWS = {
+    "Client_Race_Info": (
+        "SELECT rr.result_id, rr.client_id, rr.race_id, rr.race_datetime, rr.race_position, rr.kart_id, k.brand "
+        "FROM race_result rr JOIN kart k ON k.kart_id = rr.kart_id"
+    ),
+    "Client_Booking_History": (
+        "SELECT b.booking_id, b.client_id, b.booking_datetime, b.booking_type FROM booking b"
+    ),
+    "Organizer_Race_Schedule_Results": (
+        "SELECT rr.result_id, r.race_id, r.race_datetime, r.participant_count, rr.client_id, c.name, rr.race_position "
+        "FROM race r JOIN race_result rr ON rr.race_id = r.race_id JOIN client c ON c.client_id = rr.client_id"
+    ),
+    "Organizer_Race_Booking_Overview": (
+        "SELECT b.booking_id, b.booking_datetime, b.booking_type, c.client_id, c.name, c.email, c.phone "
+        "FROM booking b JOIN client c ON c.client_id = b.client_id"
+    ),
+    "Technical_Kart_Status_Maintenance": (
+        "SELECT m.maintenance_id, k.kart_id, k.brand, k.technical_condition, m.maintenance_date, m.work_description "
+        "FROM maintenance m JOIN kart k ON k.kart_id = m.kart_id"
+    ),
+    # Коррелированный MAX вместо GROUP BY: представление не материализуется целиком,
+    # keyset-страница ищет карты по первичному ключу
+    "Technical_Kart_Last_Race": (
+        "SELECT k.kart_id, k.brand, k.technical_condition, (SELECT MAX(rr.race_datetime) FROM race_result rr "
+        "WHERE rr.kart_id = k.kart_id) AS last_race_datetime FROM kart k"
+    ),
+}
+
+
+class Writer:
+    # Буфер строк одной таблицы, сбрасывается пачками в открытую транзакцию;
+    # batch=0 - только явный flush()
+
+    def __init__(self, conn, model, batch: int):
+        self.conn = conn
+        self.table = model.__table__
+        self.batch = batch
+        self.rows = []
+        self.count = 0
+
+    def add(self, row: dict):
+        self.rows.append(row)
+        if self.batch and len(self.rows) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.conn.execute(self.table.insert(), self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+
+def seed_schema(
+        database,
+        clients: int,
+        karts: int = None,
+        races: int = None,
+        per_race: int = 8,
+        laps_per_result: int = 10,
+        bookings_per_client: float = 2,
+        maintenance_per_kart: int = 20,
+        users: int = None,
+        seed: int = 42,
+        batch: int = 10000,
+) -> dict:
+    # Неуказанные объёмы считаются от числа клиентов; возвращает число строк по таблицам
+    rnd = random.Random(seed)
+    karts = karts or max(clients // 100, 10)
+    races = races or max(clients // 5, 10)
+    users = clients if users is None else users
+    start = datetime(2023, 1, 1)
+    days = 730
+    counts = {}
+
+    with database.engine.begin() as conn:
+        writer = Writer(conn, database.User, batch)
+        for user_id in range(1, users + 1):
+            writer.add({
+                "id": user_id, "username": f"user{user_id}", "hashed_password": "!",
+                "role": ROLES[0] if user_id % 20 else rnd.choice(ROLES[1:]),
+            })
+        writer.flush()
+        counts["users"] = writer.count
+
+        writer = Writer(conn, database.Client, batch)
+        for client_id in range(1, clients + 1):
+            writer.add({
+                "client_id": client_id, "name": f"Клиент {client_id}", "phone": f"+7900{client_id:07d}",
+                "email": f"client{client_id}@example.com",
+                "registration_date": (start + timedelta(days=rnd.randrange(days))).date(),
+                "club_driver": rnd.random() < 0.1,
+            })
+        writer.flush()
+        counts["client"] = writer.count
+
+        # Темп карта и уровень пилота задают среднее время круга
+        kart_pace = {kart_id: rnd.gauss(0, 0.6) for kart_id in range(1, karts + 1)}
+        skill = {}
+        writer = Writer(conn, database.Kart, batch)
+        for kart_id in range(1, karts + 1):
+            writer.add({
+                "kart_id": kart_id, "brand": rnd.choice(BRANDS),
+                "technical_condition": "требует ремонта" if rnd.random() < 0.05 else "исправен",
+                "last_maintenance_date": (start + timedelta(days=rnd.randrange(days))).date(),
+            })
+        writer.flush()
+        counts["kart"] = writer.count
+
+        race_writer = Writer(conn, database.Race, 0)
+        result_writer = Writer(conn, database.RaceResult, 0)
+        lap_writer = Writer(conn, database.LapTime, 0)
+        result_id = lap_time_id = 0
+        for race_id in range(1, races + 1):
+            # Заезды идут в часы работы трассы, по несколько в день
+            race_datetime = start + timedelta(
+                days=race_id * days // races, hours=rnd.randrange(10, 22), minutes=rnd.choice([0, 15, 30, 45])
+            )
+            race_writer.add({
+                "race_id": race_id, "race_datetime": race_datetime, "participant_count": per_race,
+                "duration": timedelta(minutes=rnd.choice([10, 15, 20])),
+            })
+            entries = []
+            for kart_id in rnd.sample(range(1, karts + 1), min(per_race, karts)):
+                client_id = rnd.randint(1, clients)
+                pace = 42 + kart_pace[kart_id] + skill.setdefault(client_id, rnd.gauss(0, 1.5))
+                laps = [max(rnd.gauss(pace, 0.7), 35) for _ in range(laps_per_result)]
+                entries.append((sum(laps), client_id, kart_id, laps))
+            entries.sort()
+            for position, (_, client_id, kart_id, laps) in enumerate(entries, start=1):
+                result_id += 1
+                result_writer.add({
+                    "result_id": result_id, "race_datetime": race_datetime, "race_position": position,
+                    "client_id": client_id, "race_id": race_id, "kart_id": kart_id,
+                })
+                for lap_number, seconds in enumerate(laps, start=1):
+                    lap_time_id += 1
+                    lap_writer.add({
+                        "lap_time_id": lap_time_id, "result_id": result_id,
+                        "lap_time": timedelta(milliseconds=round(seconds * 1000)), "lap_number": lap_number,
+                    })
+            # Родительские строки уходят раньше дочерних
+            if len(lap_writer.rows) >= batch:
+                race_writer.flush()
+                result_writer.flush()
+                lap_writer.flush()
+        race_writer.flush()
+        result_writer.flush()
+        lap_writer.flush()
+        counts["race"], counts["race_result"], counts["lap_time"] = race_writer.count, result_writer.count, lap_writer.count
+
+        writer = Writer(conn, database.Booking, batch)
+        for booking_id in range(1, int(clients * bookings_per_client) + 1):
+            writer.add({
+                "booking_id": booking_id,
+                "booking_datetime": start + timedelta(days=rnd.randrange(days), hours=rnd.randrange(10, 22)),
+                "booking_type": rnd.choice(BOOKING_TYPES), "client_id": rnd.randint(1, clients),
+            })
+        writer.flush()
+        counts["booking"] = writer.count
+
+        writer = Writer(conn, database.Maintenance, batch)
+        maintenance_id = 0
+        for kart_id in range(1, karts + 1):
+            for number in range(maintenance_per_kart):
+                maintenance_id += 1
+                writer.add({
+                    "maintenance_id": maintenance_id,
+                    "maintenance_date": (start + timedelta(days=number * days // maintenance_per_kart)).date(),
+                    "work_description": rnd.choice(WORKS), "kart_id": kart_id,
+                })
+        writer.flush()
+        counts["maintenance"] = writer.count
+
+        if conn.dialect.name == "postgresql":
+            # Ключи заданы явно, поэтому последовательности нужно догнать вручную
+            for table in database.Base.metadata.sorted_tables:
+                key = table.primary_key.columns.values()[0].name
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', '{key}'), "
+                    f"COALESCE((SELECT max({key}) FROM {table.name}), 1))"
+                ))
+    return counts
+
+
+def reset(database):
+    # Таблицы очищаются, а не пересоздаются: от них могут зависеть представления
+    database.migrate()
+    with database.engine.begin() as conn:
+        for table in reversed(database.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+
+def create_stand_in_views(database) -> list:
+    if database.engine.dialect.name != "sqlite":
+        return []
+    existing = {name.lower() for name in inspect(database.engine).get_view_names()}
+    created = []
+    with database.engine.begin() as conn:
+        for view, query in STAND_IN_VIEWS.items():
+            if view.lower() not in existing:
+                conn.execute(text(f"CREATE VIEW {view} AS {query}"))
+                created.append(view)
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--karts", type=int)
+    parser.add_argument("--races", type=int)
+    parser.add_argument("--per-race", type=int, default=8)
+    parser.add_argument("--laps-per-result", type=int, default=10)
+    parser.add_argument("--bookings-per-client", type=float, default=2)
+    parser.add_argument("--maintenance-per-kart", type=int, default=20)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--db", default="bench_seed.db", help="файл SQLite, если DATABASE_URL не задан")
+    parser.add_argument("--reset", action="store_true", help="очистить таблицы перед заполнением")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", sqlite_url(args.db))
+    import database
+
+    if args.reset:
+        reset(database)
+    else:
+        database.migrate()
+    started = time.perf_counter()
+    counts = seed_schema(
+        database, args.clients, args.karts, args.races, args.per_race, args.laps_per_result,
+        args.bookings_per_client, args.maintenance_per_kart, args.users, args.seed, args.batch,
+    )
+    elapsed = time.perf_counter() - started
+    with database.engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    views = create_stand_in_views(database)
+
+    total = sum(counts.values())
+    for table, count in counts.items():
+        print(f"{table:<14}{count:>12}")
+    print(f"{'total':<14}{total:>12}  {elapsed:.1f} s, {total / elapsed:.0f} rows/s")
+    if views:
+        print("созданы замены представлений:", ", ".join(views))
+
+
+if __name__ == "__main__":
+    main()
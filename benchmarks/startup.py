@@ -0,0 +1,101 @@
+"""Время старта: импорт main в чистом процессе и путь от запуска uvicorn до первого
+ответа (GET /login рендерит шаблон). Старт меряется с холодным и с тёплым кэшем байткода
+Jinja, а также при недоступной БД: сервер должен подняться и ответить.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --budget-ms 1500
+
+С --budget-ms скрипт завершается с кодом 1, если медиана до первого ответа больше бюджета.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import sqlite_url
+
+# Файл в несуществующем каталоге: соединение с такой БД не открывается
+UNREACHABLE_URL = "sqlite:////nonexistent/bench_startup.db"
+
+IMPORT_SCRIPT = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def import_seconds(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def first_response_seconds(port: int, env: dict, timeout: float = 30) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "critical"],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/login", timeout=1)
+                response.raise_for_status()
+                return time.perf_counter() - started
+            except httpx.TransportError:
+                time.sleep(0.02)
+        raise RuntimeError("Сервер не ответил")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name: str, timings: list):
+    print(f"{name:<34}{statistics.median(timings) * 1000:>10.0f}{min(timings) * 1000:>10.0f}{max(timings) * 1000:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="bench_startup.db")
+    parser.add_argument("--budget-ms", type=float, help="предел медианы до первого ответа")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    env = {**os.environ, "DATABASE_URL": sqlite_url(args.db), "DB_MIGRATE_ON_STARTUP": "0"}
+    subprocess.run([sys.executable, "migrate.py"], env=env, check=True, stdout=subprocess.DEVNULL)
+    cache_dir = tempfile.mkdtemp(prefix="jinja-cache-")
+    try:
+        print(f"{'':<34}{'median ms':>10}{'min':>10}{'max':>10}")
+        report("import main", [import_seconds(env) for _ in range(args.runs)])
+        report("import main (БД недоступна)", [
+            import_seconds({**env, "DATABASE_URL": UNREACHABLE_URL}) for _ in range(args.runs)
+        ])
+
+        cold = []
+        for _ in range(args.runs):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cold.append(first_response_seconds(args.port, {**env, "JINJA_CACHE_DIR": cache_dir}))
+        report("first response, cold templates", cold)
+        warm = [first_response_seconds(args.port, {**env, "JINJA_CACHE_DIR": cache_dir}) for _ in range(args.runs)]
+        report("first response, warm templates", warm)
+        report("first response (БД недоступна)", [
+            first_response_seconds(args.port, {**env, "JINJA_CACHE_DIR": cache_dir, "DATABASE_URL": UNREACHABLE_URL})
+            for _ in range(args.runs)
+        ])
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if args.budget_ms is not None and statistics.median(warm) * 1000 > args.budget_ms:
+        print(f"медиана до первого ответа больше {args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+
+import changes, database, replicas, views
+
+VIEW_CACHE_SIZE = 256
+VIEW_CACHE_TTL = 30
+# max(pk) исходных таблиц перечитывается не чаще раза в столько секунд
+VIEW_PROBE_INTERVAL = float(os.getenv("VIEW_PROBE_INTERVAL", "1"))
+# UPDATE/DELETE из других процессов не видны ни хукам, ни пробе, поэтому ETag
+# представления в любом случае меняется раз в столько секунд
+VIEW_ETAG_MAX_AGE = float(os.getenv("VIEW_ETAG_MAX_AGE", "60"))
+
+
+class TTLCache:
+    # LRU ограниченного размера, записи которого устаревают через ttl секунд
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                    self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[1] if item is not None else None
+
+    def invalidate(self, predicate) -> int:
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+view_cache = TTLCache(VIEW_CACHE_SIZE, VIEW_CACHE_TTL)
+invalidations = 0
+
+# Поколение представления растёт при каждой инвалидации. Результат запроса,
+# начатого до commit, не попадёт в кэш, если поколение успело смениться.
+_generations = {}
+_invalidated_at = {}
+_generations_lock = threading.Lock()
+
+
+def generation(view: str) -> int:
+    return _generations.get(view, 0)
+
+
+def page_key(view: str, user_id, after, limit: int):
+    return view, user_id, after, limit
+
+
+def store_page(key, page, seen_generation: int, from_replica: bool = False):
+    with _generations_lock:
+        if generation(key[0]) != seen_generation:
+            return
+        # Реплика могла ещё не получить commit, после которого кэш сброшен
+        if from_replica and time.monotonic() - _invalidated_at.get(key[0], float("-inf")) < replicas.MAX_LAG:
+            return
+        view_cache.set(key, page)
+
+
+def invalidate_views(views):
+    global invalidations
+    with _generations_lock:
+        for view in views:
+            _generations[view] = _generations.get(view, 0) + 1
+            _invalidated_at[view] = time.monotonic()
+        invalidations += view_cache.invalidate(lambda key: key[0] in views)
+
+
+@changes.subscribe
+def _on_commit(changed: dict):
+    tables = set(changed)
+    invalidate_views({name for name, view in views.REGISTRY.items() if view.tables & tables})
+
+
+# Версия представления для ETag: поколение из commit-хуков этого процесса и проба
+# max(pk) исходных таблиц, которая видит вставки из других воркеров и мимо сессии.
+# Идентификатор запуска меняет все ETag после перезапуска (шаблоны, поколения с нуля).
+BOOT_ID = secrets.token_hex(4)
+_probes = {}
+_probes_lock = threading.Lock()
+
+
+def _probe(tables) -> tuple:
+    now = time.monotonic()
+    tables = sorted(table for table in tables if table in database.Base.metadata.tables)
+    stale = [table for table in tables if now - _probes.get(table, (float("-inf"), None))[0] >= VIEW_PROBE_INTERVAL]
+    if stale:
+        columns = [
+            select(func.max(database.Base.metadata.tables[table].primary_key.columns[0])).scalar_subquery()
+            for table in stale
+        ]
+        with database.read_engine().connect() as conn:
+            values = conn.execute(select(*columns)).one()
+        with _probes_lock:
+            for table, value in zip(stale, values):
+                _probes[table] = (now, value)
+    return tuple(_probes[table][1] for table in tables)
+
+
+def view_etag(view, role: str, user_id, after, limit: int, freshness) -> str:
+    # Слабый ETag: тело одной версии отдаётся и сжатым, и нет
+    version = (
+        BOOT_ID, view.name, role, user_id, after, limit, generation(view.name), _probe(view.tables),
+        freshness and (freshness["refreshed_at"], freshness["stale"]), int(time.time() // VIEW_ETAG_MAX_AGE),
+    )
+    return f'W/"{hashlib.blake2b(repr(version).encode(), digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+def stats() -> dict:
+    return {**view_cache.stats(), "invalidations": invalidations}
@@ -0,0 +1,108 @@
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Отслеживание изменённых строк по таблицам в рамках транзакции сессии.
+# После commit подписчики получают словарь {таблица: [строки]}, где строка -
+# словарь значений колонок. None вместо списка означает, что затронутые строки
+# неизвестны (массовый UPDATE/DELETE по условию). Для колонок, зарегистрированных
+# через track_previous, изменённая строка передаётся ещё раз со старыми значениями.
+
+logger = logging.getLogger(__name__)
+
+_subscribers = []
+
+# Запросы с этой опцией сами сообщают изменённые строки через record()
+RECORDED_OPTION = "changes_recorded"
+
+# {таблица: колонки}, старые значения которых нужны подписчикам
+_tracked = {}
+
+
+def subscribe(callback):
+    _subscribers.append(callback)
+    return callback
+
+
+def track_previous(table: str, columns):
+    _tracked.setdefault(table, set()).update(columns)
+
+
+def tracked(table: str) -> set:
+    return _tracked.get(table, set())
+
+
+def _record(session: Session, table: str, row):
+    changes = session.info.setdefault("changes", {})
+    if row is None:
+        changes[table] = None
+    elif changes.get(table, []) is not None:
+        changes.setdefault(table, []).append(row)
+
+
+def _snapshot(instance) -> dict:
+    state = inspect(instance)
+    # Берём только загруженные значения, чтобы не провоцировать lazy-load
+    return {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
+
+
+def _previous(instance) -> dict:
+    # В after_flush история атрибутов ещё хранит значения до flush
+    state = inspect(instance)
+    previous = {}
+    for key in tracked(instance.__table__.name):
+        deleted = state.attrs[key].history.deleted
+        if deleted:
+            previous[key] = deleted[0]
+    return previous
+
+
+def record(session: Session, instance, previous: dict = None):
+    # previous - значения отслеживаемых колонок до UPDATE
+    row = _snapshot(instance)
+    _record(session, instance.__table__.name, row)
+    if previous:
+        _record(session, instance.__table__.name, {**row, **previous})
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    for instance in (*session.new, *session.deleted):
+        record(session, instance)
+    for instance in session.dirty:
+        record(session, instance, _previous(instance))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get(RECORDED_OPTION):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table is None:
+        return
+    params = orm_execute_state.parameters
+    if orm_execute_state.is_insert and params:
+        for row in params if isinstance(params, list) else [params]:
+            _record(orm_execute_state.session, table.name, dict(row))
+    else:
+        _record(orm_execute_state.session, table.name, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    changes = session.info.pop("changes", None)
+    if not changes:
+        return
+    for callback in _subscribers:
+        try:
+            callback(changes)
+        except Exception:
+            logger.exception("Change subscriber %r failed", callback)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("changes", None)
@@ -1,196 +1,186 @@
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
-import database, schemas
+import availability, database, repository, schemas
+
+# Функции по сущностям - тонкие обёртки над repository
+
+# Сколько строк уходит в один многострочный INSERT ... RETURNING
+BULK_CHUNK_SIZE = 1000
 
 def get_user_by_username(db: Session, username: str):
-    return db.query(database.User).filter(database.User.username == username).first()
+    return repository.users.find_one(db, username=username)
 
 def create_user(db: Session, user: schemas.UserCreate):
-    db_user = database.User(username=user.username, hashed_password=user.hashed_password, role=user.role)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    return repository.users.create(db, {"username": user.username, "hashed_password": user.hashed_password, "role": user.role})
+
+def update_user_password(db: Session, user_id: int, hashed_password: str):
+    return repository.users.update(db, user_id, {"hashed_password": hashed_password})
 
 # Client CRUD
 def create_client(db: Session, client: schemas.ClientCreate):
-    db_client = database.Client(**client.dict())
-    db.add(db_client)
-    db.commit()
-    db.refresh(db_client)
-    return db_client
+    return repository.clients.create(db, client.dict())
 
 
 def get_clients(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(database.Client).offset(skip).limit(limit).all()
+    return repository.clients.list(db, skip, limit)
 
 
 def get_client(db: Session, client_id: int):
-    return db.query(database.Client).filter(database.Client.client_id == client_id).first()
+    return repository.clients.get(db, client_id)
 
 
 def update_client(db: Session, client_id: int, client: schemas.ClientCreate):
-    db_client = get_client(db, client_id)
-    if db_client:
-        for key, value in client.dict().items():
-            setattr(db_client, key, value)
-        db.commit()
-        db.refresh(db_client)
-    return db_client
+    return repository.clients.update(db, client_id, client.dict())
 
 
 def delete_client(db: Session, client_id: int):
-    db_client = get_client(db, client_id)
-    if db_client:
-        db.delete(db_client)
-        db.commit()
-    return db_client
+    return repository.clients.delete(db, client_id)
 
 
 # Booking CRUD
 def create_booking(db: Session, booking: schemas.BookingCreate):
-    db_booking = database.Booking(**booking.dict())
-    db.add(db_booking)
-    db.commit()
-    db.refresh(db_booking)
-    return db_booking
+    # Часы работы и пересечение с другими бронированиями и заездами; availability.BookingError при нарушении
+    return availability.create_booking(db, booking.dict())
 
 
 def get_bookings(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(database.Booking).offset(skip).limit(limit).all()
+    return repository.bookings.list(db, skip, limit)
 
 
 def get_booking(db: Session, booking_id: int):
-    return db.query(database.Booking).filter(database.Booking.booking_id == booking_id).first()
+    return repository.bookings.get(db, booking_id)
 
 
 def delete_booking(db: Session, booking_id: int):
-    db_booking = get_booking(db, booking_id)
-    if db_booking:
-        db.delete(db_booking)
-        db.commit()
-    return db_booking
+    return repository.bookings.delete(db, booking_id)
 
 
 # Race CRUD
 def create_race(db: Session, race: schemas.RaceCreate):
-    db_race = database.Race(**race.dict())
-    db.add(db_race)
-    db.commit()
-    db.refresh(db_race)
-    return db_race
+    return repository.races.create(db, race.dict())
 
 
 def get_races(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(database.Race).offset(skip).limit(limit).all()
+    return repository.races.list(db, skip, limit)
 
 
 def get_race(db: Session, race_id: int):
-    return db.query(database.Race).filter(database.Race.race_id == race_id).first()
+    return repository.races.get(db, race_id)
 
 
 def delete_race(db: Session, race_id: int):
-    db_race = get_race(db, race_id)
-    if db_race:
-        db.delete(db_race)
-        db.commit()
-    return db_race
+    return repository.races.delete(db, race_id)
 
 
 # Kart CRUD
 def create_kart(db: Session, kart: schemas.KartCreate):
-    db_kart = database.Kart(**kart.dict())
-    db.add(db_kart)
-    db.commit()
-    db.refresh(db_kart)
-    return db_kart
+    return repository.karts.create(db, kart.dict())
 
 
 def get_karts(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(database.Kart).offset(skip).limit(limit).all()
+    return repository.karts.list(db, skip, limit)
 
 
 def get_kart(db: Session, kart_id: int):
-    return db.query(database.Kart).filter(database.Kart.kart_id == kart_id).first()
+    return repository.karts.get(db, kart_id)
 
 
 def delete_kart(db: Session, kart_id: int):
-    db_kart = get_kart(db, kart_id)
-    if db_kart:
-        db.delete(db_kart)
-        db.commit()
-    return db_kart
+    return repository.karts.delete(db, kart_id)
 
 
 # RaceResult CRUD
 def create_race_result(db: Session, result: schemas.RaceResultCreate):
-    db_result = database.RaceResult(**result.dict())
-    db.add(db_result)
-    db.commit()
-    db.refresh(db_result)
-    return db_result
+    return repository.race_results.create(db, result.dict())
 
 
 def get_race_results(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(database.RaceResult).offset(skip).limit(limit).all()
+    return repository.race_results.list(db, skip, limit)
 
 
 def get_race_result(db: Session, result_id: int):
-    return db.query(database.RaceResult).filter(database.RaceResult.result_id == result_id).first()
+    return repository.race_results.get(db, result_id)
 
 
 def delete_race_result(db: Session, result_id: int):
-    db_result = get_race_result(db, result_id)
-    if db_result:
-        db.delete(db_result)
-        db.commit()
-    return db_result
+    return repository.race_results.delete(db, result_id)
 
 
 # LapTime CRUD
 def create_lap_time(db: Session, lap_time: schemas.LapTimeCreate):
-    db_lap_time = database.LapTime(**lap_time.dict())
-    db.add(db_lap_time)
-    db.commit()
-    db.refresh(db_lap_time)
-    return db_lap_time
+    return repository.lap_times.create(db, lap_time.dict())
 
 
 def get_lap_times(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(database.LapTime).offset(skip).limit(limit).all()
+    return repository.lap_times.list(db, skip, limit)
 
 
 def get_lap_time(db: Session, lap_time_id: int):
-    return db.query(database.LapTime).filter(database.LapTime.lap_time_id == lap_time_id).first()
+    return repository.lap_times.get(db, lap_time_id)
 
 
 def delete_lap_time(db: Session, lap_time_id: int):
-    db_lap_time = get_lap_time(db, lap_time_id)
-    if db_lap_time:
-        db.delete(db_lap_time)
-        db.commit()
-    return db_lap_time
+    return repository.lap_times.delete(db, lap_time_id)
 
 
 # Maintenance CRUD
 def create_maintenance(db: Session, maintenance: schemas.MaintenanceCreate):
-    db_maintenance = database.Maintenance(**maintenance.dict())
-    db.add(db_maintenance)
-    db.commit()
-    db.refresh(db_maintenance)
-    return db_maintenance
+    return repository.maintenances.create(db, maintenance.dict())
 
 
 def get_maintenances(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(database.Maintenance).offset(skip).limit(limit).all()
+    return repository.maintenances.list(db, skip, limit)
 
 
 def get_maintenance(db: Session, maintenance_id: int):
-    return db.query(database.Maintenance).filter(database.Maintenance.maintenance_id == maintenance_id).first()
+    return repository.maintenances.get(db, maintenance_id)
 
 
 def delete_maintenance(db: Session, maintenance_id: int):
-    db_maintenance = get_maintenance(db, maintenance_id)
-    if db_maintenance:
-        db.delete(db_maintenance)
-        db.commit()
-    return db_maintenance
\ No newline at end of file
+    return repository.maintenances.delete(db, maintenance_id)
+
+
+# Bulk ingest
+def _existing_ids(db: Session, column, ids: set) -> set:
+    if not ids:
+        return set()
+    return set(db.scalars(select(column).where(column.in_(ids))).all())
+
+
+def _bulk_insert(db: Session, model, pk, rows: list, chunk_size: int) -> list:
+    # Все пачки идут в одной транзакции; id возвращаются в порядке входных строк
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        ids.extend(db.scalars(
+            insert(model).returning(pk, sort_by_parameter_order=True), rows[start:start + chunk_size]
+        ).all())
+    repository.commit(db)
+    return ids
+
+
+def bulk_create_lap_times(db: Session, lap_times: list, chunk_size: int = BULK_CHUNK_SIZE):
+    # Возвращает id вставленных строк и ошибки по индексам входного списка
+    database.use_primary(db)
+    known = _existing_ids(db, database.RaceResult.result_id, {lap.result_id for lap in lap_times})
+    errors = {
+        index: f"result_id {lap.result_id} не найден"
+        for index, lap in enumerate(lap_times) if lap.result_id not in known
+    }
+    rows = [lap.dict() for index, lap in enumerate(lap_times) if index not in errors]
+    return _bulk_insert(db, database.LapTime, database.LapTime.lap_time_id, rows, chunk_size), errors
+
+
+def bulk_create_race_results(db: Session, results: list, chunk_size: int = BULK_CHUNK_SIZE):
+    database.use_primary(db)
+    known = {
+        "client_id": _existing_ids(db, database.Client.client_id, {result.client_id for result in results}),
+        "race_id": _existing_ids(db, database.Race.race_id, {result.race_id for result in results}),
+        "kart_id": _existing_ids(db, database.Kart.kart_id, {result.kart_id for result in results}),
+    }
+    errors = {}
+    for index, result in enumerate(results):
+        missing = [f"{key} {getattr(result, key)} не найден" for key, ids in known.items() if getattr(result, key) not in ids]
+        if missing:
+            errors[index] = "; ".join(missing)
+    rows = [result.dict() for index, result in enumerate(results) if index not in errors]
+    return _bulk_insert(db, database.RaceResult, database.RaceResult.result_id, rows, chunk_size), errors
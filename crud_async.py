@@ -0,0 +1,151 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import availability, crud, schemas
+from dependencies import run_and_release
+
+# Асинхронные версии функций crud для AsyncSession (DB_ASYNC=1): та же работа через
+# repository выполняется на синхронной части сессии (run_sync), поэтому запись с
+# RETURNING и проверки бронирований общие с crud, а ожидание БД не занимает поток
+
+async def call(db, function, *args):
+    # function - функция crud: на AsyncSession вызывается одноимённая отсюда, на Session -
+    # она сама в threadpool
+    if isinstance(db, AsyncSession):
+        return await globals()[function.__name__](db, *args)
+    return await run_in_threadpool(run_and_release, db, function, *args)
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.run_sync(crud.get_user_by_username, username)
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    return await db.run_sync(crud.create_user, user)
+
+async def update_user_password(db: AsyncSession, user_id: int, hashed_password: str):
+    return await db.run_sync(crud.update_user_password, user_id, hashed_password)
+
+# Client CRUD
+async def create_client(db: AsyncSession, client: schemas.ClientCreate):
+    return await db.run_sync(crud.create_client, client)
+
+
+async def get_clients(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return await db.run_sync(crud.get_clients, skip, limit)
+
+
+async def get_client(db: AsyncSession, client_id: int):
+    return await db.run_sync(crud.get_client, client_id)
+
+
+async def update_client(db: AsyncSession, client_id: int, client: schemas.ClientCreate):
+    return await db.run_sync(crud.update_client, client_id, client)
+
+
+async def delete_client(db: AsyncSession, client_id: int):
+    return await db.run_sync(crud.delete_client, client_id)
+
+# Booking CRUD
+async def create_booking(db: AsyncSession, booking: schemas.BookingCreate):
+    # Часы работы и пересечение с другими бронированиями и заездами; availability.BookingError при нарушении
+    return await availability.create_booking_async(db, booking.dict())
+
+
+async def get_bookings(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return await db.run_sync(crud.get_bookings, skip, limit)
+
+
+async def get_booking(db: AsyncSession, booking_id: int):
+    return await db.run_sync(crud.get_booking, booking_id)
+
+
+async def delete_booking(db: AsyncSession, booking_id: int):
+    return await db.run_sync(crud.delete_booking, booking_id)
+
+# Race CRUD
+async def create_race(db: AsyncSession, race: schemas.RaceCreate):
+    return await db.run_sync(crud.create_race, race)
+
+
+async def get_races(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return await db.run_sync(crud.get_races, skip, limit)
+
+
+async def get_race(db: AsyncSession, race_id: int):
+    return await db.run_sync(crud.get_race, race_id)
+
+
+async def delete_race(db: AsyncSession, race_id: int):
+    return await db.run_sync(crud.delete_race, race_id)
+
+# Kart CRUD
+async def create_kart(db: AsyncSession, kart: schemas.KartCreate):
+    return await db.run_sync(crud.create_kart, kart)
+
+
+async def get_karts(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return await db.run_sync(crud.get_karts, skip, limit)
+
+
+async def get_kart(db: AsyncSession, kart_id: int):
+    return await db.run_sync(crud.get_kart, kart_id)
+
+
+async def delete_kart(db: AsyncSession, kart_id: int):
+    return await db.run_sync(crud.delete_kart, kart_id)
+
+# RaceResult CRUD
+async def create_race_result(db: AsyncSession, result: schemas.RaceResultCreate):
+    return await db.run_sync(crud.create_race_result, result)
+
+
+async def get_race_results(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return await db.run_sync(crud.get_race_results, skip, limit)
+
+
+async def get_race_result(db: AsyncSession, result_id: int):
+    return await db.run_sync(crud.get_race_result, result_id)
+
+
+async def delete_race_result(db: AsyncSession, result_id: int):
+    return await db.run_sync(crud.delete_race_result, result_id)
+
+# LapTime CRUD
+async def create_lap_time(db: AsyncSession, lap_time: schemas.LapTimeCreate):
+    return await db.run_sync(crud.create_lap_time, lap_time)
+
+
+async def get_lap_times(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return await db.run_sync(crud.get_lap_times, skip, limit)
+
+
+async def get_lap_time(db: AsyncSession, lap_time_id: int):
+    return await db.run_sync(crud.get_lap_time, lap_time_id)
+
+
+async def delete_lap_time(db: AsyncSession, lap_time_id: int):
+    return await db.run_sync(crud.delete_lap_time, lap_time_id)
+
+# Maintenance CRUD
+async def create_maintenance(db: AsyncSession, maintenance: schemas.MaintenanceCreate):
+    return await db.run_sync(crud.create_maintenance, maintenance)
+
+
+async def get_maintenances(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return await db.run_sync(crud.get_maintenances, skip, limit)
+
+
+async def get_maintenance(db: AsyncSession, maintenance_id: int):
+    return await db.run_sync(crud.get_maintenance, maintenance_id)
+
+
+async def delete_maintenance(db: AsyncSession, maintenance_id: int):
+    return await db.run_sync(crud.delete_maintenance, maintenance_id)
+
+# Bulk ingest
+async def bulk_create_lap_times(db: AsyncSession, lap_times: list, chunk_size: int = crud.BULK_CHUNK_SIZE):
+    return await db.run_sync(crud.bulk_create_lap_times, lap_times, chunk_size)
+
+
+async def bulk_create_race_results(db: AsyncSession, results: list, chunk_size: int = crud.BULK_CHUNK_SIZE):
+    return await db.run_sync(crud.bulk_create_race_results, results, chunk_size)
@@ -0,0 +1,78 @@
+import os
+import secrets
+
+from fastapi import HTTPException, Request
+from sqlalchemy.orm import Session
+
+import auth, database
+from database import SessionLocal
+
+# Зависимость для получения сессии базы данных
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+# DB_ASYNC=1: обработчики с crud получают AsyncSession и вызывают crud_async
+get_crud_db = get_async_db if database.USE_ASYNC else get_db
+
+def run_and_release(db: Session, function, *args):
+    # Соединение берётся и возвращается в пул за один заход в threadpool: иначе при
+    # всплеске запросов все потоки ждут соединений, которые держат ждущие потока запросы
+    try:
+        return function(db, *args)
+    finally:
+        db.close()
+
+# Проверка авторизации
+def require_auth(request: Request) -> bool:
+    user = request.session.get("user")
+    if user is None:
+        return False
+    return True
+
+# Пользователь из сессии или из токена в заголовке Authorization: Bearer
+async def current_user(request: Request):
+    user = request.session.get("user")
+    token = auth.bearer_token(request)
+    if user is None and token is not None:
+        user = await auth.user_from_token(token)
+    return user
+
+# Для API: пользователь с одной из перечисленных ролей, иначе 401/403
+def require_role(*roles: str):
+    async def dependency(request: Request) -> dict:
+        user = await current_user(request)
+        if user is None:
+            raise HTTPException(status_code=401, detail="Требуется вход")
+        if roles and user.get("role") not in roles:
+            raise HTTPException(status_code=403, detail="Недостаточно прав")
+        return user
+    return dependency
+
+# Администраторы перечисляются в ADMIN_USERNAMES через запятую
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+async def require_admin(request: Request) -> dict:
+    user = await current_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Требуется вход")
+    if user.get("username") not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    return user
+
+# Токен сборщика метрик (Prometheus): Authorization: Bearer <METRICS_TOKEN>. Без него
+# /metrics доступен только администраторам
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+async def require_metrics_access(request: Request):
+    token = auth.bearer_token(request)
+    if METRICS_TOKEN and token is not None and secrets.compare_digest(token, METRICS_TOKEN):
+        return None
+    return await require_admin(request)
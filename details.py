@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import archive, schemas
+from dependencies import get_db, require_role, run_and_release
+
+# Вложенные ответы: заезд с результатами, пилотами, картами и кругами; история клиента.
+# Граф объектов целиком загружается профилем из repository.PROFILES, поэтому при
+# сериализации после закрытия сессии ленивых загрузок нет. Результаты старше горизонта
+# archive дописываются из сегментов холодного архива.
+
+router = APIRouter(prefix="/api")
+staff = require_role("Организатор", "Технический персонал")
+
+
+@router.get("/races/{race_id}", response_model=schemas.RaceDetail)
+async def race_detail(race_id: int, db: Session = Depends(get_db), user: dict = Depends(staff)):
+    race = await run_in_threadpool(run_and_release, db, archive.race_detail, race_id)
+    if race is None:
+        raise HTTPException(status_code=404, detail="Заезд не найден")
+    return race
+
+
+@router.get("/clients/{client_id}/history", response_model=schemas.ClientHistory)
+async def client_history(client_id: int, db: Session = Depends(get_db), user: dict = Depends(staff)):
+    history = await run_in_threadpool(run_and_release, db, archive.client_history, client_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Клиент не найден")
+    return history
@@ -0,0 +1,81 @@
+import csv
+import io
+import itertools
+import json
+import zlib
+from datetime import date, datetime, timedelta
+
+# Сколько строк забирается из серверного курсора и кодируется за раз
+EXPORT_BATCH = 5000
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "columnar": "application/x-ndjson",
+}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return str(value)
+
+
+def encode_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(columns, batches):
+    dumps = json.JSONEncoder(default=_json_default, ensure_ascii=False, separators=(",", ":")).encode
+    for batch in batches:
+        yield "".join(dumps(dict(zip(columns, row))) + "\n" for row in batch).encode()
+
+
+def encode_columnar(columns, batches):
+    # Первая строка - заголовок со списком колонок, дальше по строке на пачку:
+    # значения каждой колонки пачки лежат в одном массиве
+    dumps = json.JSONEncoder(default=_json_default, ensure_ascii=False, separators=(",", ":")).encode
+    yield (dumps({"columns": columns}) + "\n").encode()
+    for batch in batches:
+        yield (dumps([list(values) for values in zip(*batch)]) + "\n").encode()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "columnar": encode_columnar,
+}
+
+# Последняя строка выгрузки, прерванной после отправки заголовков
+TRUNCATED = {
+    "csv": "# ошибка: выгрузка прервана, превышено время выполнения запроса\n".encode(),
+    "ndjson": '{"error":"statement_timeout"}\n'.encode(),
+    "columnar": '{"error":"statement_timeout"}\n'.encode(),
+}
+
+
+def gzipped(chunks, level: int = 6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_result(result, fmt: str, batch_size: int = EXPORT_BATCH):
+    columns = list(result.keys())
+    # Первая пачка читается сразу, до первого фрагмента ответа
+    batches = result.partitions(batch_size)
+    return ENCODERS[fmt](columns, itertools.chain(list(itertools.islice(batches, 1)), batches))
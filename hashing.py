@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+
+import instrumentation, metrics
+
+# thread | process | inline (inline - старое поведение: bcrypt в общем threadpool Starlette)
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько операций может ждать или выполняться одновременно, сверх этого - 503
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+HASH_RETRY_AFTER = os.getenv("HASH_RETRY_AFTER", "2")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+hash_seconds = metrics.Histogram("password_hash_seconds", "Time spent in bcrypt hash/verify, queueing included")
+hash_in_flight = metrics.Gauge("password_hash_in_flight", "Hash operations queued or running")
+hash_rejected = metrics.Counter("password_hash_rejected_total", "Hash operations rejected with 503")
+hash_rehashed = metrics.Counter("password_rehashed_total", "Hashes upgraded on login")
+
+_executor = None
+_in_flight = 0
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str):
+    # Возвращает (совпал ли пароль, новый хэш при смене политики)
+    if not pwd_context.verify(password, hashed_password):
+        return False, None
+    if pwd_context.needs_update(hashed_password):
+        return True, pwd_context.hash(password)
+    return True, None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _executor = ThreadPoolExecutor(HASH_WORKERS, thread_name_prefix="hashing")
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _submit(function, *args):
+    global _in_flight
+    # Счётчик меняется только в event loop, поэтому блокировка не нужна
+    if _in_flight >= HASH_QUEUE_LIMIT:
+        hash_rejected.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис перегружен, попробуйте позже",
+            headers={"Retry-After": HASH_RETRY_AFTER},
+        )
+    _in_flight += 1
+    hash_in_flight.set(_in_flight)
+    started = time.perf_counter()
+    try:
+        if HASH_EXECUTOR == "inline":
+            return await run_in_threadpool(function, *args)
+        return await asyncio.wrap_future(get_executor().submit(function, *args))
+    finally:
+        _in_flight -= 1
+        hash_in_flight.set(_in_flight)
+        elapsed = time.perf_counter() - started
+        hash_seconds.observe(elapsed)
+        instrumentation.add("hash", elapsed)
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str):
+    verified, new_hash = await _submit(_verify, password, hashed_password)
+    if new_hash is not None:
+        hash_rehashed.inc()
+    return verified, new_hash
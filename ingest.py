@@ -0,0 +1,70 @@
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+
+import crud, crud_async, schemas
+from dependencies import get_crud_db, require_role
+
+# Пакетная загрузка результатов заездов и времён кругов (JSON-массив или NDJSON)
+
+MAX_ROWS = 100000
+
+router = APIRouter(prefix="/api")
+timing_staff = require_role("Организатор", "Технический персонал")
+
+
+def _items(body: bytes, content_type: str):
+    # Возвращает пары (индекс, объект) и ошибки разбора по индексам
+    if "ndjson" in content_type:
+        items, errors = [], {}
+        for index, line in enumerate(line for line in body.splitlines() if line.strip()):
+            try:
+                items.append((index, json.loads(line)))
+            except ValueError as exc:
+                errors[index] = f"некорректный JSON: {exc}"
+        return items, errors
+    try:
+        payload = json.loads(body)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Некорректный JSON: {exc}")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Ожидается JSON-массив строк")
+    return list(enumerate(payload)), {}
+
+
+def parse_rows(body: bytes, content_type: str, schema):
+    items, errors = _items(body, content_type)
+    if len(items) + len(errors) > MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Не больше {MAX_ROWS} строк за запрос")
+    valid = []
+    for index, item in items:
+        try:
+            valid.append((index, schema(**item)))
+        except ValidationError as exc:
+            errors[index] = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors())
+        except TypeError:
+            errors[index] = "строка должна быть JSON-объектом"
+    return valid, errors
+
+
+async def ingest(request: Request, db, schema, bulk_create):
+    valid, errors = parse_rows(await request.body(), request.headers.get("content-type", ""), schema)
+    ids, db_errors = await crud_async.call(db, bulk_create, [row for _, row in valid])
+    inserted = [index for position, (index, _) in enumerate(valid) if position not in db_errors]
+    errors.update((valid[position][0], message) for position, message in db_errors.items())
+    return {
+        "inserted": len(ids),
+        "ids": [{"index": index, "id": row_id} for index, row_id in zip(inserted, ids)],
+        "errors": [{"index": index, "error": errors[index]} for index in sorted(errors)],
+    }
+
+
+@router.post("/lap_times/bulk")
+async def bulk_lap_times(request: Request, db=Depends(get_crud_db), user: dict = Depends(timing_staff)):
+    return await ingest(request, db, schemas.LapTimeCreate, crud.bulk_create_lap_times)
+
+
+@router.post("/race_results/bulk")
+async def bulk_race_results(request: Request, db=Depends(get_crud_db), user: dict = Depends(timing_staff)):
+    return await ingest(request, db, schemas.RaceResultCreate, crud.bulk_create_race_results)
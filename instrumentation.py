@@ -0,0 +1,251 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally, deque
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import metrics
+
+# Время по фазам запроса: разбор сессии, запросы к БД, выборка строк, рендеринг
+# шаблона, хэширование паролей. Фазы отдаются в заголовке Server-Timing и копятся
+# в гистограммах по маршрутам. Потоковое тело рендерится после отправки заголовков,
+# поэтому в Server-Timing попадает только то, что успело выполниться до них;
+# гистограммы получают полные значения по окончании ответа.
+
+PHASES = ("session", "db", "fetch", "render", "hash")
+
+# PROFILE_THRESHOLD_MS > 0 включает сэмплирующий профилировщик: запросы дольше порога
+# сохраняются в PROFILE_DIR в формате folded stacks (flamegraph.pl, speedscope)
+PROFILE_THRESHOLD = float(os.getenv("PROFILE_THRESHOLD_MS", "0")) / 1000
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000, 10000)
+
+request_seconds = metrics.Histogram("http_request_duration_seconds", "Request duration including the streamed body")
+phase_seconds = metrics.Histogram("http_request_phase_seconds", "Request time spent per phase")
+request_queries = metrics.Histogram("http_request_queries", "SQL statements executed per request", COUNT_BUCKETS)
+request_rows = metrics.Histogram("http_request_rows", "Rows fetched from the database per request", COUNT_BUCKETS)
+profiles_written = metrics.Counter("http_slow_request_profiles_total", "Profiles written for slow requests")
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class Timings:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.rows = 0
+        self.threads = {threading.get_ident()}
+
+    def server_timing(self) -> str:
+        parts = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items() if seconds]
+        if self.queries:
+            parts.append(f'queries;desc="{self.queries}"')
+        if self.rows:
+            parts.append(f'rows;desc="{self.rows}"')
+        parts.append(f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def current():
+    return _current.get()
+
+
+def add(phase: str, seconds: float):
+    timings = _current.get()
+    if timings is not None:
+        timings.phases[phase] += seconds
+        timings.threads.add(threading.get_ident())
+
+
+def add_rows(count: int):
+    timings = _current.get()
+    if timings is not None:
+        timings.rows += count
+
+
+def _excluded(timings, exclude) -> float:
+    return sum(timings.phases[phase] for phase in exclude) if timings else 0.0
+
+
+def timed_iter(iterable, phase: str, exclude=(), rows: bool = False):
+    # Время внутри next() без вложенных фаз из exclude; rows=True считает элементы как строки
+    iterator = iter(iterable)
+    while True:
+        timings = _current.get()
+        before = _excluded(timings, exclude)
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            add(phase, time.perf_counter() - started - (_excluded(timings, exclude) - before))
+            return
+        add(phase, time.perf_counter() - started - (_excluded(timings, exclude) - before))
+        if rows:
+            add_rows(1)
+        yield item
+
+
+async def atimed_iter(iterable, phase: str, exclude=(), rows: bool = False):
+    iterator = iterable.__aiter__()
+    while True:
+        timings = _current.get()
+        before = _excluded(timings, exclude)
+        started = time.perf_counter()
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            add(phase, time.perf_counter() - started - (_excluded(timings, exclude) - before))
+            return
+        add(phase, time.perf_counter() - started - (_excluded(timings, exclude) - before))
+        if rows:
+            add_rows(1)
+        yield item
+
+
+# Начало запроса хранится в контексте выполнения, а не на соединении: у упавшего
+# запроса after_cursor_execute не вызывается, и время записывается в handle_error
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _finish_query(context):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    context._query_started = None
+    timings = _current.get()
+    if timings is not None:
+        timings.queries += 1
+        add("db", time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_query(context)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Отменённый по statement_timeout запрос тоже занимал БД
+    _finish_query(exception_context.execution_context)
+
+
+class _Sampler:
+    # Фоновый поток снимает стеки всех потоков; запрос забирает снимки своих потоков за своё время
+
+    def __init__(self):
+        self.samples = deque(maxlen=max(int(60 / PROFILE_INTERVAL), 1000))
+        self.thread = threading.Thread(target=self.run, name="request-profiler", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        own = threading.get_ident()
+        while True:
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples.append((now, thread_id, ";".join(reversed(stack))))
+            time.sleep(PROFILE_INTERVAL)
+
+    def dump(self, timings: Timings, finished: float, route: str):
+        stacks = Tally(
+            stack for moment, thread_id, stack in list(self.samples)
+            if timings.started <= moment <= finished and thread_id in timings.threads
+        )
+        if not stacks:
+            return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}.folded")
+        with open(path, "w", encoding="utf-8") as output:
+            output.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+        profiles_written.inc()
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = _Sampler()
+    return _sampler
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class TimingMiddleware:
+    # Внешний ASGI-слой: заводит учёт фаз на запрос и добавляет Server-Timing
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        sampler = _get_sampler() if PROFILE_THRESHOLD > 0 else None
+        timings = Timings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            finished = time.perf_counter()
+            elapsed = finished - timings.started
+            route = _route(scope)
+            request_seconds.observe(elapsed, route=route, method=scope["method"], status=status)
+            for phase, seconds in timings.phases.items():
+                if seconds:
+                    phase_seconds.observe(seconds, route=route, phase=phase)
+            request_queries.observe(timings.queries, route=route)
+            request_rows.observe(timings.rows, route=route)
+            if sampler is not None and elapsed >= PROFILE_THRESHOLD:
+                sampler.dump(timings, finished, route)
+
+
+class SessionTimingMiddleware:
+    # Ставится сразу под SessionMiddleware: время до него - разбор cookie сессии
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        timings = _current.get()
+        if timings is not None:
+            timings.phases["session"] = time.perf_counter() - timings.started
+        await self.app(scope, receive, send)
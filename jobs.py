@@ -0,0 +1,620 @@
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter as Tally
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy import func, select
+
+import archive, changes, database, export, metrics, schemas
+from dependencies import require_role
+
+# Фоновые отчёты: тяжёлый пересчёт идёт в отдельном пуле процессов со своими
+# соединениями с БД, клиент получает id задания и забирает результат, когда он готов.
+# Результаты лежат файлами NDJSON в JOB_RESULT_DIR и удаляются через JOB_RESULT_TTL.
+# Процесс пула не делит память с приложением, поэтому прогресс и запрос отмены
+# передаются файлами рядом с результатом. Там же лежит состояние задания ({id}.json):
+# процесс приложения, запустивший задание, пишет его при запуске и завершении, и
+# другие процессы (воркеры uvicorn с общим JOB_RESULT_DIR) отдают статус, результат
+# и отменяют задание по нему.
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Сколько заданий может ждать или выполняться одновременно, сверх этого - 503
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "16"))
+JOB_RETRY_AFTER = os.getenv("JOB_RETRY_AFTER", "10")
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_RESULT_DIR = os.getenv("JOB_RESULT_DIR", os.path.join(tempfile.gettempdir(), "karting-jobs"))
+# Предел ожидания готовности в ?wait= у статуса и результата
+MAX_WAIT = 30
+# Как часто перечитывается состояние задания другого процесса при ?wait=
+POLL_INTERVAL = 0.2
+ACTIVE = ("queued", "running", "cancelling")
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+BATCH = 5000
+
+# Очки за место в заезде
+POINTS = {1: 25, 2: 18, 3: 15, 4: 12, 5: 10, 6: 8, 7: 6, 8: 4, 9: 2, 10: 1}
+
+router = APIRouter(prefix="/api/jobs")
+staff = require_role("Организатор", "Технический персонал")
+
+submitted = metrics.Counter("jobs_submitted_total", "Report jobs submitted, deduplicated included")
+finished = metrics.Counter("jobs_finished_total", "Report jobs finished by outcome")
+job_seconds = metrics.Histogram("job_seconds", "Report job duration, queueing included")
+
+
+class Cancelled(Exception):
+    pass
+
+
+# --- Процесс пула ---
+
+def _write(path: str, data: bytes):
+    # Читатель видит либо старый файл, либо новый целиком
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+class Progress:
+
+    def __init__(self, directory: str, job_id: str):
+        self.path = os.path.join(directory, f"{job_id}.progress")
+        self.cancel_path = os.path.join(directory, f"{job_id}.cancel")
+        self.done = 0
+        self.total = 0
+
+    def start(self, total: int):
+        self.total = total
+        self.advance(0)
+
+    def advance(self, count: int):
+        # Отмена проверяется между пачками строк
+        if os.path.exists(self.cancel_path):
+            raise Cancelled()
+        self.done += count
+        _write(self.path, f"{self.done} {self.total}".encode())
+
+
+def _count(db, statement) -> int:
+    return db.execute(select(func.count()).select_from(statement.subquery())).scalar()
+
+
+def _batches(db, statement):
+    return db.execute(statement.execution_options(yield_per=BATCH)).partitions()
+
+
+def _season_bounds(db, season: int) -> tuple:
+    if season is None:
+        latest = db.execute(select(func.max(database.RaceResult.race_datetime))).scalar()
+        season = latest.year if latest is not None else date.today().year
+    return season, datetime(season, 1, 1), datetime(season + 1, 1, 1)
+
+
+def season_standings(db, progress: Progress, season: int = None) -> tuple:
+    # Очки, победы и подиумы по race_result, лучший и средний круг по lap_time за сезон
+    season, start, end = _season_bounds(db, season)
+    RaceResult, LapTime = database.RaceResult, database.LapTime
+    in_season = (RaceResult.race_datetime >= start) & (RaceResult.race_datetime < end)
+    results = select(RaceResult.client_id, RaceResult.race_position).where(in_season)
+    laps = (
+        select(RaceResult.client_id, LapTime.lap_time)
+        .join(RaceResult, RaceResult.result_id == LapTime.result_id)
+        .where(in_season)
+    )
+    archived_results = archive.store.rows(db, "results", ("client_id", "race_position"), start, end)
+    archived_laps = archive.store.rows(db, "laps", ("client_id", "lap_time"), start, end)
+    progress.start(
+        _count(db, results) + _count(db, laps) + sum(map(len, archived_results)) + sum(map(len, archived_laps))
+    )
+
+    standings = {}
+    for batch in itertools.chain(archived_results, _batches(db, results)):
+        for client_id, position in batch:
+            row = standings.setdefault(client_id, [0, 0, 0, 0, None, 0, timedelta()])
+            row[0] += POINTS.get(position, 0)
+            row[1] += 1
+            row[2] += position == 1
+            row[3] += position is not None and position <= 3
+        progress.advance(len(batch))
+    for batch in itertools.chain(archived_laps, _batches(db, laps)):
+        for client_id, lap_time in batch:
+            row = standings.setdefault(client_id, [0, 0, 0, 0, None, 0, timedelta()])
+            if row[4] is None or lap_time < row[4]:
+                row[4] = lap_time
+            row[5] += 1
+            row[6] += lap_time
+        progress.advance(len(batch))
+
+    names = {}
+    ids = list(standings)
+    for i in range(0, len(ids), 1000):
+        names.update(db.execute(
+            select(database.Client.client_id, database.Client.name).where(database.Client.client_id.in_(ids[i:i + 1000]))
+        ).all())
+    ordered = sorted(
+        standings.items(),
+        key=lambda item: (-item[1][0], -item[1][2], item[1][4] or timedelta.max),
+    )
+    columns = ["season", "rank", "client_id", "name", "points", "races", "wins", "podiums", "best_lap_ms", "laps", "mean_lap_ms"]
+    rows = [
+        (
+            season, rank, client_id, names.get(client_id), points, races, wins, podiums,
+            best // timedelta(milliseconds=1) if best is not None else None, laps,
+            round(total / laps / timedelta(milliseconds=1), 1) if laps else None,
+        )
+        for rank, (client_id, (points, races, wins, podiums, best, laps, total)) in enumerate(ordered, 1)
+    ]
+    return columns, rows
+
+
+def kart_wear(db, progress: Progress) -> tuple:
+    # Нагрузка на каждый карт парка с последнего обслуживания: заезды, круги, дни
+    Kart, Maintenance, RaceResult, LapTime = database.Kart, database.Maintenance, database.RaceResult, database.LapTime
+    karts = select(Kart.kart_id, Kart.brand, Kart.technical_condition)
+    maintenance = (
+        select(Maintenance.kart_id, Maintenance.maintenance_date, Maintenance.work_description)
+        .order_by(Maintenance.kart_id, Maintenance.maintenance_date)
+    )
+    results = select(RaceResult.kart_id, RaceResult.race_datetime)
+    laps = (
+        select(RaceResult.kart_id, RaceResult.race_datetime)
+        .join(LapTime, LapTime.result_id == RaceResult.result_id)
+    )
+    archived = {
+        "races": archive.store.rows(db, "results", ("kart_id", "race_datetime")),
+        "laps": archive.store.rows(db, "laps", ("kart_id", "race_datetime")),
+    }
+    progress.start(
+        sum(_count(db, statement) for statement in (karts, maintenance, results, laps))
+        + sum(len(batch) for batches in archived.values() for batch in batches)
+    )
+
+    fleet = {}
+    for batch in _batches(db, karts):
+        for kart_id, brand, condition in batch:
+            fleet[kart_id] = {
+                "brand": brand, "condition": condition, "maintenances": 0, "last": None, "works": Tally(),
+                "races": 0, "races_since": 0, "laps": 0, "laps_since": 0,
+            }
+        progress.advance(len(batch))
+    for batch in _batches(db, maintenance):
+        for kart_id, day, work in batch:
+            kart = fleet.get(kart_id)
+            if kart is not None:
+                kart["maintenances"] += 1
+                kart["last"] = day
+                kart["works"][work or ""] += 1
+        progress.advance(len(batch))
+    for statement, total, since in ((results, "races", "races_since"), (laps, "laps", "laps_since")):
+        for batch in itertools.chain(archived[total], _batches(db, statement)):
+            for kart_id, race_datetime in batch:
+                kart = fleet.get(kart_id)
+                if kart is not None:
+                    kart[total] += 1
+                    kart[since] += kart["last"] is None or race_datetime.date() >= kart["last"]
+            progress.advance(len(batch))
+
+    today = date.today()
+    columns = [
+        "kart_id", "brand", "technical_condition", "maintenances", "last_maintenance", "days_since_maintenance",
+        "races", "races_since_maintenance", "laps", "laps_since_maintenance", "works",
+    ]
+    rows = [
+        (
+            kart_id, kart["brand"], kart["condition"], kart["maintenances"], kart["last"],
+            (today - kart["last"]).days if kart["last"] is not None else None,
+            kart["races"], kart["races_since"], kart["laps"], kart["laps_since"], dict(kart["works"]),
+        )
+        for kart_id, kart in sorted(fleet.items(), key=lambda item: -item[1]["laps_since"])
+    ]
+    return columns, rows
+
+
+def _run(job_id: str, report: str, params: dict, directory: str) -> int:
+    progress = Progress(directory, job_id)
+    db = database.SessionLocal()
+    try:
+        columns, rows = REPORTS[report].function(db, progress, **params)
+    finally:
+        db.close()
+    _write(os.path.join(directory, f"{job_id}.ndjson"), b"".join(export.encode_ndjson(columns, [rows])))
+    return len(rows)
+
+
+class Report:
+
+    def __init__(self, function, roles: tuple, tables: tuple, params: dict):
+        self.function = function
+        self.roles = roles
+        # Commit в эти таблицы делает готовый результат устаревшим для новых запросов
+        self.tables = tables
+        # Допустимые параметры и их типы
+        self.params = params
+
+
+REPORTS = {
+    "season_standings": Report(
+        season_standings, ("Организатор",), ("race_result", "lap_time", "client"), {"season": int},
+    ),
+    "kart_wear": Report(
+        kart_wear, ("Организатор", "Технический персонал"), ("kart", "maintenance", "race_result", "lap_time"), {},
+    ),
+}
+
+
+# --- Приложение ---
+
+class Job:
+
+    def __init__(self, report: str, params: dict, key: tuple):
+        self.id = uuid.uuid4().hex
+        self.report = report
+        self.params = params
+        self.key = key
+        self.future = None
+        self.submitted_at = datetime.now()
+        self.finished_at = None
+        self.finished = None
+        self.cancel_requested = False
+
+    def path(self, suffix: str) -> str:
+        return os.path.join(JOB_RESULT_DIR, f"{self.id}.{suffix}")
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return "cancelled"
+        if not self.future.done():
+            if self.cancel_requested:
+                return "cancelling"
+            return "running" if self.future.running() else "queued"
+        error = self.future.exception()
+        if isinstance(error, Cancelled):
+            return "cancelled"
+        return "failed" if error is not None else "done"
+
+    def progress(self) -> dict:
+        try:
+            with open(self.path("progress")) as f:
+                done, total = map(int, f.read().split())
+        except (OSError, ValueError):
+            done, total = 0, 0
+        return {"done": done, "total": total, "percent": round(done / total * 100, 1) if total else None}
+
+    def describe(self) -> dict:
+        status = self.status
+        described = {
+            "id": self.id,
+            "report": self.report,
+            "params": self.params,
+            "status": status,
+            "progress": self.progress(),
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+        if status == "done":
+            described["rows"] = self.future.result()
+            described["result"] = f"{router.prefix}/{self.id}/result"
+            described["expires_at"] = self.finished_at + timedelta(seconds=JOB_RESULT_TTL)
+        elif status == "failed":
+            described["error"] = str(self.future.exception())
+        return described
+
+    def save(self):
+        state = jsonable_encoder(self.describe())
+        del state["progress"]
+        _write(self.path("json"), json.dumps(state).encode())
+
+    def remove_files(self):
+        for suffix in ("json", "ndjson", "progress", "cancel"):
+            try:
+                os.remove(self.path(suffix))
+            except FileNotFoundError:
+                pass
+
+
+class StoredJob:
+    # Задание другого процесса приложения, восстановленное из файла состояния
+
+    def __init__(self, state: dict):
+        self.id = state["id"]
+        self.report = state["report"]
+        self.params = state["params"]
+        self.state = state
+        # Готовый результат для повторных запросов переиспользует только процесс-владелец
+        self.key = None
+
+    path = Job.path
+    progress = Job.progress
+    remove_files = Job.remove_files
+
+    @classmethod
+    def load(cls, job_id: str):
+        try:
+            with open(os.path.join(JOB_RESULT_DIR, f"{job_id}.json")) as f:
+                job = cls(json.load(f))
+        except (OSError, ValueError):
+            return None
+        expires_at = job.state.get("expires_at")
+        if expires_at is not None and datetime.fromisoformat(expires_at) <= datetime.now():
+            job.remove_files()
+            return None
+        return job
+
+    @property
+    def status(self) -> str:
+        # Процесс пула отмечает начало работы файлом прогресса
+        status = self.state["status"]
+        if status in ACTIVE:
+            if os.path.exists(self.path("cancel")):
+                return "cancelling"
+            if os.path.exists(self.path("progress")):
+                return "running"
+        return status
+
+    def describe(self) -> dict:
+        return {**self.state, "status": self.status, "progress": self.progress()}
+
+
+_executor = None
+_jobs = {}
+# Ключ (отчёт, параметры) -> задание, результат которого ещё актуален
+_by_key = {}
+# Задания завершаются в потоке пула, а отменяются commit'ами из потоков запросов
+_lock = threading.Lock()
+
+
+def _sweep_directory():
+    # Результаты прошлых запусков приложения: реестр заданий в памяти их уже не знает
+    cutoff = time.time() - JOB_RESULT_TTL
+    for name in os.listdir(JOB_RESULT_DIR):
+        path = os.path.join(JOB_RESULT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        os.makedirs(JOB_RESULT_DIR, exist_ok=True)
+        _sweep_directory()
+        _executor = ProcessPoolExecutor(JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        # Выполняющиеся задания останавливаются на следующей пачке
+        for job in list(_jobs.values()):
+            if not job.future.done():
+                _request_cancel(job)
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def active() -> int:
+    return sum(not job.future.done() for job in list(_jobs.values()))
+
+
+def _expire():
+    now = time.monotonic()
+    with _lock:
+        expired = [job for job in _jobs.values() if job.finished is not None and now - job.finished >= JOB_RESULT_TTL]
+        for job in expired:
+            del _jobs[job.id]
+            if _by_key.get(job.key) is job:
+                del _by_key[job.key]
+    for job in expired:
+        job.remove_files()
+
+
+def _on_done(job: Job, future):
+    job.finished_at = datetime.now()
+    job.finished = time.monotonic()
+    status = job.status
+    try:
+        job.save()
+    except OSError:
+        logger.exception("Не удалось сохранить состояние задания %s", job.id)
+    if status in ("failed", "cancelled"):
+        with _lock:
+            if _by_key.get(job.key) is job:
+                del _by_key[job.key]
+    if status == "failed":
+        logger.warning("Отчёт %s (%s) завершился ошибкой: %s", job.report, job.id, future.exception())
+    finished.inc(report=job.report, status=status)
+    job_seconds.observe((job.finished_at - job.submitted_at).total_seconds(), report=job.report)
+
+
+def _request_cancel(job):
+    if isinstance(job, StoredJob):
+        # Задание выполняет другой процесс: пул остановит его на следующей пачке
+        with open(job.path("cancel"), "wb"):
+            pass
+        return
+    job.cancel_requested = True
+    with _lock:
+        if _by_key.get(job.key) is job:
+            del _by_key[job.key]
+    if not job.future.cancel():
+        with open(job.path("cancel"), "wb"):
+            pass
+
+
+@changes.subscribe
+def _on_commit(changed: dict):
+    # Следующий запрос того же отчёта пересчитает его по новым данным
+    with _lock:
+        for key, job in list(_by_key.items()):
+            if any(table in changed for table in REPORTS[job.report].tables):
+                del _by_key[key]
+
+
+def _params(report: Report, params: dict) -> dict:
+    unknown = set(params) - set(report.params)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные параметры: {', '.join(sorted(unknown))}")
+    try:
+        return {name: kind(params[name]) for name, kind in report.params.items() if params.get(name) is not None}
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Неверные параметры отчёта")
+
+
+def submit(name: str, params: dict) -> tuple:
+    # Возвращает (задание, было ли оно уже запущено тем же запросом)
+    _expire()
+    params = _params(REPORTS[name], params)
+    key = (name, tuple(sorted(params.items())))
+    with _lock:
+        job = _by_key.get(key)
+        if job is not None:
+            submitted.inc(report=name, deduplicated="true")
+            return job, True
+        if active() >= JOB_QUEUE_LIMIT:
+            raise HTTPException(
+                status_code=503,
+                detail="Очередь отчётов заполнена, попробуйте позже",
+                headers={"Retry-After": JOB_RETRY_AFTER},
+            )
+        job = Job(name, params, key)
+        try:
+            job.future = get_executor().submit(_run, job.id, name, params, JOB_RESULT_DIR)
+        except BrokenProcessPool:
+            # Упавший процесс пула (например, по памяти) ломает весь пул - создаётся новый
+            logger.warning("Пул отчётов перезапущен после падения процесса")
+            _reset_executor()
+            job.future = get_executor().submit(_run, job.id, name, params, JOB_RESULT_DIR)
+        _jobs[job.id] = job
+        _by_key[key] = job
+        job.save()
+    job.future.add_done_callback(lambda future: _on_done(job, future))
+    submitted.inc(report=name, deduplicated="false")
+    return job, False
+
+
+def _get(job_id: str, user: dict):
+    _expire()
+    job = _jobs.get(job_id)
+    if job is not None and not os.path.exists(job.path("json")):
+        # Результат удалён через другой процесс
+        with _lock:
+            _jobs.pop(job.id, None)
+            if _by_key.get(job.key) is job:
+                del _by_key[job.key]
+        job = None
+    elif job is None and JOB_ID.fullmatch(job_id):
+        job = StoredJob.load(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    if user.get("role") not in REPORTS[job.report].roles:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    return job
+
+
+async def _wait(job, wait: float):
+    # Возвращает задание с актуальным состоянием
+    wait = max(0, min(wait, MAX_WAIT))
+    if isinstance(job, StoredJob):
+        deadline = time.monotonic() + wait
+        while job.status in ACTIVE and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            job = StoredJob.load(job.id) or job
+    elif wait and not job.future.done():
+        await asyncio.wait([asyncio.wrap_future(job.future)], timeout=wait)
+    return job
+
+
+def _stored() -> list:
+    # Задания других процессов приложения
+    try:
+        names = os.listdir(JOB_RESULT_DIR)
+    except FileNotFoundError:
+        return []
+    ids = [name[:-5] for name in names if name.endswith(".json") and JOB_ID.fullmatch(name[:-5])]
+    return [job for job in map(StoredJob.load, ids) if job is not None and job.id not in _jobs]
+
+
+@router.post("", status_code=202)
+async def create_job(job: schemas.JobCreate, user: dict = Depends(staff)):
+    report = REPORTS.get(job.report)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Отчёт не найден")
+    if user.get("role") not in report.roles:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    created, deduplicated = submit(job.report, job.params)
+    return {**created.describe(), "deduplicated": deduplicated}
+
+
+@router.get("")
+async def list_jobs(user: dict = Depends(staff)):
+    _expire()
+    return [
+        job.describe() for job in list(_jobs.values()) + _stored()
+        if user.get("role") in REPORTS[job.report].roles
+    ]
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, wait: float = 0, user: dict = Depends(staff)):
+    job = await _wait(_get(job_id, user), wait)
+    return job.describe()
+
+
+@router.get("/{job_id}/result")
+async def get_result(job_id: str, wait: float = 0, user: dict = Depends(staff)):
+    # Готовый результат отдаётся файлом по частям; до готовности - 202 со статусом
+    job = await _wait(_get(job_id, user), wait)
+    status = job.status
+    if status in ("queued", "running", "cancelling"):
+        return JSONResponse(
+            status_code=202, content=jsonable_encoder(job.describe()), headers={"Retry-After": "1"},
+        )
+    if status != "done":
+        raise HTTPException(status_code=409, detail=f"Отчёт не построен: {status}")
+    return FileResponse(
+        job.path("ndjson"), media_type=export.FORMATS["ndjson"],
+        filename=f"{job.report}-{job.id}.ndjson", content_disposition_type="inline",
+    )
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, user: dict = Depends(staff)):
+    # Незавершённое задание отменяется, у завершённого удаляется результат
+    job = _get(job_id, user)
+    if job.status in ACTIVE:
+        _request_cancel(job)
+        return job.describe()
+    with _lock:
+        _jobs.pop(job.id, None)
+        if _by_key.get(job.key) is job:
+            del _by_key[job.key]
+    job.remove_files()
+    return {"id": job.id, "status": "deleted"}
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+import auth, crud, database, metrics, schemas
+from dependencies import require_role
+
+# Живой хронометраж: круги с транспондеров приходят по WebSocket, копятся в буфере
+# и пишутся в lap_time пачками; таблица лидеров по заезду живёт в памяти процесса,
+# подписчики получают только изменившиеся строки.
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("LIVE_FLUSH_INTERVAL", "1.0"))
+FLUSH_SIZE = int(os.getenv("LIVE_FLUSH_SIZE", "200"))
+SUBSCRIBER_QUEUE = 100
+
+TIMING_ROLES = ("Организатор", "Технический персонал")
+
+router = APIRouter()
+
+laps_received = metrics.Counter("live_laps_received_total", "Lap events accepted from timing feeds")
+laps_flushed = metrics.Counter("live_laps_flushed_total", "Lap events written to lap_time")
+flushes = metrics.Counter("live_flushes_total", "Micro-batch flushes to lap_time")
+
+
+def _load_race(race_id: int):
+    # Единственное обращение к БД при открытии заезда: участники и уже записанные круги.
+    # С основной БД: результаты могли быть созданы только что
+    db = database.SessionLocal(info={"primary": True})
+    try:
+        result_ids = set(db.scalars(
+            select(database.RaceResult.result_id).where(database.RaceResult.race_id == race_id)
+        ).all())
+        laps = db.execute(
+            select(database.LapTime.result_id, database.LapTime.lap_number, database.LapTime.lap_time)
+            .join(database.RaceResult)
+            .where(database.RaceResult.race_id == race_id)
+            .order_by(database.LapTime.lap_number)
+        ).all()
+        return result_ids, laps
+    finally:
+        db.close()
+
+
+def _write_laps(laps: list):
+    db = database.SessionLocal(info={"primary": True})
+    try:
+        return crud.bulk_create_lap_times(db, laps)
+    finally:
+        db.close()
+
+
+class RaceFeed:
+
+    def __init__(self, race_id: int, result_ids: set):
+        self.race_id = race_id
+        self.result_ids = result_ids
+        self.standings = {}
+        self.seen = set()
+        self.buffer = []
+        self.subscribers = set()
+        self.ingesters = 0
+        self.flush_now = asyncio.Event()
+        self.flusher = None
+
+    def snapshot(self) -> list:
+        return sorted((dict(standing) for standing in self.standings.values()), key=lambda s: s["position"])
+
+    def apply(self, event: schemas.LapEvent) -> list:
+        # Возвращает изменившиеся строки таблицы лидеров
+        standing = self.standings.get(event.result_id)
+        if standing is None:
+            standing = self.standings[event.result_id] = {
+                "result_id": event.result_id, "position": None, "laps": 0,
+                "total_ms": 0, "best_ms": None, "last_ms": None,
+            }
+        standing["laps"] += 1
+        standing["total_ms"] += event.lap_time_ms
+        standing["last_ms"] = event.lap_time_ms
+        if standing["best_ms"] is None or event.lap_time_ms < standing["best_ms"]:
+            standing["best_ms"] = event.lap_time_ms
+        changed = {event.result_id: standing}
+        order = sorted(self.standings.values(), key=lambda s: (-s["laps"], s["total_ms"]))
+        for position, other in enumerate(order, start=1):
+            if other["position"] != position:
+                other["position"] = position
+                changed[other["result_id"]] = other
+        return [dict(row) for row in changed.values()]
+
+    def accept(self, event: schemas.LapEvent):
+        # Повторы от транспондера и чужие участники отбрасываются
+        if event.result_id not in self.result_ids:
+            return f"result_id {event.result_id} не участвует в заезде {self.race_id}"
+        key = (event.result_id, event.lap_number)
+        if key in self.seen:
+            return None
+        self.seen.add(key)
+        self.buffer.append(schemas.LapTimeCreate(
+            result_id=event.result_id, lap_number=event.lap_number, lap_time=timedelta(milliseconds=event.lap_time_ms)
+        ))
+        laps_received.inc()
+        if len(self.buffer) >= FLUSH_SIZE:
+            self.flush_now.set()
+        self.publish({"type": "delta", "standings": self.apply(event)})
+        return None
+
+    def publish(self, message: dict):
+        for queue in list(self.subscribers):
+            if queue.full():
+                # Медленный подписчик получает вместо пропущенных дельт полный снимок
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "snapshot", "standings": self.snapshot()})
+            else:
+                queue.put_nowait(message)
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            ids, errors = await run_in_threadpool(_write_laps, batch)
+        except Exception:
+            logger.exception("Не удалось записать круги заезда %s, повтор при следующем сбросе", self.race_id)
+            self.buffer = batch + self.buffer
+            return
+        flushes.inc()
+        laps_flushed.inc(len(ids))
+        if errors:
+            logger.warning("Заезд %s: отклонено кругов при записи: %s", self.race_id, errors)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_now.clear()
+            await self.flush()
+            if not self.ingesters and not self.subscribers and not self.buffer:
+                _feeds.pop(self.race_id, None)
+                return
+
+
+_feeds = {}
+_feeds_lock = asyncio.Lock()
+
+
+async def get_feed(race_id: int) -> RaceFeed:
+    feed = _feeds.get(race_id)
+    if feed is not None:
+        return feed
+    async with _feeds_lock:
+        if race_id not in _feeds:
+            result_ids, laps = await run_in_threadpool(_load_race, race_id)
+            feed = RaceFeed(race_id, result_ids)
+            for result_id, lap_number, lap_time in laps:
+                feed.seen.add((result_id, lap_number))
+                feed.apply(schemas.LapEvent(
+                    result_id=result_id, lap_number=lap_number, lap_time_ms=int(lap_time.total_seconds() * 1000)
+                ))
+            feed.flusher = asyncio.create_task(feed.run())
+            _feeds[race_id] = feed
+        return _feeds[race_id]
+
+
+async def _session_user(websocket: WebSocket, roles=()):
+    # Браузер передаёт cookie сессии, устройства хронометража - токен в ?token= или Authorization
+    user = websocket.session.get("user")
+    token = websocket.query_params.get("token") or auth.bearer_token(websocket)
+    if user is None and token is not None:
+        try:
+            user = await auth.user_from_token(token)
+        except HTTPException:
+            return None
+    if user is None or (roles and user.get("role") not in roles):
+        return None
+    return user
+
+
+@router.websocket("/ws/races/{race_id}/ingest")
+async def ingest_laps(websocket: WebSocket, race_id: int):
+    if await _session_user(websocket, TIMING_ROLES) is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    feed = await get_feed(race_id)
+    feed.ingesters += 1
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            # Испорченный кадр отклоняется, соединение транспондера остаётся открытым
+            try:
+                payload = json.loads(message.get("text") or message.get("bytes") or "")
+            except ValueError as exc:
+                await websocket.send_json({"type": "rejected", "errors": [{"event": None, "error": f"некорректный JSON: {exc}"}]})
+                continue
+            errors = []
+            for item in payload if isinstance(payload, list) else [payload]:
+                try:
+                    error = feed.accept(schemas.LapEvent(**item))
+                except (ValidationError, TypeError) as exc:
+                    error = str(exc)
+                if error:
+                    errors.append({"event": item, "error": error})
+            if errors:
+                await websocket.send_json({"type": "rejected", "errors": errors})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        feed.ingesters -= 1
+        feed.flush_now.set()
+
+
+@router.websocket("/ws/races/{race_id}/leaderboard")
+async def leaderboard_feed(websocket: WebSocket, race_id: int):
+    if await _session_user(websocket) is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    feed = await get_feed(race_id)
+    queue = asyncio.Queue(SUBSCRIBER_QUEUE)
+    feed.subscribers.add(queue)
+    receiver = asyncio.create_task(websocket.receive())
+    try:
+        await websocket.send_json({"type": "snapshot", "standings": feed.snapshot()})
+        while True:
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.create_task(websocket.receive())
+                continue
+            await websocket.send_json(getter.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        feed.subscribers.discard(queue)
+
+
+@router.get("/api/races/{race_id}/leaderboard")
+async def leaderboard(race_id: int, user: dict = Depends(require_role())):
+    # Во время заезда таблица отдаётся из памяти; без активного потока её нет
+    feed = _feeds.get(race_id)
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Для заезда нет живого хронометража")
+    return {"race_id": race_id, "standings": feed.snapshot()}
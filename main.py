@@ -1,132 +1,500 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Form
-from sqlalchemy.orm import Session
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import HTMLResponse, RedirectResponse
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Request, Form
+from sqlalchemy.exc import DBAPIError, OperationalError
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from passlib.context import CryptContext
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from sqlalchemy import text
 
 
-import database, schemas, crud
-from database import engine, SessionLocal
+import database, schemas, crud, crud_async, pagination, export, cache, metrics, hashing, ingest, live_timing, matviews, instrumentation, slow_queries, auth, views, analytics, details, replicas, availability, jobs, admission, archive
+from dependencies import get_crud_db, require_admin, require_auth, require_metrics_access, require_role
+
+# Импорт модуля не обращается к БД: таблицы создаёт python migrate.py, а представления
+# и материализованные копии подключаются в lifespan при старте сервера
+
+logger = logging.getLogger(__name__)
+
+# DB_MIGRATE_ON_STARTUP=1 - создавать таблицы при старте (разработка, бенчмарки)
+MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "0") == "1"
+# Пауза между попытками подключиться, если БД недоступна при старте
+WARM_UP_RETRY = float(os.getenv("DB_WARM_UP_RETRY", "5"))
+# Скомпилированные шаблоны сохраняются между перезапусками и общие для воркеров.
+# У асинхронного окружения свой код шаблона, поэтому и свои файлы кэша
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR")
+if JINJA_CACHE_DIR:
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=True,
+    bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR, "__jinja2_%s.cache"),
+))
+# Окружение Jinja для потокового рендеринга из асинхронного курсора
+async_templates = Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=True,
+    enable_async=True,
+    bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR, "__jinja2_async_%s.cache"),
+)
+
+
+class CachedStaticFiles(StaticFiles):
+    # Ссылки на статику содержат ?v=<mtime>, поэтому файл можно кэшировать надолго
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", "public, max-age=86400")
+        return response
+
+
+def static_url(name: str) -> str:
+    return f"/static/{name}?v={int(os.path.getmtime(os.path.join('templates/static', name)))}"
+
+
+templates.env.globals["static_url"] = static_url
+async_templates.globals["static_url"] = static_url
+
+
+def precompile_templates():
+    # Компиляция (или загрузка из кэша байткода) до первого запроса
+    for name in templates.env.list_templates(filter_func=lambda name: name.endswith(".html")):
+        templates.env.get_template(name)
+        async_templates.get_template(name)
 
-# Создание таблиц
-database.Base.metadata.create_all(bind=engine)
 
-# Инициализация FastAPI
-app = FastAPI()
-app.add_middleware(SessionMiddleware, secret_key="your-secret-key")
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="templates/static"), name="static")
+def warm_up():
+    # Всё, что при старте требует БД
+    if MIGRATE_ON_STARTUP:
+        database.migrate()
+    else:
+        missing = database.missing_tables()
+        if missing:
+            raise RuntimeError(f"Нет таблиц {', '.join(missing)}: выполните python migrate.py")
+    # Материализованные копии представлений и их фоновое обновление
+    matviews.start()
+    # Реестр представлений: колонки и запросы собираются один раз
+    views.load(database.engine)
+
 
-# Пароли
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+def retry_warm_up():
+    # Пока БД недоступна, сервер отвечает, а представления возвращают 503
+    while True:
+        time.sleep(WARM_UP_RETRY)
+        try:
+            warm_up()
+            logger.info("Подключение к БД восстановлено, представления загружены")
+            return
+        except OperationalError:
+            logger.warning("БД недоступна, повтор через %s с", WARM_UP_RETRY)
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(precompile_templates)
+    replica_set = database.get_replicas()
+    if replica_set is not None:
+        await run_in_threadpool(replica_set.check)
+        replica_set.start()
     try:
-        yield db
-    finally:
-        db.close()
+        await run_in_threadpool(warm_up)
+    except OperationalError as exc:
+        logger.warning("БД недоступна при старте: %s", exc.orig)
+        threading.Thread(target=retry_warm_up, name="warm-up", daemon=True).start()
+    yield
+    hashing.shutdown()
+    jobs.shutdown()
+    await database.dispose()
+
+
+router = APIRouter()
 
-# Проверка авторизации
-def require_auth(request: Request) -> bool:
-    user = request.session.get("user")
-    if user is None:
-        return False
-    return True
 
 # --- Пользовательские маршруты ---
-@app.get("/register", response_class=HTMLResponse)
+@router.get("/register", response_class=HTMLResponse)
 def register_form(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+    return templates.TemplateResponse(request, "register.html")
 
-@app.post("/register")
-def register_user(username: str = Form(...), password: str = Form(...), role: str = Form(...), db: Session = Depends(get_db)):
-    hashed_password = pwd_context.hash(password)
-    user = schemas.UserCreate(username=username, hashed_password=hashed_password, role=role)
-    if crud.get_user_by_username(db, username):
+@router.post("/register")
+async def register_user(username: str = Form(...), password: str = Form(...), role: str = Form(...), db=Depends(get_crud_db)):
+    # bcrypt считается в отдельном пуле, запросы к БД - в threadpool или на AsyncSession, event loop не блокируется
+    if await crud_async.call(db, crud.get_user_by_username, username):
         raise HTTPException(status_code=400, detail="Username already registered")
-    crud.create_user(db, user)
+    hashed_password = await hashing.hash_password(password)
+    user = schemas.UserCreate(username=username, hashed_password=hashed_password, role=role)
+    await crud_async.call(db, crud.create_user, user)
     return RedirectResponse(url="/login", status_code=303)
 
-@app.post("/login")
-def login_user(
-        request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
-):
-    user = crud.get_user_by_username(db, form_data.username)
-    if not user or not pwd_context.verify(form_data.password, user.hashed_password):
+async def authenticate(db, form_data: OAuth2PasswordRequestForm):
+    # Общая проверка логина и пароля для входа в сессию и выдачи токена
+    user = await crud_async.call(db, crud.get_user_by_username, form_data.username)
+    if not user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    verified, new_hash = await hashing.verify_password(form_data.password, user.hashed_password)
+    if not verified:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    # Хэш со старыми параметрами bcrypt пересчитывается при входе
+    if new_hash is not None:
+        await crud_async.call(db, crud.update_user_password, user.id, new_hash)
+    return user
+
+@router.post("/login")
+async def login_user(
+        request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_crud_db)
+):
+    user = await authenticate(db, form_data)
     # Сохраняем пользователя в сессии
     request.session["user"] = {"id": user.id, "username": user.username, "role": user.role}
     return RedirectResponse(url="/", status_code=303)
 
-@app.get("/login", response_class=HTMLResponse)
+# --- Токены для API ---
+@router.post("/token")
+async def issue_token(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_crud_db)):
+    user = await authenticate(db, form_data)
+    return {
+        "access_token": auth.create_access_token(user),
+        "token_type": "bearer",
+        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+@router.post("/token/revoke")
+def revoke_token(request: Request):
+    token = auth.bearer_token(request)
+    if token is None:
+        raise auth.credentials_exception
+    claims = auth.decode_token(token)
+    auth.denylist.revoke(claims["jti"], claims["exp"])
+    return {"revoked": True}
+
+@router.post("/admin/users/{user_id}/revoke_tokens")
+def revoke_user_tokens(user_id: int, user: dict = Depends(require_admin)):
+    auth.denylist.revoke_user(user_id)
+    return {"revoked": True}
+
+@router.get("/api/me")
+def current_user_info(user: dict = Depends(require_role())):
+    return user
+
+@router.get("/login", response_class=HTMLResponse)
 def login_form(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return templates.TemplateResponse(request, "login.html")
 
 
-@app.get("/", response_class=HTMLResponse)
+@router.get("/", response_class=HTMLResponse)
 def home(request: Request, is_auth: bool = Depends(require_auth)):
     if is_auth:
         user = request.session.get("user")
-        if user.get("role") == "Клиент":
-            views = ["Client_Race_Info", "Client_Booking_History"]
-        elif user.get("role") == "Организатор":
-            views = ["Organizer_Race_Schedule_Results", "Organizer_Race_Booking_Overview"]
-        elif user.get("role") == "Технический персонал":
-            views = ["Technical_Kart_Status_Maintenance", "Technical_Kart_Last_Race"]
-        return templates.TemplateResponse("index.html", {"request": request, "user": user, "views": views})
+        return templates.TemplateResponse(
+            request, "index.html", {"user": user, "views": views.for_role(user.get("role"))}
+        )
     else:
         return RedirectResponse(url="/login", status_code=303)
 
-@app.get("/logout")
+@router.get("/logout")
 def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/login", status_code=303)
 
 
-@app.get("/view/{view}")
-def print_data(
+# Полных потоковых выгрузок одновременно меньше, чем соединений в пуле: поток,
+# держащий серверный курсор, не должен ждать соединение вместе с остальными
+stream_slots = asyncio.Semaphore(
+    max(1, min(pagination.STREAM_SLOTS, database.POOL_SIZE + database.MAX_OVERFLOW - 1))
+)
+
+
+async def started(body):
+    # Первый фрагмент готовится до ответа: запрос к БД уже выполнен, и его ошибка
+    # становится ответом с кодом ошибки, а не обрезанным 200
+    try:
+        first = await anext(body)
+    except StopAsyncIteration:
+        return body
+
+    async def chained():
+        yield first
+        async for chunk in body:
+            yield chunk
+
+    return chained()
+
+
+async def guarded_stream(body):
+    # Слот занимается без потока из threadpool, а курсор закрывается сразу по окончании ответа
+    async with stream_slots:
+        if hasattr(body, "__aiter__"):
+            async for chunk in body:
+                yield chunk
+            return
+        try:
+            async for chunk in iterate_in_threadpool(body):
+                yield chunk
+        finally:
+            await run_in_threadpool(body.close)
+
+
+# Последний фрагмент страницы, чтение которой прервал statement_timeout
+VIEW_TRUNCATED = '<p class="error">Ответ прерван: превышено время выполнения запроса</p>'
+
+
+def render_view(request: Request, user: dict, view: views.View, rows, limit: int):
+    page = pagination.KeysetPage(rows, view.keys, limit)
+    template = templates.get_template("data.html")
+    yield from pagination.chunked(instrumentation.timed_iter(template.generate(
+        request=request, user=user, view=view.name, columns=view.columns, data=page, limit=limit,
+        freshness=matviews.freshness(view.name),
+    ), "render", exclude=("fetch", "db")))
+
+
+def stream_view(request: Request, user: dict, view: views.View, limit: int, after: list = None):
+    yield from admission.guard_stream(_stream_view(request, user, view, limit, after), view.name, VIEW_TRUNCATED)
+
+
+def _stream_view(request: Request, user: dict, view: views.View, limit: int, after: list = None):
+    # Генератор открывает собственную сессию: она живёт, пока отдаётся тело ответа
+    query, params = view.query(limit, after, matviews.source_for(view.name))
+    db = database.SessionLocal(info=admission.view_session_info(view.name))
+    try:
+        result = db.execute(
+            query,
+            params,
+            execution_options={"stream_results": True, "yield_per": pagination.STREAM_BATCH},
+        )
+        rows = instrumentation.timed_iter(result.mappings(), "fetch", rows=True)
+        yield from render_view(request, user, view, pagination.prefetched(rows), limit)
+    finally:
+        db.close()
+
+
+def fetch_page(view: views.View, limit: int, after: list = None):
+    # Строки и признак чтения с реплики
+    query, params = view.query(limit, after, matviews.source_for(view.name))
+    db = database.SessionLocal(info=admission.view_session_info(view.name))
+    try:
+        result = db.execute(query, params)
+        started = time.perf_counter()
+        rows = result.mappings().all()
+        instrumentation.add("fetch", time.perf_counter() - started)
+        instrumentation.add_rows(len(rows))
+        return rows, "replica" in db.info
+    except DBAPIError as exc:
+        if admission.timed_out(exc):
+            raise admission.timeout_error(view.name)
+        raise
+    finally:
+        db.close()
+
+
+async def stream_view_async(request: Request, user: dict, view: views.View, limit: int, after: list = None):
+    chunks = _stream_view_async(request, user, view, limit, after)
+    async for chunk in admission.aguard_stream(chunks, view.name, VIEW_TRUNCATED):
+        yield chunk
+
+
+async def _stream_view_async(request: Request, user: dict, view: views.View, limit: int, after: list = None):
+    query, params = view.query(limit, after, matviews.source_for(view.name))
+    async with database.AsyncSessionLocal(info=admission.view_session_info(view.name)) as db:
+        result = await db.stream(
+            query, params, execution_options={"yield_per": pagination.STREAM_BATCH}
+        )
+        rows = await pagination.aprefetched(instrumentation.atimed_iter(result.mappings(), "fetch", rows=True))
+        page = pagination.AsyncKeysetPage(rows, view.keys, limit)
+        template = async_templates.get_template("data.html")
+        async for chunk in pagination.achunked(instrumentation.atimed_iter(template.generate_async(
+            request=request, user=user, view=view.name, columns=view.columns, data=page, limit=limit,
+            freshness=matviews.freshness(view.name),
+        ), "render", exclude=("fetch", "db"))):
+            yield chunk
+
+
+async def fetch_page_async(view: views.View, limit: int, after: list = None):
+    query, params = view.query(limit, after, matviews.source_for(view.name))
+    async with database.AsyncSessionLocal(info=admission.view_session_info(view.name)) as db:
+        try:
+            result = await db.execute(query, params)
+        except DBAPIError as exc:
+            if admission.timed_out(exc):
+                raise admission.timeout_error(view.name)
+            raise
+        started = time.perf_counter()
+        rows = result.mappings().all()
+        instrumentation.add("fetch", time.perf_counter() - started)
+        instrumentation.add_rows(len(rows))
+        return rows, "replica" in db.sync_session.info
+
+
+not_modified = metrics.Counter("view_not_modified_total", "View pages answered with 304 Not Modified")
+
+
+@router.get("/view/{view}")
+async def print_data(
         request: Request,
         view: str,
-        db: Session = Depends(get_db),
+        after: str = None,
+        limit: int = pagination.PAGE_SIZE,
         is_auth: bool = Depends(require_auth),
 ):
     if is_auth:
-        # Проверяем доступность представления
-        client_views = ["Client_Race_Info", "Client_Booking_History"]
-        organizer_views = ["Organizer_Race_Schedule_Results", "Organizer_Race_Booking_Overview"]
-        tech_views = ["Technical_Kart_Status_Maintenance", "Technical_Kart_Last_Race"]
-
         # Получаем текущего пользователя из сессии
         user = request.session.get("user")
 
-        if (view not in client_views) and (user.get("role") == "Клиент"):
-            raise HTTPException(status_code=404, detail="Представление не найдено или вы не имеете право")
-        elif (view not in organizer_views) and (user.get("role") == "Организатор"):
-            raise HTTPException(status_code=404, detail="Представление не найдено или вы не имеете право")
-        elif (view not in tech_views) and (user.get("role") == "Технический персонал"):
-            raise HTTPException(status_code=404, detail="Представление не найдено или вы не имеете право")
+        # Проверяем доступность представления
+        view = views.get_for_role(user.get("role"), view)
 
-        # Выполняем запрос к представлению
-        query = text(f"""SELECT * FROM {view}""")
+        # limit=0 отдаёт представление целиком, без разбиения на страницы
+        if limit < 0:
+            raise HTTPException(status_code=400, detail="limit не может быть отрицательным")
+        limit = min(limit, pagination.MAX_PAGE_SIZE)
+        after_values = pagination.decode_cursor(after, view.key_columns) if after else None
+        user_id = user.get("id") if view.per_user else None
 
-        result = db.execute(query)
+        # Неизменившееся представление отдаётся как 304 без запроса к представлению и рендеринга
+        etag = await run_in_threadpool(
+            cache.view_etag, view, user.get("role"), user_id, after, limit, matviews.freshness(view.name)
+        )
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if cache.etag_matches(request.headers.get("if-none-match"), etag):
+            not_modified.inc()
+            return Response(status_code=304, headers=headers)
 
-        # Динамически извлекаем названия колонок
-        columns = result.keys()
+        if limit:
+            # Страница ограничена по размеру, поэтому её можно держать в кэше
+            key = cache.page_key(view.name, user_id, after, limit)
+            page = cache.view_cache.get(key)
+            if page is None:
+                seen_generation = cache.generation(view.name)
+                if database.USE_ASYNC:
+                    page, from_replica = await fetch_page_async(view, limit, after_values)
+                else:
+                    page, from_replica = await run_in_threadpool(fetch_page, view, limit, after_values)
+                cache.store_page(key, page, seen_generation, from_replica)
+            body = render_view(request, user, view, page, limit)
+        else:
+            # Строки читаются серверным курсором и рендерятся в шаблон по мере поступления
+            if database.USE_ASYNC:
+                body = await started(guarded_stream(stream_view_async(request, user, view, limit, after_values)))
+            else:
+                body = await started(guarded_stream(stream_view(request, user, view, limit, after_values)))
+        return StreamingResponse(body, media_type="text/html", headers=headers)
+    else:
+        return RedirectResponse(url="/login", status_code=303)
 
-        # Преобразуем результат в список словарей
-        data = [dict(zip(columns, row)) for row in result.fetchall()]
 
-        # Возвращаем данные в шаблон
-        return templates.TemplateResponse(
-            "data.html", {"request": request, "user": user, "data": data, "view": view, "columns": columns}
+def stream_export(view: views.View, fmt: str, compress: bool):
+    chunks = admission.guard_stream(_export_chunks(view, fmt), view.name, export.TRUNCATED[fmt])
+    yield from export.gzipped(chunks) if compress else chunks
+
+
+def _export_chunks(view: views.View, fmt: str):
+    db = database.SessionLocal(info=admission.view_session_info(view.name))
+    try:
+        result = db.execute(
+            view.export_query(matviews.source_for(view.name)),
+            execution_options={"stream_results": True, "yield_per": export.EXPORT_BATCH},
+        )
+        yield from export.export_result(result, fmt)
+    finally:
+        db.close()
+
+
+@router.get("/view/{view}/export")
+async def export_data(
+        request: Request,
+        view: str,
+        format: str = "csv",
+        gzip: bool = False,
+        is_auth: bool = Depends(require_auth),
+):
+    if is_auth:
+        user = request.session.get("user")
+        view = views.get_for_role(user.get("role"), view)
+        if format not in export.FORMATS:
+            raise HTTPException(status_code=400, detail="Неизвестный формат выгрузки")
+
+        filename = f"{view.name}.{'csv' if format == 'csv' else 'ndjson'}"
+        media_type = export.FORMATS[format]
+        if gzip:
+            filename += ".gz"
+            media_type = "application/gzip"
+        # Строки идут из серверного курсора прямо в кодировщик пачками фиксированного размера
+        return StreamingResponse(
+            await started(guarded_stream(stream_export(view, format, gzip))),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
         )
     else:
         return RedirectResponse(url="/login", status_code=303)
+
+
+@router.get("/admin/slow_queries")
+def slow_query_log(limit: int = 50, sort: str = "total_ms", user: dict = Depends(require_admin)):
+    if sort not in slow_queries.SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort: одно из {', '.join(slow_queries.SORT_KEYS)}")
+    return {"threshold_ms": slow_queries.SLOW_QUERY_THRESHOLD * 1000, "queries": slow_queries.top(limit, sort)}
+
+
+@router.get("/cache/stats")
+def cache_stats(user: dict = Depends(require_admin)):
+    return cache.stats()
+
+
+# Метрики кэша пользователей для токенов
+for _name in ("hits", "misses", "evictions", "expirations", "size"):
+    metrics.Gauge(f"auth_user_cache_{_name}", f"Token auth user cache {_name}").set_function(
+        lambda _name=_name: auth.user_cache.stats()[_name]
+    )
+metrics.Gauge("auth_revoked_tokens", "Revoked token ids kept in the denylist").set_function(lambda: len(auth.denylist))
+metrics.Gauge("analytics_laps_loaded", "Laps held in the analytics columns").set_function(lambda: analytics.store.length)
+metrics.Gauge("availability_intervals", "Bookings and races held in the availability index").set_function(lambda: len(availability.store))
+metrics.Gauge("jobs_active", "Report jobs queued or running").set_function(jobs.active)
+metrics.Gauge("archive_segments", "Monthly lap history segments in the cold archive").set_function(
+    lambda: len(archive.store.segments())
+)
+metrics.Gauge("archive_laps", "Laps held in cold archive segments").set_function(archive.store.laps)
+
+# Метрики кэша представлений
+for _name in ("hits", "misses", "evictions", "expirations", "invalidations", "size"):
+    metrics.Gauge(f"view_cache_{_name}", f"View cache {_name}").set_function(
+        lambda _name=_name: cache.stats()[_name]
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint(user: dict = Depends(require_metrics_access)):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    # Порядок важен: последний добавленный слой - внешний
+    if database.REPLICA_URLS:
+        app.add_middleware(replicas.ReadYourWritesMiddleware)
+    app.add_middleware(admission.AdmissionMiddleware)
+    app.add_middleware(instrumentation.SessionTimingMiddleware)
+    app.add_middleware(SessionMiddleware, secret_key="your-secret-key")
+    app.add_middleware(instrumentation.TimingMiddleware)
+    # Сжатие снаружи замеров: в Server-Timing остаётся время приложения. Уровень 6 вместо
+    # 9 по умолчанию: на HTML-таблицах почти тот же размер при заметно меньшем CPU
+    app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+    app.mount("/static", CachedStaticFiles(directory="templates/static"), name="static")
+    app.include_router(ingest.router)
+    app.include_router(live_timing.router)
+    app.include_router(analytics.router)
+    app.include_router(details.router)
+    app.include_router(availability.router)
+    app.include_router(jobs.router)
+    app.include_router(admission.router)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
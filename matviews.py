@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+
+import cache, changes, database, metrics, views
+
+# Материализованные копии ролевых представлений. Каждое объявленное представление
+# копируется в таблицу mv_<view>, которая обновляется фоновым потоком: целиком по
+# расписанию и частично (по race_id / kart_id / booking_id) после commit в исходные таблицы.
+# При переносе строки в другую часть обновляются обе: changes передаёт старые значения
+# колонок разбиения. До первого обновления в процессе запросы читают само представление.
+
+logger = logging.getLogger(__name__)
+
+# Колонка частичного обновления и правила её получения из исходных таблиц задаются в views.VIEWS
+ENABLED = {name for name in os.getenv("MATERIALIZED_VIEWS", "").split(",") if name in views.REGISTRY}
+REFRESH_INTERVAL = float(os.getenv("MATVIEW_REFRESH_INTERVAL", "300"))
+# Больше стольких затронутых значений за раз выгоднее обновить копию целиком
+MAX_PARTITIONS = 500
+
+FULL = None
+
+refreshes = metrics.Counter("matview_refreshes_total", "Materialized view refreshes")
+refresh_seconds = metrics.Histogram("matview_refresh_seconds", "Materialized view refresh duration")
+
+
+def table_for(view: str) -> str:
+    return f"mv_{view.lower()}"
+
+
+def source_for(view: str) -> str:
+    state = _states.get(view)
+    return table_for(view) if state is not None and state.refreshed_at is not None else view
+
+
+class _State:
+
+    def __init__(self):
+        self.refreshed_at = None
+        self.pending = set()
+        self.full = True
+
+
+_states = {view: _State() for view in ENABLED}
+for _view in ENABLED:
+    for _table, _column in views.REGISTRY[_view].partition_sources.items():
+        changes.track_previous(_table, [_column])
+_condition = threading.Condition()
+_thread = None
+
+
+def freshness(view: str):
+    state = _states.get(view)
+    if state is None or state.refreshed_at is None:
+        return None
+    return {
+        "refreshed_at": datetime.fromtimestamp(state.refreshed_at),
+        "stale": state.full or bool(state.pending),
+    }
+
+
+def _lock(conn, view: str):
+    # На Postgres обновления одной копии из разных воркеров выполняются по очереди
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": zlib.crc32(view.encode())})
+
+
+def create(view: str):
+    table = table_for(view)
+    with database.engine.begin() as conn:
+        exists = conn.dialect.has_table(conn, table)
+        if not exists:
+            conn.execute(text(f"CREATE TABLE {table} AS SELECT * FROM {view} WHERE 1 = 0"))
+        index_columns = [*views.REGISTRY[view].keys]
+        partition = views.REGISTRY[view].partition
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_keys ON {table} ({', '.join(index_columns)})"
+        ))
+        if partition and partition not in index_columns:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{partition} ON {table} ({partition})"))
+
+
+def refresh(view: str, partitions=FULL):
+    table = table_for(view)
+    partition = views.REGISTRY[view].partition
+    started = time.perf_counter()
+    with database.engine.begin() as conn:
+        _lock(conn, view)
+        if partitions is FULL:
+            conn.execute(text(f"DELETE FROM {table}"))
+            conn.execute(text(f"INSERT INTO {table} SELECT * FROM {view}"))
+        else:
+            values = {"values": list(partitions)}
+            conn.execute(text(f"DELETE FROM {table} WHERE {partition} IN :values")
+                         .bindparams(bindparam("values", expanding=True)), values)
+            conn.execute(text(f"INSERT INTO {table} SELECT * FROM {view} WHERE {partition} IN :values")
+                         .bindparams(bindparam("values", expanding=True)), values)
+    refresh_seconds.observe(time.perf_counter() - started, view=view)
+    refreshes.inc(view=view, kind="full" if partitions is FULL else "partial")
+
+
+def _affected(view: str, changed: dict):
+    # Множество значений колонки разбиения или FULL, если частичное обновление невозможно
+    spec = views.REGISTRY[view]
+    sources = spec.tables & set(changed)
+    if not sources:
+        return set()
+    values = set()
+    for table in sources:
+        column = spec.partition_sources.get(table)
+        rows = changed[table]
+        if column is None or rows is None:
+            return FULL
+        for row in rows:
+            if row.get(column) is None:
+                return FULL
+            values.add(row[column])
+    return values if len(values) <= MAX_PARTITIONS else FULL
+
+
+@changes.subscribe
+def _on_commit(changed: dict):
+    if not ENABLED:
+        return
+    with _condition:
+        for view, state in _states.items():
+            affected = _affected(view, changed)
+            if affected is FULL:
+                state.full = True
+            elif affected:
+                state.pending |= affected
+        _condition.notify()
+
+
+def _run():
+    while True:
+        with _condition:
+            now = time.time()
+            due = [
+                view for view, state in _states.items()
+                if state.full or state.pending or (state.refreshed_at or 0) + REFRESH_INTERVAL <= now
+            ]
+            if not due:
+                next_due = min((state.refreshed_at or 0) + REFRESH_INTERVAL for state in _states.values())
+                _condition.wait(max(next_due - now, 0.1))
+                continue
+            work = []
+            for view in due:
+                state = _states[view]
+                full = state.full or not state.pending
+                work.append((view, FULL if full else set(state.pending)))
+                state.full = False
+                state.pending = set()
+        for view, partitions in work:
+            try:
+                refresh(view, partitions)
+            except Exception:
+                logger.exception("Не удалось обновить материализованную копию %s", view)
+                with _condition:
+                    _states[view].full = True
+                time.sleep(1)
+                continue
+            with _condition:
+                _states[view].refreshed_at = time.time()
+            # Страницы в кэше собраны из копии до обновления
+            cache.invalidate_views({view})
+
+
+def start():
+    # Создание таблиц-копий и запуск фонового обновления
+    global _thread
+    if not ENABLED or _thread is not None:
+        return
+    for view in ENABLED:
+        create(view)
+    _thread = threading.Thread(target=_run, name="matview-refresh", daemon=True)
+    _thread.start()
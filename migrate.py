@@ -0,0 +1,12 @@
+import database
+
+# Создание таблиц и индексов: запускается один раз при развёртывании, до старта воркеров
+#
+#     python migrate.py
+
+if __name__ == "__main__":
+    database.migrate()
+    missing = database.missing_tables()
+    if missing:
+        raise SystemExit(f"Не созданы таблицы: {', '.join(missing)}")
+    print(f"Схема готова: {len(database.Base.metadata.tables)} таблиц")
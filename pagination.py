@@ -0,0 +1,144 @@
+import base64
+import itertools
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import HTTPException
+
+# Размер страницы по умолчанию и верхняя граница для ?limit=
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# Сколько строк серверный курсор забирает из БД за один раз
+STREAM_BATCH = 1000
+# Сколько полных потоковых выгрузок может одновременно держать соединение
+STREAM_SLOTS = 8
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(list(values), default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, keys) -> list:
+    # keys - ключевые колонки представления: значения курсора приводятся к их типам
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        return [_coerce(value, key) for value, key in zip(values, keys)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
+def _coerce(value, key):
+    # Курсор приходит от клиента: допускаются только скаляры, совместимые с типом ключа
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError
+    try:
+        python_type = key.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is int:
+        if isinstance(value, float):
+            raise ValueError
+        return int(value)
+    if python_type in (float, Decimal):
+        return python_type(value)
+    if python_type is str:
+        if not isinstance(value, str):
+            raise ValueError
+        return value
+    if python_type in (datetime, date):
+        if not isinstance(value, str):
+            raise ValueError
+        return python_type.fromisoformat(value)
+    return value
+
+
+class KeysetPage:
+    # Итерируется по строкам страницы, запоминая ключ последней отданной строки.
+    # Шаблон читает next_after после цикла, поэтому курсор известен к концу рендеринга.
+
+    def __init__(self, rows, keys, limit: int = 0):
+        self.rows = rows
+        self.keys = keys
+        self.limit = limit
+        self.next_after = None
+
+    def __iter__(self):
+        last = None
+        for count, row in enumerate(self.rows, start=1):
+            if self.limit and count > self.limit:
+                self.next_after = encode_cursor(last[key] for key in self.keys)
+                return
+            last = row
+            yield row
+
+
+def prefetched(rows):
+    # Первая строка читается сразу: ошибка запроса (например, statement_timeout)
+    # возникает до отправки заголовков ответа
+    rows = iter(rows)
+    return itertools.chain(list(itertools.islice(rows, 1)), rows)
+
+
+async def aprefetched(rows):
+    rows = aiter(rows)
+    try:
+        first = [await anext(rows)]
+    except StopAsyncIteration:
+        first = []
+
+    async def chained():
+        for row in first:
+            yield row
+        async for row in rows:
+            yield row
+
+    return chained()
+
+
+def chunked(parts, size: int = 16384):
+    # Склеиваем мелкие фрагменты шаблона, чтобы не гонять каждый через threadpool
+    buffer = []
+    length = 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield "".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class AsyncKeysetPage(KeysetPage):
+    # То же для асинхронного результата: Jinja в async-режиме обходит его через __aiter__
+
+    async def __aiter__(self):
+        last = None
+        count = 0
+        async for row in self.rows:
+            count += 1
+            if self.limit and count > self.limit:
+                self.next_after = encode_cursor(last[key] for key in self.keys)
+                return
+            last = row
+            yield row
+
+
+async def achunked(parts, size: int = 16384):
+    buffer = []
+    length = 0
+    async for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield "".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield "".join(buffer)
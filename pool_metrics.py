@@ -0,0 +1,67 @@
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+import metrics
+
+pool_checked_out = metrics.Gauge("db_pool_checked_out", "Connections currently checked out of the pool")
+pool_idle = metrics.Gauge("db_pool_idle", "Idle connections kept in the pool")
+pool_overflow = metrics.Gauge("db_pool_overflow", "Connections opened above pool_size")
+pool_size = metrics.Gauge("db_pool_size", "Configured pool_size")
+checkout_wait = metrics.Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection"
+)
+checkout_timeouts = metrics.Counter("db_pool_checkout_timeouts_total", "Checkouts that hit pool_timeout")
+connection_lifetime = metrics.Histogram(
+    "db_connection_lifetime_seconds",
+    "Lifetime of DBAPI connections from connect to close",
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 21600),
+)
+connections_opened = metrics.Counter("db_connections_opened_total", "DBAPI connections opened")
+
+
+class _TimedCheckout:
+    # Замер ожидания соединения: _do_get блокируется, пока в пуле нет свободного
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            checkout_timeouts.inc(engine=self.logging_name)
+            raise
+        finally:
+            checkout_wait.observe(time.perf_counter() - started, engine=self.logging_name)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument(engine, name: str):
+    # Пул пересоздаётся при engine.dispose(), поэтому состояние читается через engine.pool
+    for gauge, method in (
+        (pool_checked_out, "checkedout"),
+        (pool_idle, "checkedin"),
+        (pool_overflow, "overflow"),
+        (pool_size, "size"),
+    ):
+        gauge.set_function(lambda method=method: max(getattr(engine.pool, method, lambda: 0)(), 0), engine=name)
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        connection_record.info["connected_at"] = time.monotonic()
+        connections_opened.inc(engine=name)
+
+    @event.listens_for(engine, "close")
+    def _close(dbapi_connection, connection_record):
+        connected_at = connection_record.info.pop("connected_at", None)
+        if connected_at is not None:
+            connection_lifetime.observe(time.monotonic() - connected_at, engine=name)
+
+    return engine
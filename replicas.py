@@ -0,0 +1,167 @@
+import contextvars
+import itertools
+import logging
+import os
+import threading
+from http.cookies import SimpleCookie
+
+from sqlalchemy import event, text
+
+import metrics
+
+# Чтение с реплик: SELECT вне пишущей транзакции уходит на одну из исправных реплик,
+# запись и всё, что после неё выполняется в той же сессии, - на основную БД. Запросы с
+# методом записи (POST, PUT, PATCH, DELETE) целиком читают с основной БД: проверки
+# существования и уникальности до первой записи не должны видеть отстающую реплику. После
+# собственного commit клиент получает cookie, и его запросы в течение окна
+# read-your-writes читают с основной БД, пока реплики догоняют.
+
+logger = logging.getLogger(__name__)
+
+# Выбор реплики: least_connections (меньше занятых соединений) или round_robin
+BALANCE = os.getenv("DB_REPLICA_BALANCE", "least_connections")
+CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# Реплика с большим отставанием считается неисправной
+MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))
+READ_YOUR_WRITES = int(os.getenv("DB_READ_YOUR_WRITES", "5"))
+PIN_COOKIE = "db_primary"
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Отставание по времени последней применённой транзакции; без входящего WAL реплика не отстаёт
+LAG_QUERIES = {
+    "postgresql": (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+}
+
+routed = metrics.Counter("db_routed_statements_total", "Statements routed to the primary or a replica")
+healthy_gauge = metrics.Gauge("db_replica_healthy", "1 if the replica takes reads")
+lag_gauge = metrics.Gauge("db_replica_lag_seconds", "Replication lag measured by the health check")
+
+_request = contextvars.ContextVar("replica_routing", default=None)
+
+
+class _Routing:
+
+    def __init__(self, pinned: bool):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def pinned() -> bool:
+    state = _request.get()
+    return state is not None and state.pinned
+
+
+def wrote():
+    # Запросы этого клиента в окне read-your-writes читают с основной БД
+    state = _request.get()
+    if state is not None:
+        state.pinned = state.wrote = True
+
+
+class Replica:
+
+    def __init__(self, name: str, engine, async_engine=None):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.healthy = True
+        self.lag = 0.0
+        healthy_gauge.set_function(lambda: int(self.healthy), replica=name)
+        lag_gauge.set_function(lambda: self.lag, replica=name)
+        for sync_engine in filter(None, (engine, async_engine and async_engine.sync_engine)):
+            event.listen(sync_engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        # Обрыв или отказ в соединении выводит реплику из ротации до следующей проверки
+        if context.is_disconnect or context.connection is None:
+            if self.healthy:
+                logger.warning("Реплика %s недоступна: %s", self.name, context.original_exception)
+            self.healthy = False
+
+    def checked_out(self, use_async: bool = False) -> int:
+        engine = self.async_engine.sync_engine if use_async else self.engine
+        return getattr(engine.pool, "checkedout", lambda: 0)()
+
+    def check(self):
+        query = LAG_QUERIES.get(self.engine.dialect.name, "SELECT 0")
+        try:
+            with self.engine.connect() as conn:
+                self.lag = float(conn.execute(text(query)).scalar() or 0)
+        except Exception as exc:
+            if self.healthy:
+                logger.warning("Реплика %s не прошла проверку: %s", self.name, exc)
+            self.healthy = False
+            return
+        healthy = self.lag <= MAX_LAG
+        if healthy != self.healthy:
+            logger.warning("Реплика %s %s, отставание %.1f с", self.name, "вернулась" if healthy else "отстаёт", self.lag)
+        self.healthy = healthy
+
+
+class ReplicaSet:
+
+    def __init__(self, replicas: list):
+        self.replicas = replicas
+        self._turn = itertools.count()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def pick(self, use_async: bool = False):
+        # None - исправных реплик нет, чтение идёт на основную БД
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        # Поворот списка по кругу: при равной загрузке реплики чередуются
+        turn = next(self._turn) % len(healthy)
+        healthy = healthy[turn:] + healthy[:turn]
+        if BALANCE == "least_connections":
+            return min(healthy, key=lambda replica: replica.checked_out(use_async))
+        return healthy[0]
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check()
+
+    def _run(self):
+        while not self._stop.wait(CHECK_INTERVAL):
+            self.check()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="replica-check", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class ReadYourWritesMiddleware:
+    # Ставит cookie после запроса с записью; запросы с cookie читают с основной БД
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cookies = SimpleCookie()
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                cookies.load(value.decode("latin-1"))
+        state = _Routing(PIN_COOKIE in cookies or scope["method"] not in READ_METHODS)
+        token = _request.set(state)
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                cookie = f"{PIN_COOKIE}=1; Max-Age={READ_YOUR_WRITES}; Path=/; HttpOnly; SameSite=Lax"
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            _request.reset(token)
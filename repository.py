@@ -0,0 +1,187 @@
+from contextlib import contextmanager
+
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session, joinedload, raiseload, selectinload
+
+import changes, database
+
+# Общий слой доступа к таблицам: чтение по id через кэш сессии (на запрос), пакетное
+# чтение одним IN, запись с RETURNING без повторного SELECT и единица работы, в
+# которой много записей фиксируются одним commit.
+
+# Сколько id уходит в один IN и строк в один многострочный INSERT ... RETURNING
+CHUNK_SIZE = 1000
+
+
+# Профили загрузки для вложенных ответов: один запрос на уровень вложенности, сколько
+# бы ни было строк. Всё, что не перечислено, при обращении падает вместо ленивого
+# SELECT на каждый объект.
+PROFILES = {
+    "race_detail": [
+        selectinload(database.Race.race_results).options(
+            joinedload(database.RaceResult.client),
+            joinedload(database.RaceResult.kart),
+            selectinload(database.RaceResult.lap_times),
+            raiseload("*", sql_only=True),
+        ),
+        raiseload("*", sql_only=True),
+    ],
+    "client_history": [
+        selectinload(database.Client.race_results).options(
+            joinedload(database.RaceResult.race),
+            joinedload(database.RaceResult.kart),
+            selectinload(database.RaceResult.lap_times),
+            raiseload("*", sql_only=True),
+        ),
+        selectinload(database.Client.bookings),
+        raiseload("*", sql_only=True),
+    ],
+}
+
+
+def _identity(db: Session) -> dict:
+    # Сильные ссылки на загруженные объекты и промахи (None) на время жизни сессии
+    return db.info.setdefault("identity_cache", {})
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("identity_cache", None)
+
+
+@contextmanager
+def unit_of_work(db: Session):
+    # Записи внутри блока не фиксируются по отдельности; commit один на выходе
+    # из внешнего блока, при исключении - rollback
+    db.info["unit_of_work"] = db.info.get("unit_of_work", 0) + 1
+    try:
+        yield db
+    except BaseException:
+        db.info["unit_of_work"] -= 1
+        db.rollback()
+        raise
+    db.info["unit_of_work"] -= 1
+    if not db.info["unit_of_work"]:
+        db.commit()
+
+
+def commit(db: Session):
+    if not db.info.get("unit_of_work"):
+        db.commit()
+
+
+class Repository:
+
+    def __init__(self, model):
+        self.model = model
+        self.pk = model.__mapper__.primary_key[0]
+
+    def _key(self, id):
+        return (self.model, id)
+
+    def get(self, db: Session, id: int, profile: str = None):
+        cache = _identity(db)
+        key = self._key(id)
+        if profile is not None:
+            # Связи из профиля догружаются и для объекта, уже лежащего в сессии
+            cache[key] = db.scalars(
+                select(self.model).where(self.pk == id).options(*PROFILES[profile])
+            ).first()
+        elif key not in cache:
+            cache[key] = db.get(self.model, id)
+        return cache[key]
+
+    def get_many(self, db: Session, ids) -> dict:
+        # {id: объект} для найденных id; недостающие в кэше читаются одним IN на пачку
+        cache = _identity(db)
+        ids = list(dict.fromkeys(ids))
+        missing = [id for id in ids if self._key(id) not in cache]
+        for start in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[start:start + CHUNK_SIZE]
+            found = {getattr(obj, self.pk.key): obj for obj in db.scalars(select(self.model).where(self.pk.in_(chunk)))}
+            for id in chunk:
+                cache[self._key(id)] = found.get(id)
+        return {id: cache[self._key(id)] for id in ids if cache[self._key(id)] is not None}
+
+    def list(self, db: Session, skip: int = 0, limit: int = 10):
+        return db.scalars(select(self.model).order_by(self.pk).offset(skip).limit(limit)).all()
+
+    def find_one(self, db: Session, **filters):
+        return db.scalars(select(self.model).filter_by(**filters).limit(1)).first()
+
+    def _remember(self, db: Session, objects: list, previous: dict = None):
+        # Изменения из RETURNING сообщаются подписчикам целыми строками, с первичным ключом
+        cache = _identity(db)
+        for obj in objects:
+            changes.record(db, obj, previous)
+            cache[self._key(getattr(obj, self.pk.key))] = obj
+
+    def create(self, db: Session, data: dict):
+        return self.create_many(db, [data])[0]
+
+    def create_many(self, db: Session, rows: list) -> list:
+        database.use_primary(db)
+        objects = []
+        for start in range(0, len(rows), CHUNK_SIZE):
+            objects.extend(db.scalars(
+                insert(self.model).returning(self.model, sort_by_parameter_order=True),
+                rows[start:start + CHUNK_SIZE],
+                execution_options={changes.RECORDED_OPTION: True},
+            ).all())
+        self._remember(db, objects)
+        commit(db)
+        return objects
+
+    def update(self, db: Session, id: int, data: dict):
+        database.use_primary(db)
+        previous = None
+        tracked = sorted(changes.tracked(self.model.__table__.name) & set(data))
+        if tracked:
+            # RETURNING отдаёт только новые значения; старые нужны подписчикам (строка
+            # переходит в другую часть материализованной копии)
+            previous = db.execute(
+                select(*(getattr(self.model, key) for key in tracked)).where(self.pk == id).with_for_update()
+            ).mappings().one_or_none()
+        obj = db.scalars(
+            update(self.model).where(self.pk == id).values(**data).returning(self.model),
+            execution_options={changes.RECORDED_OPTION: True, "populate_existing": True},
+        ).one_or_none()
+        if obj is None:
+            _identity(db)[self._key(id)] = None
+            return None
+        self._remember(db, [obj], dict(previous) if previous else None)
+        commit(db)
+        return obj
+
+    def delete(self, db: Session, id: int):
+        # Через Session.delete, чтобы сработали каскады связей (круги результата и т.п.)
+        database.use_primary(db)
+        obj = self.get(db, id)
+        if obj is not None:
+            db.delete(obj)
+            _identity(db)[self._key(id)] = None
+            commit(db)
+        return obj
+
+    def delete_many(self, db: Session, ids) -> int:
+        # Без ORM-каскадов: зависимые строки удаляет ON DELETE CASCADE в БД
+        database.use_primary(db)
+        ids = list(ids)
+        deleted = 0
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            deleted += db.execute(delete(self.model).where(self.pk.in_(chunk))).rowcount
+            for id in chunk:
+                _identity(db)[self._key(id)] = None
+        commit(db)
+        return deleted
+
+
+users = Repository(database.User)
+clients = Repository(database.Client)
+bookings = Repository(database.Booking)
+races = Repository(database.Race)
+karts = Repository(database.Kart)
+race_results = Repository(database.RaceResult)
+lap_times = Repository(database.LapTime)
+maintenances = Repository(database.Maintenance)
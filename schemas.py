@@ -139,4 +139,47 @@ class MaintenanceResponse(BaseModel):
     kart_id: int
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+# Вложенные ответы API (загружаются профилями из repository.PROFILES)
+class DriverResponse(BaseModel):
+    client_id: int
+    name: str
+
+    class Config:
+        orm_mode = True
+
+
+class RaceResultDetail(RaceResultResponse):
+    client: DriverResponse
+    kart: KartResponse
+    lap_times: List[LapTimeResponse]
+
+
+class RaceDetail(RaceResponse):
+    race_results: List[RaceResultDetail]
+
+
+class ClientRaceHistory(RaceResultResponse):
+    race: RaceResponse
+    kart: KartResponse
+    lap_times: List[LapTimeResponse]
+
+
+class ClientHistory(ClientResponse):
+    race_results: List[ClientRaceHistory]
+    bookings: List[BookingResponse]
+
+
+# Live timing
+class LapEvent(BaseModel):
+    result_id: int
+    lap_number: int
+    lap_time_ms: int
+
+
+# Фоновые отчёты
+class JobCreate(BaseModel):
+    report: str
+    params: dict = {}
@@ -0,0 +1,196 @@
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from sqlalchemy import event
+
+import metrics
+
+# Журнал медленных запросов: каждый SQL приводится к отпечатку без литералов и
+# списков параметров, по отпечаткам копится статистика. Когда отпечаток впервые
+# превышает порог, фоновый поток снимает EXPLAIN и сохраняет план рядом с ним.
+
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_MS", "100")) / 1000
+MAX_FINGERPRINTS = int(os.getenv("SLOW_QUERY_FINGERPRINTS", "500"))
+# Длительности последних выполнений отпечатка для p95
+RECENT_SAMPLES = 256
+EXPLAIN_QUEUE = 100
+SKIP_OPTION = "skip_slow_query_log"
+
+slow_queries = metrics.Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS")
+explains = metrics.Counter("db_slow_query_explains_total", "EXPLAIN captures for slow statement fingerprints")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)"
+_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)")
+_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    # Строки SQLAlchemy кэширует, поэтому разбор одного текста выполняется один раз
+    normalized = _STRING.sub("?", statement)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _LIST.sub("(?)", normalized)
+    normalized = _ROWS.sub("(?)", normalized)
+    return _SPACE.sub(" ", normalized).strip()
+
+
+class _Entry:
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+        self.plan = None
+        self.explain_requested = False
+
+    def snapshot(self) -> dict:
+        recent = sorted(self.recent)
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p95_ms": recent[max(int(len(recent) * 0.95) - 1, 0)] * 1000 if recent else 0.0,
+            "max_ms": self.max * 1000,
+            "rows": self.rows,
+            "slow": self.slow,
+            "plan": self.plan,
+        }
+
+
+_entries = {}
+_lock = threading.Lock()
+_explain_queue = queue.Queue(EXPLAIN_QUEUE)
+_explain_thread = None
+
+
+def _record(sql: str, elapsed: float, rows: int):
+    # Возвращает запись отпечатка, если для него нужно снять план. Запись может быть
+    # вытеснена до того, как план снят: тогда он записывается в уже ненужный объект
+    with _lock:
+        entry = _entries.get(sql)
+        if entry is None:
+            if len(_entries) >= MAX_FINGERPRINTS:
+                # Вытесняется отпечаток с наименьшим суммарным временем
+                del _entries[min(_entries, key=lambda key: _entries[key].total)]
+            entry = _entries[sql] = _Entry(sql)
+        entry.count += 1
+        entry.total += elapsed
+        entry.max = max(entry.max, elapsed)
+        entry.rows += rows
+        entry.recent.append(elapsed)
+        if elapsed < SLOW_QUERY_THRESHOLD:
+            return None
+        entry.slow += 1
+        if entry.explain_requested:
+            return None
+        entry.explain_requested = True
+        return entry
+
+
+def _explain_prefix(dialect: str):
+    return {"postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}.get(dialect)
+
+
+def _explain_worker():
+    while True:
+        engine, entry, statement, parameters = _explain_queue.get()
+        try:
+            prefix = _explain_prefix(engine.dialect.name)
+            with engine.connect().execution_options(**{SKIP_OPTION: True}) as conn:
+                rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+            plan = "\n".join(str(row[-1]) for row in rows)
+            explains.inc()
+        except Exception as exc:
+            plan = f"EXPLAIN не выполнен: {exc}"
+        with _lock:
+            entry.plan = plan
+
+
+def _replayable(engine, statement: str, parameters, context, executemany: bool):
+    # Текст и параметры для EXPLAIN на engine. Запрос другого драйвера (async-движок:
+    # asyncpg с $1 и позиционными параметрами) перекомпилируется под диалект engine
+    if context is None or context.dialect.driver == engine.dialect.driver:
+        return statement, parameters[0] if executemany else parameters
+    if context.compiled is None or context.compiled.statement is None:
+        return None
+    compiled = context.compiled.statement.compile(dialect=engine.dialect)
+    state = compiled.construct_expanded_state(context.compiled_parameters[0])
+    return state.statement, state.positional_parameters if compiled.positional else state.parameters
+
+
+def _request_explain(engine, entry: _Entry, statement: str, parameters, context, executemany: bool):
+    global _explain_thread
+    if _explain_prefix(engine.dialect.name) is None:
+        return
+    if statement.split(None, 1)[0].upper() not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+        return
+    try:
+        replay = _replayable(engine, statement, parameters, context, executemany)
+    except Exception:
+        replay = None
+    if replay is None:
+        with _lock:
+            entry.plan = "EXPLAIN недоступен: запрос не удалось перекомпилировать"
+        return
+    with _lock:
+        if _explain_thread is None:
+            _explain_thread = threading.Thread(target=_explain_worker, name="slow-query-explain", daemon=True)
+            _explain_thread.start()
+    try:
+        _explain_queue.put_nowait((engine, entry, *replay))
+    except queue.Full:
+        with _lock:
+            entry.explain_requested = False
+
+
+def instrument(engine, explain_engine=None):
+    # explain_engine - синхронный движок для EXPLAIN (для async-движка передаётся основной).
+    # Начало запроса хранится в контексте выполнения: упавший запрос не оставляет его на соединении
+    explain_engine = explain_engine or engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None or context.execution_options.get(SKIP_OPTION):
+            return
+        elapsed = time.perf_counter() - started
+        entry = _record(fingerprint(statement), elapsed, max(cursor.rowcount, 0))
+        if entry is not None:
+            slow_queries.inc()
+            _request_explain(explain_engine, entry, statement, parameters, context, executemany)
+        elif elapsed >= SLOW_QUERY_THRESHOLD:
+            slow_queries.inc()
+
+    return engine
+
+
+SORT_KEYS = ("total_ms", "mean_ms", "p95_ms", "max_ms", "count", "rows", "slow")
+
+
+def top(limit: int = 50, sort: str = "total_ms") -> list:
+    with _lock:
+        snapshots = [entry.snapshot() for entry in _entries.values()]
+    return sorted(snapshots, key=lambda snapshot: snapshot[sort], reverse=True)[:limit]
+
+
+def reset():
+    with _lock:
+        _entries.clear()
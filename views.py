@@ -0,0 +1,176 @@
+import logging
+import re
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, MetaData, Table, bindparam, column, inspect, select, table, tuple_
+
+# Реестр ролевых представлений. Добавить представление - значит добавить запись в VIEWS:
+# роли, ключ keyset-пагинации, исходные таблицы (для инвалидации кэша) и, если нужно,
+# правило частичного обновления материализованной копии. При старте load() читает
+# колонки и типы представлений из БД и заранее собирает параметризованные select().
+
+logger = logging.getLogger(__name__)
+
+VIEWS = {
+    "Client_Race_Info": {
+        "roles": ["Клиент"],
+        "keys": ["result_id"],
+        "tables": ["race_result", "race", "kart", "client"],
+        "per_user": True,
+    },
+    "Client_Booking_History": {
+        "roles": ["Клиент"],
+        "keys": ["booking_id"],
+        "tables": ["booking", "client"],
+        "per_user": True,
+    },
+    "Organizer_Race_Schedule_Results": {
+        "roles": ["Организатор"],
+        "keys": ["result_id"],
+        "tables": ["race", "race_result", "client"],
+        "partition": "race_id",
+        "partition_sources": {"race": "race_id", "race_result": "race_id"},
+    },
+    "Organizer_Race_Booking_Overview": {
+        "roles": ["Организатор"],
+        "keys": ["booking_id"],
+        "tables": ["booking", "client"],
+        "partition": "booking_id",
+        "partition_sources": {"booking": "booking_id"},
+    },
+    "Technical_Kart_Status_Maintenance": {
+        "roles": ["Технический персонал"],
+        "keys": ["maintenance_id"],
+        "tables": ["kart", "maintenance"],
+        "partition": "kart_id",
+        "partition_sources": {"kart": "kart_id", "maintenance": "kart_id"},
+    },
+    "Technical_Kart_Last_Race": {
+        "roles": ["Технический персонал"],
+        "keys": ["kart_id"],
+        "tables": ["kart", "race_result", "race"],
+        "partition": "kart_id",
+        "partition_sources": {"kart": "kart_id", "race_result": "kart_id"},
+    },
+}
+
+# Имена представлений и колонок подставляются в SQL, поэтому допускаются только идентификаторы
+IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class View:
+
+    def __init__(self, name: str, roles, keys, tables, per_user: bool = False,
+                 partition: str = None, partition_sources: dict = None):
+        if not IDENTIFIER.match(name) or not all(IDENTIFIER.match(key) for key in keys):
+            raise ValueError(f"Недопустимое имя представления или ключа: {name}")
+        self.name = name
+        self.roles = frozenset(roles)
+        # Ключи keyset-пагинации: уникальны в пределах представления и не содержат NULL
+        self.keys = tuple(keys)
+        self.tables = frozenset(tables)
+        # Строки зависят от пользователя: в ключ кэша страниц входит его id
+        self.per_user = per_user
+        self.partition = partition
+        self.partition_sources = partition_sources or {}
+        self.db_name = None
+        self.columns = []
+        self._table = None
+        self._statements = {}
+
+    @property
+    def available(self) -> bool:
+        return self._table is not None
+
+    @property
+    def key_columns(self) -> list:
+        return [self._table.c[key] for key in self.keys]
+
+    def reflect(self, connection, db_name: str):
+        reflected = Table(db_name, MetaData(), autoload_with=connection)
+        missing = [key for key in self.keys if key not in reflected.c]
+        if missing:
+            raise ValueError(f"В представлении {self.name} нет ключевых колонок {missing}")
+        self.db_name = db_name
+        self.columns = [c.name for c in reflected.columns]
+        self._table = reflected
+        self._statements = {}
+
+    def _source(self, source: str = None):
+        # Материализованная копия имеет те же колонки, поэтому строится лёгкий table() с типами представления
+        if source is None or source == self.name:
+            return self._table
+        return table(source, *(column(c.name, c.type) for c in self._table.columns))
+
+    def query(self, limit: int = 0, after: list = None, source: str = None):
+        # Возвращает заранее собранный select() и параметры; при limit берётся на строку больше,
+        # чтобы знать, есть ли следующая страница
+        shape = (source, after is not None, bool(limit))
+        statement = self._statements.get(shape)
+        if statement is None:
+            statement = self._statements[shape] = self._build(*shape)
+        params = {}
+        if after is not None:
+            params.update({f"after_{i}": value for i, value in enumerate(after)})
+        if limit:
+            params["limit"] = limit + 1
+        return statement, params
+
+    def _build(self, source, has_after: bool, has_limit: bool):
+        selectable = self._source(source)
+        keys = [selectable.c[key] for key in self.keys]
+        statement = select(*selectable.c).order_by(*keys)
+        if has_after:
+            bounds = [bindparam(f"after_{i}", type_=key.type) for i, key in enumerate(keys)]
+            if len(keys) == 1:
+                statement = statement.where(keys[0] > bounds[0])
+            else:
+                statement = statement.where(tuple_(*keys) > tuple_(*bounds))
+        if has_limit:
+            statement = statement.limit(bindparam("limit", type_=Integer))
+        return statement
+
+    def export_query(self, source: str = None):
+        # Выгрузка целиком: явный список колонок без сортировки
+        statement = self._statements.get((source, "export"))
+        if statement is None:
+            selectable = self._source(source)
+            statement = self._statements[(source, "export")] = select(*selectable.c)
+        return statement
+
+
+REGISTRY = {name: View(name, **spec) for name, spec in VIEWS.items()}
+# Роль -> {имя представления: View}; порядок представлений - как в VIEWS
+ROLES = {}
+for _view in REGISTRY.values():
+    for _role in _view.roles:
+        ROLES.setdefault(_role, {})[_view.name] = _view
+
+
+def for_role(role: str) -> list:
+    return list(ROLES.get(role, {}))
+
+
+def get_for_role(role: str, name: str) -> View:
+    view = ROLES.get(role, {}).get(name)
+    if view is None:
+        raise HTTPException(status_code=404, detail="Представление не найдено или вы не имеете право")
+    if not view.available:
+        raise HTTPException(status_code=503, detail="Представление недоступно")
+    return view
+
+
+def load(engine):
+    # Имена в Postgres без кавычек хранятся в нижнем регистре, поэтому сопоставление без учёта регистра
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        existing = {name.lower(): name for name in inspector.get_view_names() + inspector.get_table_names()}
+        for view in REGISTRY.values():
+            db_name = existing.get(view.name.lower())
+            if db_name is None:
+                logger.warning("Представление %s не найдено в базе", view.name)
+                continue
+            try:
+                view.reflect(connection, db_name)
+            except ValueError:
+                logger.exception("Представление %s не подключено", view.name)